@@ -15,6 +15,12 @@ uint8_t CMD_PAYLOAD_SIZES[NUM_COMMANDS] = {
 	2,	// CMD_SET_ACTUATOR_INT
 	1,	// CMD_PULSE_ACTUATOR
 	0,	// CMD_PING
+	13,	// CMD_SOUNDBITE_RLE
+	2,	// CMD_SEQUENCE
+	3,	// CMD_STREAM_START
+	5,	// CMD_STREAM_SAMPLES
+	4,	// CMD_STREAM_END
+	0,	// CMD_STREAM_PLAY
 };
 
 void CommandStream::update(){
@@ -28,6 +34,9 @@ void CommandStream::update(){
 	if(flushToLatestCommand()) {
 		everReceivedCommand = true;
 
+		// acknowledged as it runs, the commands it superseded were reported as skipped
+		ackSequence();
+
 		char msg[45];
 		uint8_t cmd = nextByteFromBuffer();
 
@@ -104,17 +113,26 @@ void CommandStream::update(){
 			sendOk();
 
 		}else if(cmd == CMD_STOP){
+			streamBuffer->stop();
 			grid->disableAll();
 			doFlush = true;
 			sendOk();
 
-		}else if(cmd == CMD_SOUNDBITE){
+		}else if(cmd == CMD_SOUNDBITE || cmd == CMD_SOUNDBITE_RLE){
 			sendOk();
 			lastPing = now;
 
+		}else if(isStreamCommand(cmd)){
+			// already handed to the stream buffer as they were read
+			if(streamBuffer->isActive()){
+				strcpy(face, FACE_VIBING);
+			}
+			lastPing = now;
+
 		}else if(cmd == CMD_PLAY_BITE){
 			sendOk();
 			display->showText(FACE_VIBING);
+			streamBuffer->stop();
 			playBite(nextByteFromBuffer());
 			doFlush = true;
 			lastPing = millis();
@@ -147,6 +165,67 @@ void CommandStream::sendOk(){
 	//stream->println("ok");
 }
 
+void CommandStream::sendAck(uint16_t sequence){
+	char msg[32];
+	sprintf(msg, "ack %u %lu", sequence, millis());
+	stream->println(msg);
+}
+
+void CommandStream::sendSkip(uint16_t sequence){
+	char msg[32];
+	sprintf(msg, "skip %u", sequence);
+	stream->println(msg);
+}
+
+/*
+ * A sequenced command is answered with "ack <sequence> <millis>" once it runs, or with
+ * "skip <sequence>" if it never will: when a later command in the same batch supersedes
+ * it, or when it's dropped by flush().
+ */
+void CommandStream::ackSequence(){
+	if(hasPendingSequence){
+		sendAck(pendingSequence);
+		hasPendingSequence = false;
+	}
+}
+
+void CommandStream::skipSequence(){
+	if(hasPendingSequence){
+		sendSkip(pendingSequence);
+		hasPendingSequence = false;
+	}
+}
+
+/*
+ * Reads up to and including a packet's command byte, and the sequence number in front
+ * of it if there is one. Returns false if the stream is out of sync.
+ */
+bool CommandStream::readCommandStart(uint8_t* cmd){
+	uint8_t header = readBlocking();
+	if(header != CMD_HEADER){
+		stream->print("out of sync "); stream->println(header);
+		return false;
+	}
+
+	*cmd = readBlocking();
+
+	// a sequence number asks for the command after it to be acknowledged
+	if(*cmd == CMD_SEQUENCE){
+		pendingSequence = readBlocking();
+		pendingSequence += readBlocking() << 8;
+
+		header = readBlocking();
+		if(header != CMD_HEADER){
+			stream->print("out of sync "); stream->println(header);
+			return false;
+		}
+		*cmd = readBlocking();
+		hasPendingSequence = true;
+	}
+
+	return true;
+}
+
 bool CommandStream::flushToLatestCommand(){
 	if(stream->available() == 0){
 		return false;
@@ -156,13 +235,14 @@ bool CommandStream::flushToLatestCommand(){
 	commandBuffer[0] = 255;
 
 	while(stream->available() > 0){
-		uint8_t header = readBlocking();
-		if(header != CMD_HEADER){
-			stream->print("out of sync "); stream->println(header);
+		// only the last command of a batch runs, the one read before this is superseded
+		skipSequence();
+
+		uint8_t cmd;
+		if(!readCommandStart(&cmd)){
 			return false;
 		}
 
-		uint8_t cmd = readBlocking();
 		commandBuffer[0] = cmd;
 
 		for(int payloadIdx=0; payloadIdx<CMD_PAYLOAD_SIZES[cmd]; payloadIdx++){
@@ -171,7 +251,7 @@ bool CommandStream::flushToLatestCommand(){
 
 		if(cmd == CMD_SOUNDBITE){
 			bufferIdx = 1;
-			uint8_t id = nextByteFromBuffer(); // dump the ID
+			uint8_t id = nextByteFromBuffer();
 
 			uint32_t period = 0;
 			for(int i=0; i<4; i++){
@@ -185,9 +265,9 @@ bool CommandStream::flushToLatestCommand(){
 				sampleCount += b << (i*8);
 			}
 
-			soundBite->init(period, sampleCount);
+			SoundBite* soundBite = allocateSoundBite(id, period, sampleCount);
 			for(int i=0; i<sampleCount; i++){
-				if(i < MAX_SAMPLES){
+				if(soundBite != nullptr && i < soundBite->storedCount){
 					soundBite->samples[i].phone = readBlocking();
 					soundBite->samples[i].pitch = readBlocking();
 					soundBite->samples[i].intensity = readBlocking();
@@ -197,21 +277,180 @@ bool CommandStream::flushToLatestCommand(){
 					readBlocking();
 				}
 			}
+		}else if(cmd == CMD_SOUNDBITE_RLE){
+			readSoundBiteRuns();
+		}else if(isStreamCommand(cmd)){
+			readStreamCommand(cmd);
+		}
+
+		// these have already done their work
+		if(cmd == CMD_SOUNDBITE || cmd == CMD_SOUNDBITE_RLE || isStreamCommand(cmd)){
+			ackSequence();
 		}
 	}
 
+	// reading payloads moves it, update() reads the last command from the start
+	bufferIdx = 0;
+
 	return true;
 }
 
+/*
+ * Each run of identical samples arrives as a control byte followed by the fields that
+ * changed since the previous run (phone, pitch, intensity, in that order).
+ *   bits 7:5  changed-field mask (phone = 0b100, pitch = 0b010, intensity = 0b001)
+ *   bits 4:0  run length - 1
+ */
+void CommandStream::readSoundBiteRuns(){
+	bufferIdx = 1;
+	uint8_t id = nextByteFromBuffer();
+
+	uint32_t period = readUInt32FromBuffer();
+	uint32_t sampleCount = readUInt32FromBuffer();
+	uint32_t encodedSize = readUInt32FromBuffer();
+
+	SoundBite* soundBite = allocateSoundBite(id, period, sampleCount);
+
+	Sample sample;
+	sample.phone = 255;
+	sample.pitch = 0;
+	sample.intensity = 0;
+
+	uint32_t sampleIdx = 0;
+	uint32_t readCount = 0;
+	while(readCount < encodedSize){
+		uint8_t control = readBlocking();
+		readCount++;
+
+		if(control & 0x80){
+			sample.phone = readBlocking();
+			readCount++;
+		}
+		if(control & 0x40){
+			sample.pitch = readBlocking();
+			readCount++;
+		}
+		if(control & 0x20){
+			sample.intensity = readBlocking();
+			readCount++;
+		}
+
+		uint8_t runLength = (control & 0x1F) + 1;
+		for(int i=0; i<runLength; i++){
+			if(soundBite != nullptr && sampleIdx < soundBite->storedCount){
+				soundBite->samples[sampleIdx] = sample;
+			}
+			sampleIdx++;
+		}
+	}
+}
+
+/*
+ * Streamed samples are buffered as soon as they're read, so a later command in the same
+ * batch doesn't drop them (see StreamBuffer). The buffer keeps playing while they're read,
+ * or a refill of a long file would hold up its playout for as long as it takes to arrive.
+ *   CMD_STREAM_START    period (ms), lead time (ms, 2 bytes)
+ *   CMD_STREAM_SAMPLES  index of the first sample (4 bytes), sample count, then the samples
+ *   CMD_STREAM_END      total sample count (4 bytes)
+ *   CMD_STREAM_PLAY     starts a stream that was started with a lead time of STREAM_HOLD
+ */
+void CommandStream::readStreamCommand(uint8_t cmd){
+	bufferIdx = 1;
+
+	if(cmd == CMD_STREAM_START){
+		uint8_t period = nextByteFromBuffer();
+		uint16_t leadTime = nextByteFromBuffer();
+		leadTime += nextByteFromBuffer() << 8;
+
+		streamBuffer->start(stream, grid, period, leadTime);
+
+	}else if(cmd == CMD_STREAM_SAMPLES){
+		uint32_t firstIdx = readUInt32FromBuffer();
+		uint8_t count = nextByteFromBuffer();
+
+		Sample sample;
+		for(int i=0; i<count; i++){
+			sample.phone = readBlocking();
+			sample.pitch = readBlocking();
+			sample.intensity = readBlocking();
+
+			streamBuffer->addSample(firstIdx + i, sample);
+			streamBuffer->update(millis());
+		}
+
+	}else if(cmd == CMD_STREAM_END){
+		streamBuffer->end(readUInt32FromBuffer());
+
+	}else if(cmd == CMD_STREAM_PLAY){
+		streamBuffer->play();
+	}
+}
+
+bool CommandStream::isStreamCommand(uint8_t cmd){
+	return cmd >= CMD_STREAM_START && cmd <= CMD_STREAM_PLAY;
+}
+
+SoundBite* CommandStream::allocateSoundBite(uint8_t id, uint32_t period, uint32_t sampleCount){
+	SoundBite* soundBite = soundBites->allocate(id, period, sampleCount);
+	if(soundBite == nullptr){
+		char msg[45];
+		sprintf(msg, "Bad sound bite ID: %d", id);
+		Logger::getGlobal()->error(msg);
+	}
+
+	return soundBite;
+}
+
 uint8_t CommandStream::readBlocking(){
-	while(stream->available() == 0){}
+	while(stream->available() == 0){
+		// a batch of stream packets takes a while to arrive, keep playing the buffer meanwhile
+		streamBuffer->update(millis());
+	}
 
 	return stream->read();
 }
 
+/*
+ * Drops whatever arrived while a command ran. It's still read packet by packet, so the
+ * sequenced ones can be reported as skipped rather than look lost.
+ */
 void CommandStream::flush(){
 	while(stream->available() > 0){
-		stream->read();
+		uint8_t cmd;
+		if(!readCommandStart(&cmd) || cmd >= NUM_COMMANDS){
+			// there's no telling where the next packet starts
+			hasPendingSequence = false;
+			while(stream->available() > 0){
+				stream->read();
+			}
+			return;
+		}
+
+		skipPayload(cmd);
+		skipSequence();
+	}
+}
+
+void CommandStream::skipPayload(uint8_t cmd){
+	for(int payloadIdx=0; payloadIdx<CMD_PAYLOAD_SIZES[cmd]; payloadIdx++){
+		commandBuffer[payloadIdx+1] = readBlocking();
+	}
+
+	// then the samples that follow the fixed payload
+	uint32_t dataSize = 0;
+	if(cmd == CMD_SOUNDBITE){
+		bufferIdx = 6;
+		dataSize = 3*readUInt32FromBuffer();
+	}else if(cmd == CMD_SOUNDBITE_RLE){
+		bufferIdx = 10;
+		dataSize = readUInt32FromBuffer();
+	}else if(cmd == CMD_STREAM_SAMPLES){
+		bufferIdx = 5;
+		dataSize = 3*nextByteFromBuffer();
+	}
+
+	for(uint32_t i=0; i<dataSize; i++){
+		readBlocking();
 	}
 }
 
@@ -224,7 +463,22 @@ uint8_t CommandStream::nextByteFromBuffer(){
 	}
 }
 
+uint32_t CommandStream::readUInt32FromBuffer(){
+	uint32_t value = 0;
+	for(int i=0; i<4; i++){
+		uint32_t b = nextByteFromBuffer();
+		value += b << (i*8);
+	}
+
+	return value;
+}
+
 void CommandStream::playBite(uint8_t id){
+	SoundBite* soundBite = soundBites->get(id);
+	if(soundBite == nullptr){
+		return;
+	}
+
 	long now = millis();
 	long startTime = now;
 
@@ -234,12 +488,12 @@ void CommandStream::playBite(uint8_t id){
 	lastSample.pitch = 0;
 	lastSample.intensity = 0;
 
-	while(sampleIdx < soundBite->sampleCount){
+	while(sampleIdx < soundBite->storedCount){
 		now = millis();
 
 		long delta = now - startTime;
 		sampleIdx = int(delta / soundBite->period);
-		if(sampleIdx >= soundBite->sampleCount){
+		if(sampleIdx >= soundBite->storedCount){
 			break;
 		}
 
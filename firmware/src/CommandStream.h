@@ -4,6 +4,7 @@
 #include "HexGrid.h"
 #include "Display.h"
 #include "SoundBite.h"
+#include "StreamBuffer.h"
 
 #define CMD_HEADER            0x00
 #define CMD_CALIBRATE         0x01
@@ -18,10 +19,17 @@
 #define CMD_SET_ACTUATOR_INT  0x0A
 #define CMD_PULSE_ACTUATOR    0x0B
 #define CMD_PING              0x0C
+#define CMD_SOUNDBITE_RLE     0x0D
+#define CMD_SEQUENCE          0x0E
+#define CMD_STREAM_START      0x0F
+#define CMD_STREAM_SAMPLES    0x10
+#define CMD_STREAM_END        0x11
+#define CMD_STREAM_PLAY       0x12
 
-#define NUM_COMMANDS 13
+#define NUM_COMMANDS 19
 
-#define MAX_CMD_SIZE 32768
+// the largest fixed payload is 13 bytes, sound bite samples are read straight into the cache
+#define MAX_CMD_SIZE 256
 
 #define FACE_VIBING     "\n    ^  ^\n   ~~~~~~\0"
 #define FACE_NORMAL     "\n    O  O\n   \\____/\0"
@@ -37,17 +45,19 @@ public:
 	HexGrid* grid = nullptr;
 	Display* display = nullptr;
 	Stream* stream = nullptr;
-	SoundBite* soundBite = nullptr;
+	SoundBiteCache* soundBites = nullptr;
+	StreamBuffer* streamBuffer = nullptr;
 
 	long lastPing = 0l;
 
 	CommandStream(){}
 
-	void configure(Stream* stream, HexGrid* hexGrid, Display* display, SoundBite* soundBite){
+	void configure(Stream* stream, HexGrid* hexGrid, Display* display, SoundBiteCache* soundBites, StreamBuffer* streamBuffer){
 		this->stream = stream;
 		this->grid = hexGrid;
 		this->display = display;
-		this->soundBite = soundBite;
+		this->soundBites = soundBites;
+		this->streamBuffer = streamBuffer;
 
 		for(int i=0; i<MAX_CMD_SIZE; i++){
 			commandBuffer[i] = 0;
@@ -56,13 +66,28 @@ public:
 
 	void update();
 	void sendOk();
+	void sendAck(uint16_t sequence);
+	void sendSkip(uint16_t sequence);
 
 private:
 	int bufferIdx = 0;
 	uint8_t commandBuffer[MAX_CMD_SIZE];
 
+	// the sequence number of the last command read, until it's acked or skipped
+	bool hasPendingSequence = false;
+	uint16_t pendingSequence = 0;
+
 	uint8_t nextByteFromBuffer();
+	uint32_t readUInt32FromBuffer();
+	void readSoundBiteRuns();
+	void readStreamCommand(uint8_t cmd);
+	bool isStreamCommand(uint8_t cmd);
+	SoundBite* allocateSoundBite(uint8_t id, uint32_t period, uint32_t sampleCount);
+	bool readCommandStart(uint8_t* cmd);
+	void ackSequence();
+	void skipSequence();
 	bool flushToLatestCommand();
+	void skipPayload(uint8_t cmd);
 	uint8_t readBlocking();
 	void flush();
 	void playBite(uint8_t id);
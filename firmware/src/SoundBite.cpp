@@ -4,3 +4,57 @@ void SoundBite::init(uint8_t period, uint sampleCount){
 	this->period = period;
 	this->sampleCount = sampleCount;
 }
+
+SoundBite* SoundBiteCache::get(uint8_t id){
+	if(id >= NUM_SOUNDBITES){
+		return nullptr;
+	}
+
+	return &soundBites[id];
+}
+
+SoundBite* SoundBiteCache::allocate(uint8_t id, uint8_t period, uint sampleCount){
+	SoundBite* soundBite = get(id);
+	if(soundBite == nullptr){
+		return nullptr;
+	}
+
+	soundBite->storedCount = 0;
+	compact();
+
+	soundBite->init(period, sampleCount);
+	soundBite->samples = &pool[usedSamples];
+	soundBite->storedCount = min(min(sampleCount, (uint)MAX_SAMPLES), (uint)(SOUNDBITE_POOL_SIZE - usedSamples));
+	usedSamples += soundBite->storedCount;
+
+	return soundBite;
+}
+
+void SoundBiteCache::compact(){
+	// move resident bites to the front of the pool, lowest address first
+	bool moved[NUM_SOUNDBITES] = { false };
+	usedSamples = 0;
+
+	while(true){
+		SoundBite* next = nullptr;
+		uint8_t nextIdx = 0;
+		for(uint8_t i=0; i<NUM_SOUNDBITES; i++){
+			if(moved[i] || soundBites[i].storedCount == 0){
+				continue;
+			}
+			if(next == nullptr || soundBites[i].samples < next->samples){
+				next = &soundBites[i];
+				nextIdx = i;
+			}
+		}
+
+		if(next == nullptr){
+			break;
+		}
+
+		memmove(&pool[usedSamples], next->samples, next->storedCount * sizeof(Sample));
+		next->samples = &pool[usedSamples];
+		usedSamples += next->storedCount;
+		moved[nextIdx] = true;
+	}
+}
@@ -4,6 +4,8 @@
 #include <Arduino.h>
 
 #define MAX_SAMPLES 14000
+#define NUM_SOUNDBITES 16
+#define SOUNDBITE_POOL_SIZE 32000
 
 typedef struct sample {
 	uint8_t phone = 0;
@@ -27,10 +29,31 @@ class SoundBite {
 	public:
 		uint8_t period = 0;
 		uint16_t sampleCount = 0;
-		Sample samples[MAX_SAMPLES];
+		uint16_t storedCount = 0; // how many of sampleCount fit in the cache
+		Sample* samples = nullptr;
 		uint sampleIdx = 0;
 
 		void init(uint8_t period, uint sampleCount);
 };
 
+/*
+ * NUM_SOUNDBITES slots of up to MAX_SAMPLES samples, sharing one pool of SOUNDBITE_POOL_SIZE
+ *
+ * Uploading into a slot replaces whatever it held. The host keeps track of what is
+ * resident and frees slots (by uploading 0 samples into them) to make room, so a new
+ * bite is stored at the end of the pool after the remaining ones are packed together.
+ */
+class SoundBiteCache {
+	public:
+		SoundBite* get(uint8_t id);
+		SoundBite* allocate(uint8_t id, uint8_t period, uint sampleCount);
+
+	private:
+		SoundBite soundBites[NUM_SOUNDBITES];
+		Sample pool[SOUNDBITE_POOL_SIZE];
+		uint usedSamples = 0;
+
+		void compact();
+};
+
 #endif
@@ -0,0 +1,174 @@
+#include "StreamBuffer.h"
+
+void StreamBuffer::start(Stream* reportTo, HexGrid* grid, uint8_t period, uint16_t leadTime){
+	if(active){
+		finish();
+	}
+
+	this->reportTo = reportTo;
+	this->grid = grid;
+	this->period = max(period, (uint8_t)1);
+	this->leadTime = leadTime;
+
+	active = true;
+	received = false;
+	held = leadTime == STREAM_HOLD;
+	started = false;
+	lastArrival = millis();
+
+	writeIdx = 0;
+	playIdx = 0;
+	endIdx = 0xFFFFFFFF;
+
+	lastReceived.phone = 255;
+	lastReceived.pitch = 0;
+	lastReceived.intensity = 0;
+	lastPlayed = lastReceived;
+
+	played = 0;
+	underruns = 0;
+	late = 0;
+	gaps = 0;
+	overflows = 0;
+	maxDepth = 0;
+}
+
+void StreamBuffer::addSample(uint32_t sampleIdx, Sample sample){
+	if(!active){
+		return;
+	}
+
+	long now = millis();
+	lastArrival = now;
+
+	if(!received){
+		received = true;
+		writeIdx = sampleIdx;
+		playIdx = sampleIdx;
+
+		// the playout clock starts with the first sample, however long the host took to send it
+		if(!held){
+			startPlayout(now + leadTime);
+		}
+	}
+
+	if(sampleIdx < writeIdx){
+		// already have it
+		return;
+	}
+
+	if(sampleIdx - writeIdx > STREAM_BUFFER_SIZE){
+		// only the last buffer's worth of a long gap could ever be played
+		gaps += sampleIdx - writeIdx - STREAM_BUFFER_SIZE;
+		writeIdx = sampleIdx - STREAM_BUFFER_SIZE;
+	}
+
+	while(writeIdx < sampleIdx){
+		gaps++;
+		if(writeIdx < playIdx){
+			// already counted as underruns
+			writeIdx++;
+		}else{
+			store(writeIdx, lastReceived);
+		}
+	}
+
+	store(sampleIdx, sample);
+	lastReceived = sample;
+}
+
+void StreamBuffer::startPlayout(long startTime){
+	started = true;
+	playoutStart = startTime - (long)playIdx * period;
+}
+
+void StreamBuffer::store(uint32_t sampleIdx, Sample sample){
+	writeIdx = sampleIdx + 1;
+
+	if(sampleIdx < playIdx){
+		late++;
+		return;
+	}
+
+	if(sampleIdx - playIdx >= STREAM_BUFFER_SIZE){
+		overflows++;
+		playIdx = sampleIdx - STREAM_BUFFER_SIZE + 1;
+	}
+
+	samples[sampleIdx % STREAM_BUFFER_SIZE] = sample;
+	maxDepth = max(maxDepth, writeIdx - playIdx);
+}
+
+void StreamBuffer::play(){
+	if(active && held){
+		held = false;
+		lastArrival = millis();
+		startPlayout(lastArrival);
+	}
+}
+
+void StreamBuffer::end(uint32_t sampleCount){
+	if(active){
+		endIdx = sampleCount;
+	}
+}
+
+void StreamBuffer::stop(){
+	if(active){
+		finish();
+	}
+}
+
+bool StreamBuffer::isActive(){
+	return active;
+}
+
+void StreamBuffer::update(long now){
+	if(!active || held){
+		return;
+	}
+
+	if(started && now >= playoutStart){
+		uint32_t dueIdx = (now - playoutStart) / period;
+
+		// when the loop was held up, only the newest due sample is output
+		bool hasSample = false;
+		Sample sample;
+		while(playIdx <= dueIdx && playIdx < endIdx){
+			if(playIdx < writeIdx){
+				sample = samples[playIdx % STREAM_BUFFER_SIZE];
+				hasSample = true;
+				played++;
+			}else{
+				underruns++;
+			}
+			playIdx++;
+		}
+
+		if(hasSample && sample != lastPlayed){
+			if(sample.phone < 255 && sample.intensity > 0){
+				grid->enable(sample.phone, sample.intensity, sample.pitch);
+			}
+
+			lastPlayed = sample;
+		}
+	}
+
+	if(playIdx >= endIdx || (playIdx >= writeIdx && now - lastArrival > STREAM_TIMEOUT)){
+		finish();
+	}
+}
+
+void StreamBuffer::finish(){
+	active = false;
+	grid->disableAll();
+
+	if(reportTo != nullptr){
+		char msg[80];
+		sprintf(msg, "stream %lu %lu %lu %lu %lu %lu",
+			(unsigned long)played, (unsigned long)underruns, (unsigned long)late,
+			(unsigned long)gaps, (unsigned long)overflows, (unsigned long)maxDepth
+		);
+		reportTo->println(msg);
+	}
+}
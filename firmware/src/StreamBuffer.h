@@ -0,0 +1,83 @@
+#ifndef __STREAM_BUFFER_H
+#define __STREAM_BUFFER_H
+
+#include <Arduino.h>
+
+#include "HexGrid.h"
+#include "SoundBite.h"
+
+// 10 seconds of lead at a 5 ms period
+#define STREAM_BUFFER_SIZE 2048
+
+// a stream that runs dry and hears nothing for this long is ended
+#define STREAM_TIMEOUT 1000l
+
+// as a lead time, holds the playout until CMD_STREAM_PLAY
+#define STREAM_HOLD 0xFFFF
+
+/*
+ * Jitter buffer for CMD_STREAM_START/CMD_STREAM_SAMPLES/CMD_STREAM_END
+ *
+ * Every streamed sample carries its index. Sample n is played at
+ *   (arrival of the first sample) + leadTime + n * period
+ * so however late a packet arrives within the lead time, the arm sees it at a constant
+ * latency. A sample that isn't there when it's due is an underrun, and the previous
+ * output is held. A sample that arrives after it was due is late and is dropped.
+ * Indices skipped by the host are gaps, and they repeat the sample before them. Samples
+ * more than STREAM_BUFFER_SIZE ahead of the playhead push the oldest unplayed ones out
+ * as overflows.
+ *
+ * With a lead time of STREAM_HOLD, samples are only buffered until play() starts the
+ * playout with the first one. The host fills the buffer before that and refills it as
+ * it plays, so a stimulus of any length starts as precisely as a sound bite.
+ *
+ * When the stream ends (after the last sample, on CMD_STOP, or after STREAM_TIMEOUT),
+ * the counters are reported to the stream that started it:
+ *   stream <played> <underruns> <late> <gaps> <overflows> <maxDepth>
+ */
+class StreamBuffer {
+	public:
+		void start(Stream* reportTo, HexGrid* grid, uint8_t period, uint16_t leadTime);
+		void addSample(uint32_t sampleIdx, Sample sample);
+		void play();
+		void end(uint32_t sampleCount);
+		void stop();
+		bool isActive();
+
+		void update(long now);
+
+	private:
+		Sample samples[STREAM_BUFFER_SIZE];
+
+		Stream* reportTo = nullptr;
+		HexGrid* grid = nullptr;
+
+		bool active = false;
+		bool received = false;
+		bool held = false;
+		bool started = false;
+		uint8_t period = 0;
+		uint16_t leadTime = 0;
+		long playoutStart = 0;
+		long lastArrival = 0;
+
+		uint32_t writeIdx = 0;
+		uint32_t playIdx = 0;
+		uint32_t endIdx = 0xFFFFFFFF;
+
+		Sample lastReceived;
+		Sample lastPlayed;
+
+		uint32_t played = 0;
+		uint32_t underruns = 0;
+		uint32_t late = 0;
+		uint32_t gaps = 0;
+		uint32_t overflows = 0;
+		uint32_t maxDepth = 0;
+
+		void startPlayout(long startTime);
+		void store(uint32_t sampleIdx, Sample sample);
+		void finish();
+};
+
+#endif
@@ -82,7 +82,7 @@ void VTTDevice::setup(){
 		Serial.read();
 	}
 
-	commandStreams[0].configure(&Serial, &grid, &display, &soundBite);
+	commandStreams[0].configure(&Serial, &grid, &display, &soundBites, &streamBuffer);
 
 	#if defined (USE_WIFI)
 		char msg[45];
@@ -102,7 +102,7 @@ void VTTDevice::update(){
 			Logger::getGlobal()->debug("New client");
 			WiFiClient* clientPtr = new WiFiClient();
 			*clientPtr = client;
-			commandStreams[1].configure(clientPtr, &grid, &display, soundBites);
+			commandStreams[1].configure(clientPtr, &grid, &display, &soundBites, &streamBuffer);
 			Logger::getGlobal()->debug("New TCP client");
 		}
 	#endif
@@ -111,4 +111,6 @@ void VTTDevice::update(){
 	#if defined (USE_WIFI)
 		commandStreams[1].update();
 	#endif
+
+	streamBuffer.update(millis());
 }
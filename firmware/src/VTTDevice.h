@@ -10,6 +10,7 @@
 #include "Display.h"
 #include "CommandStream.h"
 #include "SoundBite.h"
+#include "StreamBuffer.h"
 #include "LoopTimer.h"
 
 class CombinedLogger: public Logger {
@@ -36,7 +37,8 @@ class VTTDevice {
 		LoopTimer loopTimer;
 
 		HexGrid grid;
-		SoundBite soundBite;
+		SoundBiteCache soundBites;
+		StreamBuffer streamBuffer;
 
 		Display display;
 
@@ -14,9 +14,9 @@ setup(
 	],
 	package_data={
 		'vtEval': ['assets/*'],
-		'vtEval.prosody': ['assets/video/*', 'assets/vtt/*', 'assets/sentences.csv'],
-		'vtEval.phonemes': ['assets/vtt/*', 'assets/src/*.wav'],
-		'vtEval.integration': ['assets/vtt/*', 'assets/wav/*.wav']
+		'vtEval.prosody': ['assets/video/*', 'assets/vtt/*', 'assets/vtt.vttbank', 'assets/sentences.csv'],
+		'vtEval.phonemes': ['assets/vtt/*', 'assets/vtt.vttbank', 'assets/src/*.wav'],
+		'vtEval.integration': ['assets/vtt/*', 'assets/vtt.vttbank', 'assets/wav/*.wav']
 	},
 	install_requires=[ ],
 )
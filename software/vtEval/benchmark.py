@@ -0,0 +1,297 @@
+import os
+import tty
+import time
+import socket
+import select
+import argparse
+import threading
+import statistics
+
+import numpy as np
+
+from vttHex import serial as vttSerial
+from vttHex.parseVTT import VTTFile
+
+'''
+Serial protocol throughput benchmark
+
+Drives the host-side APIs (vttHex.serial.StreamComms and vtEval.serial.SerialDevice)
+against a loopback stand-in for the device, which parses the CommandStream framing
+and timestamps each packet as its last byte arrives.
+
+	python -m vtEval.benchmark --samples 100 1000 5000 14000 --repeat 5
+
+Loopback links (pty, localhost TCP) aren't limited by a baud rate, so the measured
+numbers show host-side overhead. The "wire" column is the time the same packet
+takes on a UART at --baud (8N1, 10 bits per byte). With --compress, bites are sent
+as CMD_SOUNDBITE_RLE and the byte counts are those of the encoded packets.
+'''
+
+class LoopbackDevice:
+	'''Parses the CommandStream framing and records (command, byte count, completion time) per packet'''
+	def __init__(self):
+		self.packets = []
+		self.packetReceived = threading.Condition()
+		self.running = False
+
+		self.pending = bytearray()
+
+	def feed(self, data):
+		now = time.perf_counter()
+		self.pending += data
+
+		while True:
+			packetSize = self.nextPacketSize()
+			if packetSize is None or len(self.pending) < packetSize:
+				break
+
+			cmd = self.pending[1]
+			del self.pending[:packetSize]
+
+			with self.packetReceived:
+				self.packets.append((cmd, packetSize, now))
+				self.packetReceived.notify_all()
+
+	def nextPacketSize(self):
+		if len(self.pending) < 2:
+			return None
+
+		if self.pending[0] != vttSerial.CMD_HEADER:
+			raise ValueError(f'out of sync {self.pending[0]}')
+
+		cmd = self.pending[1]
+		packetSize = 2 + vttSerial.CMD_PAYLOAD_SIZES[cmd]
+		if cmd == vttSerial.CMD_SOUNDBITE:
+			if len(self.pending) < packetSize:
+				return None
+
+			sampleCount = int.from_bytes(self.pending[7:11], byteorder='little')
+			packetSize += 3 * sampleCount
+		elif cmd == vttSerial.CMD_SOUNDBITE_RLE:
+			if len(self.pending) < packetSize:
+				return None
+
+			packetSize += int.from_bytes(self.pending[11:15], byteorder='little')
+
+		return packetSize
+
+	def waitForPacket(self, count, timeout=30):
+		with self.packetReceived:
+			if not self.packetReceived.wait_for(lambda: len(self.packets) >= count, timeout):
+				raise TimeoutError(f'Loopback only received {len(self.packets)} of {count} packet(s)')
+
+			return self.packets[count-1]
+
+	def start(self):
+		self.running = True
+		self.thread = threading.Thread(target=self.run, daemon=True)
+		self.thread.start()
+
+	def stop(self):
+		self.running = False
+		self.thread.join()
+
+class PtyLoopback(LoopbackDevice):
+	def __init__(self):
+		super().__init__()
+
+		(self.masterFD, self.slaveFD) = os.openpty()
+		tty.setraw(self.slaveFD)
+		self.path = os.ttyname(self.slaveFD)
+
+	def run(self):
+		while self.running:
+			(readable, _, _) = select.select([self.masterFD], [], [], .1)
+			if readable:
+				self.feed(os.read(self.masterFD, 1<<16))
+
+	def stop(self):
+		super().stop()
+		os.close(self.masterFD)
+		os.close(self.slaveFD)
+
+class TcpLoopback(LoopbackDevice):
+	def __init__(self):
+		super().__init__()
+
+		self.serverSocket = socket.create_server(('127.0.0.1', 0))
+		self.serverSocket.settimeout(.1)
+		(self.host, self.port) = self.serverSocket.getsockname()
+
+	def run(self):
+		connection = None
+		while self.running and connection is None:
+			try:
+				(connection, _) = self.serverSocket.accept()
+			except socket.timeout:
+				pass
+
+		while self.running:
+			(readable, _, _) = select.select([connection], [], [], .1)
+			if readable:
+				data = connection.recv(1<<16)
+				if len(data) == 0:
+					break
+
+				self.feed(data)
+
+		if connection is not None:
+			connection.close()
+
+	def stop(self):
+		super().stop()
+		self.serverSocket.close()
+
+class BenchmarkResult:
+	def __init__(self, api, sampleCount, byteCount):
+		self.api = api
+		self.sampleCount = sampleCount
+		self.byteCount = byteCount
+
+		self.callTimes = []
+		self.uploadTimes = []
+		self.playLatencies = []
+
+	def addTrial(self, sendStart, sendReturned, uploadReceived, playStart, playReceived):
+		self.callTimes.append(sendReturned - sendStart)
+		self.uploadTimes.append(uploadReceived - sendStart)
+		self.playLatencies.append(playReceived - playStart)
+
+	def toRow(self, baud):
+		upload = statistics.median(self.uploadTimes)
+		return [
+			self.api,
+			self.sampleCount,
+			self.byteCount,
+			f'{statistics.median(self.callTimes)*1000:.2f}',
+			f'{upload*1000:.2f}',
+			f'{max(self.uploadTimes)*1000:.2f}',
+			f'{self.byteCount/upload/1000:.1f}',
+			f'{statistics.median(self.playLatencies)*1000:.3f}',
+			f'{self.byteCount*10/baud*1000:.1f}',
+		]
+
+resultColumns = ['api', 'samples', 'bytes', 'call ms', 'upload ms', 'max ms', 'kB/s', 'play ms', 'wire ms']
+
+def makeSamples(sampleCount):
+	# runs of 1-16 identical samples, roughly what the stimuli look like at a 5ms period
+	rng = np.random.default_rng(sampleCount)
+	values = rng.integers(0, 255, (sampleCount, 3), dtype=np.uint8)
+	runLengths = rng.integers(1, 17, sampleCount)
+
+	return np.repeat(values, runLengths, axis=0)[:sampleCount]
+
+def benchmarkStreamComms(name, comms, loopback, sampleCounts, repeat, period):
+	results = []
+	for sampleCount in sampleCounts:
+		samples = makeSamples(sampleCount)
+		result = BenchmarkResult(name, sampleCount, None)
+
+		for _ in range(repeat):
+			packetCount = len(loopback.packets)
+
+			sendStart = time.perf_counter()
+			comms.sendFile(period, samples)
+			sendReturned = time.perf_counter()
+			(_, result.byteCount, uploadReceived) = loopback.waitForPacket(packetCount+1)
+
+			playStart = time.perf_counter()
+			comms.sendPlayBite()
+			playReceived = loopback.waitForPacket(packetCount+2)[2]
+
+			result.addTrial(sendStart, sendReturned, uploadReceived, playStart, playReceived)
+
+		results.append(result)
+
+	return results
+
+def benchmarkSerialDevice(loopback, sampleCounts, repeat, period, compress=False):
+	from PySide2 import QtCore
+	from vtEval.serial import SerialDevice
+
+	app = QtCore.QCoreApplication.instance() or QtCore.QCoreApplication()
+	device = SerialDevice(loopback.path, compressSoundBites=compress)
+	device.open()
+
+	def waitForPacket(count):
+		# QSerialPort only writes from the event loop
+		deadline = time.perf_counter() + 30
+		while len(loopback.packets) < count:
+			app.processEvents()
+			if time.perf_counter() > deadline:
+				raise TimeoutError(f'Loopback only received {len(loopback.packets)} of {count} packet(s)')
+
+		return loopback.packets[count-1]
+
+	results = []
+	for sampleCount in sampleCounts:
+		samples = makeSamples(sampleCount)
+		vttFile = VTTFile(0, 0, period, '', '', samples.tobytes())
+		result = BenchmarkResult('SerialDevice/pty', sampleCount, None)
+
+		for _ in range(repeat):
+			packetCount = len(loopback.packets)
+
+			sendStart = time.perf_counter()
+			device.sendFile(vttFile)
+			sendReturned = time.perf_counter()
+			(_, result.byteCount, uploadReceived) = waitForPacket(packetCount+1)
+
+			playStart = time.perf_counter()
+			device.play()
+			playReceived = waitForPacket(packetCount+2)[2]
+
+			result.addTrial(sendStart, sendReturned, uploadReceived, playStart, playReceived)
+
+		results.append(result)
+
+	device.close()
+	return results
+
+def printResults(results, baud):
+	rows = [resultColumns] + [result.toRow(baud) for result in results]
+	widths = [max(len(str(row[i])) for row in rows) for i in range(len(resultColumns))]
+	for row in rows:
+		print('  '.join(str(value).rjust(width) for value,width in zip(row, widths)))
+
+def run(args):
+	results = []
+
+	if 'serial' in args.apis:
+		loopback = PtyLoopback()
+		loopback.start()
+		comms = vttSerial.SerialComms()
+		comms.open(loopback.path, args.baud)
+		comms.compressSoundBites = args.compress
+		results += benchmarkStreamComms('SerialComms/pty', comms, loopback, args.samples, args.repeat, args.period)
+		comms.serialObj.close()
+		loopback.stop()
+
+	if 'tcp' in args.apis:
+		loopback = TcpLoopback()
+		loopback.start()
+		comms = vttSerial.TcpComms()
+		comms.open(loopback.host, loopback.port)
+		comms.compressSoundBites = args.compress
+		results += benchmarkStreamComms('TcpComms/tcp', comms, loopback, args.samples, args.repeat, args.period)
+		comms.socket.close()
+		loopback.stop()
+
+	if 'device' in args.apis:
+		loopback = PtyLoopback()
+		loopback.start()
+		results += benchmarkSerialDevice(loopback, args.samples, args.repeat, args.period, args.compress)
+		loopback.stop()
+
+	printResults(results, args.baud)
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Serial protocol throughput benchmark')
+	parser.add_argument('--samples', type=int, nargs='+', default=[100, 1000, 5000, 14000])
+	parser.add_argument('--repeat', type=int, default=5)
+	parser.add_argument('--period', type=int, default=1, help='sample period (ms) written into each bite')
+	parser.add_argument('--baud', type=int, default=115200)
+	parser.add_argument('--compress', action='store_true', help='send run-length encoded bites (CMD_SOUNDBITE_RLE)')
+	parser.add_argument('--apis', nargs='+', default=['serial', 'tcp', 'device'], choices=['serial', 'tcp', 'device'])
+
+	run(parser.parse_args())
@@ -0,0 +1,295 @@
+import json
+import hashlib
+import shutil
+import subprocess
+import tempfile
+import argparse
+import logging
+from pathlib import Path
+from multiprocessing import Pool
+
+'''
+Incremental version of the genVTTs.sh pipeline
+
+Run from an asset folder (the one containing `src/`, `wav/` and `lexicon.txt`). Each
+stage is skipped for a stimulus when its outputs exist and the content hashes of its
+inputs match those recorded in the manifest after the last successful build.
+
+	src/x.wav -resample-> wav/x.wav -loudness-> wav/x.loudness.csv -+
+	                      wav/x.wav -f0-------> wav/x.f0.csv -------+
+	          wav/x.wav + wav/x.lab -grids----> wav/grids/x.TextGrid -+-features-> wav/x.vtf -vtt-> vtt/x.vtt
+
+The features stage packs the three analysis outputs into one binary file (see
+vttHex.features), so the vtt stage and SignalPlayer don't parse text.
+
+The .lab transcripts are expected to exist already (see genLabs / mbopp_data).
+A stimulus whose transcript has words missing from the lexicon fails the grids stage,
+and the words are listed in wav/oovs_found.txt.
+'''
+
+pipelineScript = Path(__file__).parent/'genVTTs.sh'
+
+def hashFile(path):
+	digest = hashlib.sha1()
+	with open(path, 'rb') as inputFile:
+		for chunk in iter(lambda: inputFile.read(1<<20), b''):
+			digest.update(chunk)
+
+	return digest.hexdigest()
+
+class BuildManifest:
+	def __init__(self, path):
+		self.path = Path(path)
+		self.hashCache = {}
+
+		if self.path.exists():
+			self.records = json.loads(self.path.read_text())
+		else:
+			self.records = {}
+
+	def hashInputs(self, inputs):
+		hashes = {}
+		for inputPath in inputs:
+			inputPath = Path(inputPath)
+			if not inputPath.exists():
+				hashes[str(inputPath)] = None
+				continue
+
+			# inputs are often outputs of an earlier stage, so key on the file's current state
+			stat = inputPath.stat()
+			key = (str(inputPath), stat.st_mtime_ns, stat.st_size)
+			if key not in self.hashCache:
+				self.hashCache[key] = hashFile(inputPath)
+
+			hashes[str(inputPath)] = self.hashCache[key]
+
+		return hashes
+
+	def isStale(self, stage, name, inputs, outputs):
+		for outputPath in outputs:
+			if not Path(outputPath).exists():
+				return True
+
+		return self.records.get(stage, {}).get(name) != self.hashInputs(inputs)
+
+	def record(self, stage, name, inputs):
+		self.records.setdefault(stage, {})[name] = self.hashInputs(inputs)
+
+	def forget(self, stage, name):
+		self.records.get(stage, {}).pop(name, None)
+
+	def save(self):
+		tmpPath = self.path.parent/(self.path.name + '.tmp')
+		tmpPath.write_text(json.dumps(self.records, indent='\t', sort_keys=True))
+		tmpPath.replace(self.path)
+
+class StimulusFiles:
+	def __init__(self, name, srcFolder, wavFolder, vttFolder):
+		self.name = name
+
+		self.src = srcFolder/(name + '.wav')
+		if not self.src.exists():
+			self.src = srcFolder/(name + '.WAV')
+
+		self.wav = wavFolder/(name + '.wav')
+		self.lab = wavFolder/(name + '.lab')
+		self.textGrid = wavFolder/'grids'/(name + '.TextGrid')
+		self.pitch = wavFolder/(name + '.f0.csv')
+		self.loudness = wavFolder/(name + '.loudness.csv')
+		self.features = wavFolder/(name + '.vtf')
+		self.vtt = vttFolder/(name + '.vtt')
+
+	def __repr__(self):
+		return f'<{self.__class__.__name__}({self.name})>'
+
+class Stage:
+	def __init__(self, name, getInputs, getOutputs, run):
+		self.name = name
+		self.getInputs = getInputs
+		self.getOutputs = getOutputs
+		self.run = run
+
+def runResample(stimuli, args):
+	for stim in stimuli:
+		subprocess.run(
+			['bash', '-c', 'source "$0"; resampleWav "$1" "$2"', str(pipelineScript), str(stim.src), str(stim.wav)],
+			check=True
+		)
+
+def runGrids(stimuli, args):
+	with tempfile.TemporaryDirectory() as tmpDir:
+		tmpDir = Path(tmpDir)
+		corpusDir = tmpDir/'corpus'
+		gridDir = tmpDir/'grids'
+		corpusDir.mkdir()
+
+		for stim in stimuli:
+			shutil.copy(stim.wav, corpusDir)
+			shutil.copy(stim.lab, corpusDir)
+
+		subprocess.run(
+			[str(Path(args.mfa).expanduser()/'bin'/'mfa_align'), '-v', '-q', '-j', str(args.jobs), str(corpusDir), args.lexicon, 'english', str(gridDir)],
+			check=True
+		)
+
+		oovs = readOOVs(tmpDir, Path(args.wav))
+
+		for stim in stimuli:
+			stim.textGrid.parent.mkdir(exist_ok=True)
+			for textGrid in gridDir.rglob(stim.textGrid.name):
+				shutil.move(str(textGrid), stim.textGrid)
+
+			# aligned without the words' pronunciations, so not recorded as built until the lexicon has them
+			missingWords = oovs.intersection(stim.lab.read_text().lower().split())
+			if len(missingWords) > 0:
+				logging.error(f'grids: {stim.name} has words missing from {args.lexicon}: {" ".join(sorted(missingWords))}')
+				stim.textGrid.unlink(missing_ok=True)
+
+def readOOVs(tmpDir, wavFolder):
+	'''
+	Reports the out-of-vocabulary words mfa_align found and returns them, lowercased
+
+	Like genVTTs.sh, the list is kept as wav/oovs_found.txt, since the corpus it was
+	written to is temporary.
+	'''
+	oovs = set()
+	for oovFile in tmpDir.rglob('oovs_found.txt'):
+		oovs.update(word.lower() for word in oovFile.read_text().split())
+
+	if len(oovs) > 0:
+		(wavFolder/'oovs_found.txt').write_text('\n'.join(sorted(oovs)) + '\n')
+		logging.warning(f'grids: {len(oovs)} word(s) not in the lexicon (see {wavFolder/"oovs_found.txt"}): {" ".join(sorted(oovs))}')
+
+	return oovs
+
+def runPitch(stimuli, args):
+	with tempfile.TemporaryDirectory() as tmpDir:
+		tmpDir = Path(tmpDir)
+		for stim in stimuli:
+			shutil.copy(stim.wav, tmpDir)
+
+		subprocess.run([str(Path(args.fcn_f0).expanduser())], cwd=tmpDir, check=True)
+
+		for stim in stimuli:
+			pitchFile = tmpDir/stim.pitch.name
+			if pitchFile.exists():
+				shutil.move(str(pitchFile), stim.pitch)
+
+def runLoudness(stimuli, args):
+	from vttHex.calcLoudness import makeLoudnessCSVs
+
+	makeLoudnessCSVs([str(stim.wav) for stim in stimuli], args.jobs)
+
+def _makeFeatureFile(stim):
+	from vttHex.features import makeFeatureFile
+
+	makeFeatureFile(stim.wav)
+
+def runFeatures(stimuli, args):
+	with Pool(args.jobs) as pool:
+		pool.map(_makeFeatureFile, stimuli)
+
+def _makeVttBinary(stim):
+	from vttHex.makeVttBinary import makeVttBinary
+
+	makeVttBinary(stim.wav, stim.vtt.parent)
+
+def runVTT(stimuli, args):
+	for stim in stimuli:
+		stim.vtt.parent.mkdir(exist_ok=True)
+
+	with Pool(args.jobs) as pool:
+		pool.map(_makeVttBinary, stimuli)
+
+stages = [
+	Stage('resample', lambda s: [s.src], lambda s: [s.wav], runResample),
+	Stage('grids', lambda s: [s.wav, s.lab], lambda s: [s.textGrid], runGrids),
+	Stage('loudness', lambda s: [s.wav], lambda s: [s.loudness], runLoudness),
+	Stage('f0', lambda s: [s.wav], lambda s: [s.pitch], runPitch),
+	Stage('features', lambda s: [s.textGrid, s.pitch, s.loudness], lambda s: [s.features], runFeatures),
+	Stage('vtt', lambda s: [s.wav, s.features], lambda s: [s.vtt], runVTT),
+]
+
+def findStimuli(srcFolder, wavFolder, vttFolder):
+	if srcFolder.exists():
+		sources = list(srcFolder.glob('*.[Ww][Aa][Vv]'))
+	else:
+		sources = list(wavFolder.glob('*.[Ww][Aa][Vv]'))
+
+	names = sorted(set(f.stem for f in sources))
+	return [StimulusFiles(name, srcFolder, wavFolder, vttFolder) for name in names]
+
+def outputStates(outputs):
+	return [Path(outputPath).stat().st_mtime_ns if Path(outputPath).exists() else None for outputPath in outputs]
+
+def build(args):
+	srcFolder = Path(args.src)
+	wavFolder = Path(args.wav)
+	vttFolder = Path(args.vtt)
+
+	manifest = BuildManifest(args.manifest)
+	stimuli = findStimuli(srcFolder, wavFolder, vttFolder)
+	rebuiltVTTs = False
+
+	for stage in stages:
+		if stage.name in args.skip:
+			continue
+
+		if stage.name == 'resample' and not srcFolder.exists():
+			continue
+
+		stale = []
+		for stim in stimuli:
+			inputs = stage.getInputs(stim)
+			if args.force or manifest.isStale(stage.name, stim.name, inputs, stage.getOutputs(stim)):
+				if all(Path(inputPath).exists() for inputPath in inputs):
+					stale.append(stim)
+				else:
+					logging.warning(f'{stage.name}: missing input(s) for {stim.name}')
+
+		print(f'{stage.name}: {len(stale)} of {len(stimuli)} stimuli out of date')
+		if len(stale) == 0 or args.dry_run:
+			continue
+
+		previousOutputs = {stim.name: outputStates(stage.getOutputs(stim)) for stim in stale}
+		try:
+			stage.run(stale, args)
+		finally:
+			for stim in stale:
+				inputs = stage.getInputs(stim)
+				outputs = outputStates(stage.getOutputs(stim))
+				if None not in outputs and outputs != previousOutputs[stim.name]:
+					manifest.record(stage.name, stim.name, inputs)
+				else:
+					logging.error(f'{stage.name}: no output for {stim.name}')
+					manifest.forget(stage.name, stim.name)
+
+			manifest.save()
+
+		if stage.name == 'vtt':
+			rebuiltVTTs = True
+
+	bankPath = vttFolder.with_suffix('.vttbank')
+	if not args.dry_run and 'vtt' not in args.skip and (rebuiltVTTs or not bankPath.exists()):
+		from vttHex.makeVttBinary import makeVttBank
+
+		vttFiles = list(vttFolder.glob('*.vtt'))
+		if len(vttFiles) > 0:
+			print(f'bank: packing {len(vttFiles)} stimuli into {bankPath}')
+			makeVttBank(bankPath, vttFiles)
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Incrementally rebuild VTT stimuli')
+	parser.add_argument('--src', default='src', help='folder of original recordings')
+	parser.add_argument('--wav', default='wav', help='folder of resampled recordings and analysis files')
+	parser.add_argument('--vtt', default='vtt', help='output folder for .vtt files')
+	parser.add_argument('--manifest', default='build-manifest.json')
+	parser.add_argument('--lexicon', default='lexicon.txt')
+	parser.add_argument('--mfa', default='~/code/montreal-forced-aligner')
+	parser.add_argument('--fcn-f0', default='~/code/FCN-f0/run.sh')
+	parser.add_argument('--jobs', type=int, default=16)
+	parser.add_argument('--skip', nargs='*', default=[], choices=[stage.name for stage in stages])
+	parser.add_argument('--force', action='store_true', help='rebuild everything')
+	parser.add_argument('--dry-run', action='store_true', help='only report what is out of date')
+
+	build(parser.parse_args())
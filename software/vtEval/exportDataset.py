@@ -0,0 +1,207 @@
+import re
+import json
+import logging
+import argparse
+from pathlib import Path
+
+'''
+Consolidates DataLogger CSVs into a partitioned Parquet dataset
+
+Every session CSV (`{timestamp}_{pid}_{condition}_{evalType}_{facilitator}.csv`, see
+DataLogger) becomes one Parquet file in a hive-style layout, so analysis can load all
+sessions at once and filter on the partition keys without opening the other files:
+
+	<output>/evalType=prosody/condition=Pre-test/pid=1001/<session>.parquet
+
+The files keep the columns of the CSV they came from (e.g., IntegrationDataLogger's
+`audibleFile` and `options`), plus a `session` column with the CSV's name. `pid` and
+`condition` come from the partition path. `openDataset()` reads them back with the
+schemas of all sessions merged.
+
+The index (`<output>/index.json`) records the size and modification time of every
+ingested CSV, so only new or changed CSVs are read on the next run. The outputs of
+CSVs that have since been removed are deleted.
+
+	python -m vtEval.exportDataset --data data --output data/dataset
+
+Requires pyarrow.
+'''
+
+sessionNamePattern = re.compile(r'(?P<timestamp>[^_]+)_(?P<pid>[^_]+)_(?P<condition>[^_]+)_(?P<evalType>[^_]+)_(?P<facilitator>.*)')
+partitionKeys = ['evalType', 'condition', 'pid']
+
+class SessionIndex:
+	def __init__(self, path):
+		self.path = Path(path)
+
+		if self.path.exists():
+			self.records = json.loads(self.path.read_text())
+		else:
+			self.records = {}
+
+	def isCurrent(self, csvPath):
+		record = self.records.get(str(csvPath))
+		if record is None or not Path(record['output']).exists():
+			return False
+
+		stat = Path(csvPath).stat()
+		return record['mtime'] == stat.st_mtime_ns and record['size'] == stat.st_size
+
+	def record(self, csvPath, outputPath, rowCount):
+		stat = Path(csvPath).stat()
+		self.records[str(csvPath)] = {
+			'mtime': stat.st_mtime_ns,
+			'size': stat.st_size,
+			'output': str(outputPath),
+			'rows': rowCount,
+		}
+
+	def forget(self, csvPath):
+		return self.records.pop(str(csvPath), None)
+
+	def sources(self):
+		return list(self.records.keys())
+
+	def save(self):
+		self.path.parent.mkdir(parents=True, exist_ok=True)
+		tmpPath = self.path.parent/(self.path.name + '.tmp')
+		tmpPath.write_text(json.dumps(self.records, indent='\t', sort_keys=True))
+		tmpPath.replace(self.path)
+
+def parseSessionName(csvPath):
+	match = sessionNamePattern.fullmatch(Path(csvPath).stem)
+	if match is None:
+		return None
+
+	return match.groupdict()
+
+def getColumnType(columnName):
+	import pyarrow as pa
+
+	# TrialTimeline's event timestamps and intervals
+	if columnName.endswith('_ns'):
+		return pa.int64()
+
+	if columnName.endswith('_ms'):
+		return pa.float64()
+
+	return pa.string()
+
+def readSessionCSV(csvPath):
+	from pyarrow import csv as arrowCSV
+
+	with open(csvPath, newline='') as csvFile:
+		columnNames = csvFile.readline().strip().split(',')
+
+	convertOptions = arrowCSV.ConvertOptions(
+		column_types={name: getColumnType(name) for name in columnNames},
+		strings_can_be_null=True,
+	)
+	return arrowCSV.read_csv(csvPath, convert_options=convertOptions)
+
+def getOutputPath(outputFolder, csvPath, session):
+	partitionPath = Path(outputFolder)
+	for key in partitionKeys:
+		partitionPath /= f'{key}={session[key]}'
+
+	return partitionPath/(Path(csvPath).stem + '.parquet')
+
+def exportSession(csvPath, outputPath):
+	import pyarrow as pa
+	import pyarrow.parquet as pq
+
+	table = readSessionCSV(csvPath)
+
+	# these are in the partition path
+	for key in partitionKeys:
+		if key in table.column_names:
+			table = table.drop([key])
+
+	table = table.append_column('session', pa.array([Path(csvPath).stem] * table.num_rows, pa.string()))
+
+	outputPath.parent.mkdir(parents=True, exist_ok=True)
+	tmpPath = outputPath.parent/(outputPath.name + '.tmp')
+	pq.write_table(table, tmpPath)
+	tmpPath.replace(outputPath)
+
+	return table.num_rows
+
+def removeOutput(outputPath, outputFolder):
+	outputPath = Path(outputPath)
+	if outputPath.exists():
+		outputPath.unlink()
+
+	# prune partition folders left empty
+	folder = outputPath.parent
+	while folder != Path(outputFolder) and folder.exists() and not any(folder.iterdir()):
+		folder.rmdir()
+		folder = folder.parent
+
+def findSessionCSVs(dataFolders):
+	csvPaths = []
+	for folder in dataFolders:
+		for csvPath in sorted(Path(folder).glob('*.csv')):
+			if parseSessionName(csvPath) is None:
+				logging.warning(f'Skipping {csvPath}, not named like a session')
+				continue
+
+			csvPaths.append(csvPath)
+
+	return csvPaths
+
+def export(args):
+	outputFolder = Path(args.output)
+	index = SessionIndex(outputFolder/'index.json')
+
+	csvPaths = findSessionCSVs(args.data)
+	sourceNames = set(str(csvPath) for csvPath in csvPaths)
+
+	removed = [source for source in index.sources() if source not in sourceNames]
+	stale = [csvPath for csvPath in csvPaths if args.force or not index.isCurrent(csvPath)]
+
+	print(f'{len(stale)} of {len(csvPaths)} session(s) out of date, {len(removed)} removed')
+	if args.dry_run:
+		return
+
+	for source in removed:
+		removeOutput(index.forget(source)['output'], outputFolder)
+
+	try:
+		for csvPath in stale:
+			outputPath = getOutputPath(outputFolder, csvPath, parseSessionName(csvPath))
+
+			previous = index.forget(csvPath)
+			if previous is not None and previous['output'] != str(outputPath):
+				removeOutput(previous['output'], outputFolder)
+
+			try:
+				rowCount = exportSession(csvPath, outputPath)
+			except Exception as exc:
+				logging.error(f'Failed to export {csvPath}: {exc}')
+				continue
+
+			index.record(csvPath, outputPath, rowCount)
+			print(f'{csvPath} -> {outputPath} ({rowCount} rows)')
+	finally:
+		index.save()
+
+def openDataset(outputFolder):
+	'''A pyarrow dataset of every exported session, with pid/condition/evalType as columns'''
+	import pyarrow as pa
+	import pyarrow.dataset as ds
+	import pyarrow.parquet as pq
+
+	files = [str(f) for f in sorted(Path(outputFolder).rglob('*.parquet'))]
+	partitioning = ds.partitioning(pa.schema([(key, pa.string()) for key in partitionKeys]), flavor='hive')
+	schema = pa.unify_schemas([pq.read_schema(f) for f in files] + [partitioning.schema])
+
+	return ds.dataset(files, schema=schema, format='parquet', partitioning=partitioning, partition_base_dir=str(outputFolder))
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Export eval session CSVs to a partitioned Parquet dataset')
+	parser.add_argument('--data', nargs='+', default=['data'], help='folder(s) of session CSVs')
+	parser.add_argument('--output', default='data/dataset')
+	parser.add_argument('--force', action='store_true', help='re-export every session')
+	parser.add_argument('--dry-run', action='store_true', help='only report what is out of date')
+
+	export(parser.parse_args())
@@ -68,11 +68,22 @@ function genLoudness(){
 	"$PYTHON" -m vttHex.calcLoudness "$1"/*.[Ww][Aa][Vv] >> "$LOG" 2>&1
 }
 
+function genFeatures(){
+	echo "Packing feature files"
+	"$PYTHON" -m vttHex.features "$1"/*.[Ww][Aa][Vv] >> "$LOG" 2>&1
+}
+
+function buildIncremental(){
+	echo "Incremental build"
+	"$PYTHON" -m vtEval.buildVTTs "$@" 2>&1 | tee -a "$LOG"
+}
+
 function genVTT(){
 	echo "Generate VTT"
 
 	"$PYTHON" ~/code/vttHex/software/vttHex/makeVttBinary.py "$1"/*.[Ww][Aa][Vv] >> "$LOG" 2>&1
 	mkdir vtt >> "$LOG" 2>/dev/null
 	mv *.vtt vtt/
+	"$PYTHON" ~/code/vttHex/software/vttHex/makeVttBinary.py --bank vtt.vttbank vtt/*.vtt >> "$LOG" 2>&1
 }
 
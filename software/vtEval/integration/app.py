@@ -40,6 +40,10 @@ class StimPair(Stimulus):
 	sounds = {}
 
 	def __init__(self, wavFile, vttFile):
+		vtt = vttFile
+		if isinstance(vttFile, VTTFile):
+			vttFile = vttFile.filepath
+
 		self.wavFile = wavFile
 		self.vttFile = vttFile
 
@@ -51,7 +55,7 @@ class StimPair(Stimulus):
 		self.sound = StimPair.sounds[self.wavFile]
 
 		self.id = str(self)
-		super().__init__(vttFile, str(self))
+		super().__init__(vtt, str(self))
 
 	@staticmethod
 	def getPhone(filename):
@@ -75,20 +79,14 @@ class StimPair(Stimulus):
 	def __str__(self):
 		return f'{self.getAudiblePhone()}-{self.getTactilePhone()}'
 
-	def __getstate__(self):
-		return {
-			'vttFile': self.vttFile,
-			'wavFile': self.wavFile
-		}
-
-	def __setstate__(self, state):
-		self.__init__(state['wavFile'], state['vttFile'])
+	def describe(self):
+		return {'wavFile': self.wavFile, 'vttFile': self.vtt}
 
 class IntegrationAFCWidget(StateWidget):
 	stimulusBraced = QtCore.Signal(object)
 	stimulusTriggered = QtCore.Signal(object)
 
-	def __init__(self, name, stimPair, parent=None):
+	def __init__(self, name, stimPair, options=None, parent=None):
 		super().__init__(name=name, parent=parent)
 
 		self.delayBeforeStimulus = 1000
@@ -110,8 +108,11 @@ class IntegrationAFCWidget(StateWidget):
 
 		buttonPositions = [(0,1), (1,0), (1,2), (2,1)]
 
-		self.options = list(self.stimulus.getResponseOptions())
-		random.shuffle(self.options)
+		if options is None:
+			options = list(self.stimulus.getResponseOptions())
+			random.shuffle(options)
+
+		self.options = options
 		for idx,opt in enumerate(self.options):
 			row,col = buttonPositions[idx]
 
@@ -148,6 +149,11 @@ class IntegrationAFCWidget(StateWidget):
 
 		noise.stop()
 		self.orButton.setFocus()
+		self.awaitingResponse.emit()
+
+	@classmethod
+	def getStimuliFor(cls, stimPair, **kwargs):
+		return [stimPair]
 
 	def onChoiceMade(self, option):
 		self.selection = option
@@ -170,9 +176,6 @@ class IntegrationAFCWidget(StateWidget):
 	def __repr__(self):
 		return f'<{self.__class__.__name__}(name={self.name}, stimulus={repr(self.stimulus)})>'
 
-	def __setstate__(self, state):
-		self.__init__(state['name'], state['stimulus'])
-
 class IntegrationDataLogger(DataLogger):
 	def getFieldNames(self):
 		return super().getFieldNames() + ['audibleFile', 'options']
@@ -194,23 +197,25 @@ class IntegrationEvalApp(VtEvalApp):
 
 		self.stimSets = []
 
+		vttBank = openVTTBank(locateAsset('vtt'))
 		for audibleFile in Path(locateAsset('wav')).glob('*.wav'):
 			speakerID = int(audibleFile.stem[7:9])
 			audiblePhone = StimPair.getPhone(audibleFile)
 
-			for tactileFile in Path(locateAsset('vtt')).glob(f'*TK0{speakerID}.vtt'):
-				tactilePhone = StimPair.getPhone(tactileFile)
+			for tactileVTT in vttBank.glob(f'*TK0{speakerID}.vtt'):
+				tactilePhone = StimPair.getPhone(tactileVTT.filepath)
 
 				token = (audiblePhone, tactilePhone)
 				if token in stimPairResponseOptions:
-					self.stimSets.append(StimPair(audibleFile, tactileFile))
+					self.stimSets.append(StimPair(audibleFile, tactileVTT))
 
 		random.shuffle(self.stimSets)
 
 	def simulate(self):
 		isPostTest = self.arguments['condition'] == 'Post-test'
 
-		for w in self.widgetStack:
+		for descriptor in self.widgetStack:
+			w = descriptor.materialize()
 			if isinstance(w, IntegrationAFCWidget):
 				if not isPostTest:
 					# on the pre-test, we'll pick the auditory stim at least 90%
@@ -233,18 +238,19 @@ class IntegrationEvalApp(VtEvalApp):
 						w.selection = random.choice(integratedOptions)
 
 			self.dataLogger.logWidgetCompletion(w)
+			w.deleteLater()
 
 	def initialize(self, arguments):
-		self.widgetStack.append(TextInstructionsScreen('instructions', instructions))
+		self.widgetStack.append(WidgetDescriptor(TextInstructionsScreen, 'instructions', text=instructions))
 
 		tactileAuditoryStack = []
 		for idx,stimPair in enumerate(self.stimSets):
-			stimWidget = IntegrationAFCWidget(f'tactileAuditoryStack-{idx:03}', stimPair)
-			stimWidget.stimulusBraced.connect(self.prepareStimulus)
-			stimWidget.stimulusTriggered.connect(self.playStimulus)
-			tactileAuditoryStack.append(stimWidget)
+			options = list(stimPair.getResponseOptions())
+			random.shuffle(options)
+
+			tactileAuditoryStack.append(WidgetDescriptor(IntegrationAFCWidget, f'tactileAuditoryStack-{idx:03}', stimPair=stimPair, options=options))
 
-		breakWidget = ButtonPromptWidget('break', '<center>Time for a break!<br/><br/>Press the button below when you are ready to continue.</center>')
+		breakWidget = WidgetDescriptor(ButtonPromptWidget, 'break', text='<center>Time for a break!<br/><br/>Press the button below when you are ready to continue.</center>')
 
 		self.widgetStack += tactileAuditoryStack
 
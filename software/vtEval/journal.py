@@ -0,0 +1,158 @@
+import os
+import json
+import logging
+import datetime
+import importlib
+from pathlib import Path
+
+from PySide2 import QtCore
+from vttHex.parseVTT import VTTFile, openVTTBank
+
+'''
+Append-only session journal
+
+The first line is the trial plan: every item of the widget stack, as the class and the
+constructor arguments that recreate it (see `describe()` on WidgetDescriptor and the stimuli).
+Each completed item then appends one line with its index in the plan, so saving a
+checkpoint costs the same at any point in the session.
+
+	{"type": "plan", "items": [{"__class__": "vtEval.phonemes.app:PhonemeAFCWidget", "args": {...}}, ...]}
+	{"type": "completed", "index": 0, "name": "instructions", "timestamp": "..."}
+'''
+
+vttSources = {}
+
+def loadVTT(path):
+	path = Path(path)
+	if path.parent not in vttSources:
+		vttSources[path.parent] = openVTTBank(path.parent)
+
+	return vttSources[path.parent].get(path.stem)
+
+def encode(value):
+	if value is None or isinstance(value, (str, bool, int, float)):
+		return value
+
+	if isinstance(value, (list, tuple)):
+		return [encode(item) for item in value]
+
+	if isinstance(value, VTTFile):
+		return {'__vtt__': str(value.filepath)}
+
+	if isinstance(value, Path):
+		return {'__path__': str(value)}
+
+	if isinstance(value, QtCore.QUrl):
+		return {'__url__': value.toString()}
+
+	if hasattr(value, 'describe'):
+		cls = getattr(value, 'describedClass', value.__class__)
+		return {
+			'__class__': f'{cls.__module__}:{cls.__qualname__}',
+			'args': {key: encode(arg) for key,arg in value.describe().items()},
+		}
+
+	raise TypeError(f"Can't journal {value!r}")
+
+def decode(value):
+	if isinstance(value, list):
+		return [decode(item) for item in value]
+
+	if not isinstance(value, dict):
+		return value
+
+	if '__vtt__' in value:
+		return loadVTT(value['__vtt__'])
+
+	if '__path__' in value:
+		return Path(value['__path__'])
+
+	if '__url__' in value:
+		return QtCore.QUrl(value['__url__'])
+
+	if '__class__' in value:
+		(cls, args) = decodeClass(value)
+		return cls(**args)
+
+	raise ValueError(f"Can't decode {value!r}")
+
+def decodeClass(value):
+	'''Returns the class and decoded constructor arguments of an encoded object, without constructing it'''
+	(moduleName, className) = value['__class__'].split(':')
+	if moduleName.split('.')[0] != 'vtEval':
+		raise ValueError(f'Refusing to load {value["__class__"]} from a journal')
+
+	cls = getattr(importlib.import_module(moduleName), className)
+	return (cls, {key: decode(arg) for key,arg in value['args'].items()})
+
+class SessionJournal:
+	def __init__(self, path):
+		self.path = Path(path)
+
+	def exists(self):
+		return self.path.exists()
+
+	def start(self, items):
+		self.path.parent.mkdir(parents=True, exist_ok=True)
+
+		plan = {'type': 'plan', 'items': [encode(item) for item in items]}
+		tmpPath = self.path.parent/(self.path.name + '.tmp')
+		with tmpPath.open('w') as journalFile:
+			journalFile.write(json.dumps(plan) + '\n')
+			journalFile.flush()
+			os.fsync(journalFile.fileno())
+
+		tmpPath.replace(self.path)
+
+	def recordCompletion(self, index, name):
+		record = {
+			'type': 'completed',
+			'index': index,
+			'name': name,
+			'timestamp': datetime.datetime.now().isoformat(),
+		}
+
+		with self.path.open('a') as journalFile:
+			journalFile.write(json.dumps(record) + '\n')
+			journalFile.flush()
+			os.fsync(journalFile.fileno())
+
+	def load(self):
+		'''Returns the encoded plan items and the set of completed indices'''
+		plan = None
+		completed = set()
+
+		line = ''
+		with self.path.open('r') as journalFile:
+			for lineNumber,line in enumerate(journalFile):
+				if line.strip() == '':
+					continue
+
+				try:
+					record = json.loads(line)
+				except json.JSONDecodeError:
+					# most likely the last line, cut short by a crash
+					logging.warning(f'Skipping unreadable line {lineNumber+1} of {self.path}')
+					continue
+
+				if record['type'] == 'plan':
+					plan = record['items']
+				elif record['type'] == 'completed':
+					completed.add(record['index'])
+
+		if not line.endswith('\n'):
+			# terminate the partial line so the next record starts on its own
+			with self.path.open('a') as journalFile:
+				journalFile.write('\n')
+
+		if plan is None:
+			raise ValueError(f'{self.path} has no trial plan')
+
+		return (plan, completed)
+
+	def delete(self):
+		if self.path.exists():
+			self.path.unlink()
+
+	def __repr__(self):
+		return f'<{self.__class__.__name__}({self.path})>'
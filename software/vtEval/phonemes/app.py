@@ -138,6 +138,11 @@ class PhonemeAFCWidget(StateWidget):
 
 		layout = self.buttonContainer.layout()
 		layout.itemAt(layout.count()//2).widget().setFocus()
+		self.awaitingResponse.emit()
+
+	@classmethod
+	def getStimuliFor(cls, stimulus, **kwargs):
+		return [stimulus]
 
 	def onChoiceMade(self, option):
 		self.selection = option
@@ -150,9 +155,6 @@ class PhonemeAFCWidget(StateWidget):
 	def __repr__(self):
 		return f'<{self.__class__.__name__}(name={self.name}, stimulus={self.stimulus}, options={self.options})>'
 
-	def __setstate__(self, state):
-		self.__init__(state['name'], state['stimulus'], state['options'])
-
 class PhonemeEvalApp(VtEvalApp):
 	def __init__(self):
 		super().__init__('Phoneme Evaluation')
@@ -189,7 +191,8 @@ class PhonemeEvalApp(VtEvalApp):
 
 		isPreTest = self.arguments['condition'] == 'Pre-test'
 
-		for w in self.widgetStack:
+		for descriptor in self.widgetStack:
+			w = descriptor.materialize()
 			if isinstance(w, PhonemeAFCWidget):
 				if isPreTest or random.random() > phoneFreqs[w.stimulus.id]:
 					w.selection = random.choice(w.options)
@@ -197,46 +200,41 @@ class PhonemeEvalApp(VtEvalApp):
 					w.selection = w.stimulus.id
 
 			self.dataLogger.logWidgetCompletion(w)
+			w.deleteLater()
 
 	def initialize(self, arguments):
 		stack = [
-			TextInstructionsScreen('instructions', instructions['intro']),
+			WidgetDescriptor(TextInstructionsScreen, 'instructions', text=instructions['intro']),
 		]
 
 		sounds = self.loadConsonants('src', FileStimulus)[0]
 		sounds.sort(key=lambda x: str(x))
 		consonantStack = [
-			ButtonPromptWidgetWithSoundBoard('instructions', instructions['consonants'], sounds=sounds)
+			WidgetDescriptor(ButtonPromptWidgetWithSoundBoard, 'instructions', text=instructions['consonants'], sounds=sounds)
 		]
 		for idx,stim in enumerate(self.consonants):
 			options = self.makeRandomSubset(self.consonantSet, stim.id)
 
-			stimWidget = PhonemeAFCWidget(f'consonant-{idx:03}', stim, options)
-			stimWidget.stimulusBraced.connect(self.prepareStimulus)
-			stimWidget.stimulusTriggered.connect(self.playStimulus)
-			consonantStack.append(stimWidget)
+			consonantStack.append(WidgetDescriptor(PhonemeAFCWidget, f'consonant-{idx:03}', stimulus=stim, options=options))
 
 		consonantStack.insert(
 			int(len(consonantStack)/2),
-			ButtonPromptWidget('break', '<center>Time for a break!<br/><br/>Press the button below when you are ready to continue with consonants.</center>')
+			WidgetDescriptor(ButtonPromptWidget, 'break', text='<center>Time for a break!<br/><br/>Press the button below when you are ready to continue with consonants.</center>')
 		)
 
 		sounds = self.loadVowels('src', FileStimulus)[0]
 		sounds.sort(key=lambda x: str(x))
 		vowelStack = [
-			ButtonPromptWidgetWithSoundBoard('instructions', instructions['vowels'], sounds=sounds)
+			WidgetDescriptor(ButtonPromptWidgetWithSoundBoard, 'instructions', text=instructions['vowels'], sounds=sounds)
 		]
 		for idx,stim in enumerate(self.vowels):
 			options = self.makeRandomSubset(self.vowelSet, stim.id)
 
-			stimWidget = PhonemeAFCWidget(f'vowel-{idx:03}', stim, options)
-			stimWidget.stimulusBraced.connect(self.prepareStimulus)
-			stimWidget.stimulusTriggered.connect(self.playStimulus)
-			vowelStack.append(stimWidget)
+			vowelStack.append(WidgetDescriptor(PhonemeAFCWidget, f'vowel-{idx:03}', stimulus=stim, options=options))
 
 		vowelStack.insert(
 			int(len(vowelStack)/2),
-			ButtonPromptWidget('break', '<center>Time for a break!<br/><br/>Press the button below when you are ready to continue with vowels.</center>')
+			WidgetDescriptor(ButtonPromptWidget, 'break', text='<center>Time for a break!<br/><br/>Press the button below when you are ready to continue with vowels.</center>')
 		)
 
 		# counterbalance consonants vs vowels order presentation
@@ -266,8 +264,14 @@ class PhonemeEvalApp(VtEvalApp):
 		uniqueSet = set()
 		stims = []
 
-		for f in list(path.glob('*.*')):
-			match = pattern.match(str(f.stem))
+		if issubclass(stimClass, Stimulus):
+			files = openVTTBank(path).glob('*.vtt')
+		else:
+			files = list(path.glob('*.*'))
+
+		for f in files:
+			stem = f.filepath.stem if isinstance(f, VTTFile) else f.stem
+			match = pattern.match(str(stem))
 			if match is None:
 				continue
 
@@ -73,6 +73,9 @@ class StimPair:
 		self.earlyStim = earlyStim
 		self.lateStim = lateStim
 
+	def describe(self):
+		return {'typeName': self.type, 'typeIdx': self.typeIdx, 'earlyStim': self.earlyStim, 'lateStim': self.lateStim}
+
 	def getMaxDurationMS(self):
 		return max(self.earlyStim.vtt.getDuration(), self.lateStim.vtt.getDuration())
 
@@ -83,7 +86,7 @@ class ProsodyAFCWidget(StateWidget):
 	stimulusBraced = QtCore.Signal(object)
 	stimulusTriggered = QtCore.Signal(object)
 
-	def __init__(self, name, stimPair, earlyOrLate, parent=None):
+	def __init__(self, name, stimPair, earlyOrLate, swapOrder=None, parent=None):
 		super().__init__(name=name, parent=parent)
 
 		self.delayBeforeStimulus = 0
@@ -125,10 +128,13 @@ class ProsodyAFCWidget(StateWidget):
 		self.buttonContainer.setLayout(QtWidgets.QHBoxLayout())
 		self.buttonContainer.layout().setSpacing(20)
 
-		self.stims = [stimPair.earlyStim, stimPair.lateStim]
+		if swapOrder is None:
+			swapOrder = random.choice([False, True])
+
+		self.swapOrder = swapOrder
+		self.stims = ProsodyAFCWidget.getStimuliFor(stimPair, swapOrder)
 		choices = ['early', 'late']
-		if random.choice([False, True]):
-			self.stims = list(reversed(self.stims))
+		if swapOrder:
 			choices = list(reversed(choices))
 
 		self.choiceButtons = [
@@ -206,6 +212,15 @@ class ProsodyAFCWidget(StateWidget):
 		self.buttonContainer.setDisabled(False)
 		noise.stop()
 		self.orButton.setFocus()
+		self.awaitingResponse.emit()
+
+	@classmethod
+	def getStimuliFor(cls, stimPair, swapOrder=False, **kwargs):
+		stims = [stimPair.earlyStim, stimPair.lateStim]
+		if swapOrder:
+			stims = list(reversed(stims))
+
+		return stims
 
 	def onChoiceMade(self, option):
 		self.selection = option
@@ -223,9 +238,6 @@ class ProsodyAFCWidget(StateWidget):
 	def __repr__(self):
 		return f'<{self.__class__.__name__}(name={self.name}, stimPair={self.stimPair}, earlyOrLate={self.earlyOrLate})>'
 
-	def __setstate__(self, state):
-		self.__init__(state['name'], state['stimPair'], state['earlyOrLate'])
-
 class TimerProgressBar(QtWidgets.QProgressBar):
 	def __init__(self, *args, **kwargs):
 		super().__init__(*args, **kwargs)
@@ -276,7 +288,8 @@ class ProsodyEvalApp(VtEvalApp):
 			'late': 'early'
 		}
 
-		for w in self.widgetStack:
+		for descriptor in self.widgetStack:
+			w = descriptor.materialize()
 			if isinstance(w, ProsodyAFCWidget):
 				if isPostTest and random.random() > 0.65:
 					w.selection = w.earlyOrLate
@@ -287,12 +300,13 @@ class ProsodyEvalApp(VtEvalApp):
 						w.selection = opposites[w.earlyOrLate]
 
 			self.dataLogger.logWidgetCompletion(w)
+			w.deleteLater()
 
 	def initialize(self, arguments):
 		focusStack = self.buildSubStack('focus')
 		phraseStack = self.buildSubStack('phrase')
 
-		self.widgetStack = [ TextInstructionsScreen('instructions', instructions['intro']) ]
+		self.widgetStack = [ WidgetDescriptor(TextInstructionsScreen, 'instructions', text=instructions['intro']) ]
 
 		# counterbalance order of focus vs phrase boundaries
 		if int(arguments['pid']) % 2 == 0:
@@ -326,26 +340,24 @@ class ProsodyEvalApp(VtEvalApp):
 		breakEveryN = len(stack)/(breaks+1)
 		for breakIdx in range(breaks,0,-1):
 			pos = int(breakIdx * breakEveryN)
-			breakWidget = ButtonPromptWidget('break', '<center>Time for a break!<br/><br/>Press the button below when you are ready to continue.</center>')
+			breakWidget = WidgetDescriptor(ButtonPromptWidget, 'break', text='<center>Time for a break!<br/><br/>Press the button below when you are ready to continue.</center>')
 
 			stack.insert(pos, breakWidget)
 
 		videoURL = QtCore.QUrl.fromLocalFile(locateAsset(f'video/{name}.wmv'))
-		stack.insert(0, ButtonPromptWidgetWithVideo('instructions', instructions[name], videoURL=videoURL))
+		stack.insert(0, WidgetDescriptor(ButtonPromptWidgetWithVideo, 'instructions', text=instructions[name], videoURL=videoURL))
 
 		return stack
 
 	def makeStimWidget(self, name, stimPair, earlyOrLate):
-		stimWidget = ProsodyAFCWidget(name=name, stimPair=stimPair, earlyOrLate=earlyOrLate)
-		stimWidget.stimulusBraced.connect(self.prepareStimulus)
-		stimWidget.stimulusTriggered.connect(self.playStimulus)
-
-		return stimWidget
+		# the play order is decided here so it's part of the trial plan
+		swapOrder = random.choice([False, True])
+		return WidgetDescriptor(ProsodyAFCWidget, name, stimPair=stimPair, earlyOrLate=earlyOrLate, swapOrder=swapOrder)
 
 	def loadStimuliFromFolder(self, prefix, earlyLevel, lateLevel):
 		stimSets = {}
 
-		path = Path(locateAsset('vtt'))
+		bank = openVTTBank(locateAsset('vtt'))
 
 		pattern = re.compile(rf'{prefix}(\d\d?)_.*')
 
@@ -354,8 +366,8 @@ class ProsodyEvalApp(VtEvalApp):
 			'late': lateLevel
 		}
 		for levelName,level in levels.items():
-			for f in list(path.glob(f'{prefix}*_pitch{level}_time{level}*.vtt')):
-				match = pattern.match(f.stem)
+			for vtt in bank.glob(f'{prefix}*_pitch{level}_time{level}*.vtt'):
+				match = pattern.match(vtt.filepath.stem)
 				if match is None:
 					continue
 
@@ -363,7 +375,7 @@ class ProsodyEvalApp(VtEvalApp):
 				if not stimSetID in stimSets:
 					stimSets[stimSetID] = StimPair(typeName=prefix, typeIdx=stimSetID)
 
-				setattr(stimSets[stimSetID], f'{levelName}Stim', Stimulus(f, levelName))
+				setattr(stimSets[stimSetID], f'{levelName}Stim', Stimulus(vtt, levelName))
 
 		stimSets = list(stimSets.values())
 		random.shuffle(stimSets)
@@ -1,9 +1,13 @@
+import math
+import time
 import logging
 
 from enum import IntEnum
+from collections import OrderedDict, deque
 
 from PySide2 import QtCore, QtSerialPort
 from vttHex.parseVTT import loadVTTFile, VTTFile
+from vttHex.tools import encodeSampleRuns
 
 class SerialCommand(IntEnum):
 	HEADER           = 0x00
@@ -17,6 +21,28 @@ class SerialCommand(IntEnum):
 	SOUNDBITE        = 0x08
 	PLAY_BITE        = 0x09
 	PING             = 0x0C
+	SOUNDBITE_RLE    = 0x0D
+	SEQUENCE         = 0x0E
+	STREAM_START     = 0x0F
+	STREAM_SAMPLES   = 0x10
+	STREAM_END       = 0x11
+	STREAM_PLAY      = 0x12
+
+# mirrors NUM_SOUNDBITES, MAX_SAMPLES and SOUNDBITE_POOL_SIZE in firmware/src/SoundBite.h
+soundBiteSlotCount = 16
+soundBiteMaxSamples = 14000
+soundBiteCapacity = 32000
+
+# an urgent packet never overtakes these, uploads and stream data must arrive in order
+inOrderCommands = (
+	SerialCommand.SOUNDBITE, SerialCommand.SOUNDBITE_RLE,
+	SerialCommand.STREAM_START, SerialCommand.STREAM_SAMPLES, SerialCommand.STREAM_END, SerialCommand.STREAM_PLAY,
+)
+
+# mirrors STREAM_BUFFER_SIZE and STREAM_HOLD in firmware/src/StreamBuffer.h
+streamBufferCapacity = 2048
+streamHold = 0xFFFF
+maxSamplesPerStreamPacket = 255
 
 preferredDevice = {
 	'vendorID': 4292,
@@ -44,67 +70,874 @@ class SerialInfo(QtSerialPort.QSerialPortInfo):
 def formatPacket_Ping():
 	return bytearray([ SerialCommand.HEADER, SerialCommand.PING ])
 
+def formatPacket_Sequence(sequence):
+	return bytearray([ SerialCommand.HEADER, SerialCommand.SEQUENCE, *sequence.to_bytes(length=2, byteorder='little') ])
+
 def formatPacket_PlayBite(soundBiteID=0):
 	return bytearray([ SerialCommand.HEADER, SerialCommand.PLAY_BITE, soundBiteID ])
 
+def checkSoundBiteLength(vttFile):
+	# the device would silently drop the rest
+	if vttFile.sampleCount > soundBiteMaxSamples:
+		raise ValueError(f'{vttFile} has {vttFile.sampleCount} samples, more than a sound bite holds ({soundBiteMaxSamples})')
+
 def formatPacket_SoundBite(vttFile, soundBiteID=0):
 	if not isinstance(vttFile, VTTFile):
-		vttFile = loadVTTFile(filename)
+		vttFile = loadVTTFile(vttFile)
+
+	checkSoundBiteLength(vttFile)
 
 	lenAsBytes = vttFile.sampleCount.to_bytes(length=4, byteorder='little')
 	periodAsBytes = vttFile.samplePeriod.to_bytes(length=4, byteorder='little')
 
-	return bytearray([
+	packet = bytearray([
 		SerialCommand.HEADER, SerialCommand.SOUNDBITE,
 		soundBiteID,
 		*periodAsBytes, *lenAsBytes,
-		*vttFile.samples
 	])
+	packet += memoryview(vttFile.samples)
+
+	return packet
+
+def formatPacket_SoundBiteRLE(vttFile, soundBiteID=0):
+	if not isinstance(vttFile, VTTFile):
+		vttFile = loadVTTFile(vttFile)
+
+	checkSoundBiteLength(vttFile)
+
+	encodedSamples = encodeSampleRuns(vttFile.samples)
+
+	lenAsBytes = vttFile.sampleCount.to_bytes(length=4, byteorder='little')
+	periodAsBytes = vttFile.samplePeriod.to_bytes(length=4, byteorder='little')
+	encodedLenAsBytes = len(encodedSamples).to_bytes(length=4, byteorder='little')
+
+	packet = bytearray([
+		SerialCommand.HEADER, SerialCommand.SOUNDBITE_RLE,
+		soundBiteID,
+		*periodAsBytes, *lenAsBytes, *encodedLenAsBytes,
+	])
+	packet += encodedSamples
+
+	return packet
+
+def formatPacket_StreamStart(period, leadTime):
+	return bytearray([ SerialCommand.HEADER, SerialCommand.STREAM_START, period, *leadTime.to_bytes(length=2, byteorder='little') ])
+
+def formatPacket_StreamSamples(firstSampleIdx, samples):
+	# `samples` is formatted like VTTFile.samples, 3 bytes each
+	sampleCount = len(samples) // 3
+	packet = bytearray([
+		SerialCommand.HEADER, SerialCommand.STREAM_SAMPLES,
+		*firstSampleIdx.to_bytes(length=4, byteorder='little'),
+		sampleCount,
+	])
+	packet += memoryview(samples)
+
+	return packet
+
+def formatPacket_StreamPlay():
+	return bytearray([ SerialCommand.HEADER, SerialCommand.STREAM_PLAY ])
+
+def formatPacket_StreamEnd(sampleCount):
+	return bytearray([ SerialCommand.HEADER, SerialCommand.STREAM_END, *sampleCount.to_bytes(length=4, byteorder='little') ])
+
+def formatPacket_FreeBite(soundBiteID):
+	# an empty upload releases the slot's share of the device's sample pool
+	return bytearray([
+		SerialCommand.HEADER, SerialCommand.SOUNDBITE,
+		soundBiteID,
+		0, 0, 0, 0, 0, 0, 0, 0,
+	])
+
+class SoundBiteCache:
+	'''
+	Tracks which VTT files are resident in which of the device's sound bite slots
+
+	The device's slots share one pool of samples, so making room for a new bite may
+	evict several of the least recently used ones. A slot can be held unconfirmed until
+	it's known that the device kept its upload. Until then, lookups miss it.
+	'''
+	def __init__(self, slotCount=soundBiteSlotCount, capacity=soundBiteCapacity):
+		self.slotCount = slotCount
+		self.capacity = capacity
+		self.residents = OrderedDict() # key -> (slot, stored sample count), least recently used first
+		self.unconfirmed = {} # slot -> PendingWrite of an upload the device may have dropped
+
+		self.hits = 0
+		self.misses = 0
+
+	def lookup(self, key):
+		if key is not None and key in self.residents and self.residents[key][0] in self.unconfirmed:
+			self.invalidate(self.residents[key][0])
+
+		if key is None or key not in self.residents:
+			self.misses += 1
+			return None
+
+		self.hits += 1
+		self.residents.move_to_end(key)
+		return self.residents[key][0]
+
+	def allocate(self, key, sampleCount):
+		'''Returns the slot to upload into and the other slots that must be freed first'''
+		storedCount = min(sampleCount, soundBiteMaxSamples, self.capacity)
+		evicted = []
+		while len(self.residents) >= self.slotCount or self.usedSamples() + storedCount > self.capacity:
+			(_, (slot, _)) = self.residents.popitem(last=False)
+			self.unconfirmed.pop(slot, None)
+			evicted.append(slot)
+
+		usedSlots = [slot for (slot, _) in self.residents.values()]
+		slot = min(evicted) if len(evicted) > 0 else min(set(range(self.slotCount)) - set(usedSlots))
+		if slot in evicted:
+			evicted.remove(slot)
+
+		if key is not None:
+			self.residents[key] = (slot, storedCount)
+		else:
+			# not cacheable, but the device still holds it until the slot is reused
+			self.residents[object()] = (slot, storedCount)
+
+		return (slot, evicted)
+
+	def markUnconfirmed(self, slot, pendingWrite):
+		self.unconfirmed[slot] = pendingWrite
+
+	def confirm(self, pendingWrite):
+		'''Trusts the slot that `pendingWrite` uploaded into, if it's still waiting on it'''
+		for slot,unconfirmedWrite in self.unconfirmed.items():
+			if unconfirmedWrite is pendingWrite:
+				del self.unconfirmed[slot]
+				return slot
+
+		return None
+
+	def invalidate(self, slot):
+		'''Forgets what's in a slot, but keeps it allocated until it's reused or evicted'''
+		self.unconfirmed.pop(slot, None)
+		for key,(residentSlot, storedCount) in self.residents.items():
+			if residentSlot == slot:
+				del self.residents[key]
+				placeholder = object()
+				self.residents[placeholder] = (slot, storedCount)
+				self.residents.move_to_end(placeholder, last=False)
+				return
+
+	def usedSamples(self):
+		return sum(storedCount for (_, storedCount) in self.residents.values())
+
+	def clear(self):
+		self.residents.clear()
+		self.unconfirmed.clear()
+
+	def __repr__(self):
+		return f'<{self.__class__.__name__}({len(self.residents)} resident, {self.hits} hit(s), {self.misses} miss(es))>'
 
 class SerialError(Exception):
 	def __init__(self, message, qtError):
 		super().__init__(message)
 		self.qtError = qtError
 
-class SerialDevice():
-	def __init__(self, pathOrSerialInfo):
+class PendingWrite:
+	'''Completion handle for bytes queued with SerialDevice.send'''
+	def __init__(self, size, description=''):
+		self.size = size
+		self.description = description
+		self.endOffset = None
+		self.done = False
+		# written while the device was probably still playing a bite, and discarding what it read
+		self.duringPlayback = False
+		self.callbacks = []
+
+		self.queuedTime = time.perf_counter()
+		self.completedTime = None
+
+	def addDoneCallback(self, callback):
+		if self.done:
+			callback(self)
+		else:
+			self.callbacks.append(callback)
+
+	def setDone(self):
+		self.done = True
+		self.completedTime = time.perf_counter()
+		for callback in self.callbacks:
+			callback(self)
+
+		self.callbacks = []
+
+	def __repr__(self):
+		return f'<{self.__class__.__name__}({self.description} {self.size} bytes, done={self.done})>'
+
+def completedWrite(description=''):
+	pendingWrite = PendingWrite(0, description)
+	pendingWrite.setDone()
+
+	return pendingWrite
+
+class AckTracker:
+	'''
+	Matches the device's "ack <sequence> <millis>" and "skip <sequence>" lines to the packets that asked for them
+
+	The device acks a command when it runs it. Uploads and stream data run as they're
+	read, other commands only if they're the last of the batch the device read. Those
+	superseded by a later one, and whatever arrived while the device was busy (e.g.,
+	playing a bite), are answered with "skip" instead. Skipped packets were delivered,
+	so they're counted apart from lost ones.
+
+	The link delivers in order, so an answer for a later sequence number means the
+	earlier ones were lost. Round trips are measured from when a packet finished being
+	written, and the device's clock offset comes from the small packet with the
+	shortest trip.
+	'''
+	# the device doesn't read commands while it's playing a bite or pulsing an actuator
+	ackTimeout = 5.0
+	offsetPacketSize = 64
+
+	def __init__(self, baudRate=115200):
+		self.baudRate = baudRate
+		self.nextSequence = 0
+		self.pending = OrderedDict() # sequence -> PendingWrite, in the order they were written
+
+		self.roundTrips = []
+		self.bestRoundTrip = None
+		self.clockOffset = None # device seconds - host perf_counter() seconds
+		self.dropped = 0
+		self.skipped = 0
+		self.desyncs = 0
+
+	def track(self, pendingWrite):
+		sequence = self.nextSequence
+		self.nextSequence = (self.nextSequence + 1) % 0x10000
+		self.pending[sequence] = pendingWrite
+
+		return sequence
+
+	def onAck(self, sequence, deviceMillis, receivedTime):
+		'''Returns the acknowledged PendingWrite and the number of packets this ack shows were lost'''
+		(pendingWrite, lost) = self.popPending(sequence)
+		if pendingWrite is None:
+			return (None, 0)
+
+		if pendingWrite.completedTime is not None:
+			roundTrip = receivedTime - pendingWrite.completedTime
+			self.roundTrips.append(roundTrip)
+
+			if pendingWrite.size <= self.offsetPacketSize and (self.bestRoundTrip is None or roundTrip < self.bestRoundTrip):
+				self.bestRoundTrip = roundTrip
+				self.clockOffset = deviceMillis/1000 - (pendingWrite.completedTime + receivedTime)/2
+
+		return (pendingWrite, lost)
+
+	def onSkip(self, sequence):
+		'''Returns the PendingWrite the device read but didn't run, and the number of packets lost before it'''
+		(pendingWrite, lost) = self.popPending(sequence)
+		if pendingWrite is not None:
+			self.skipped += 1
+
+		return (pendingWrite, lost)
+
+	def popPending(self, sequence):
+		if sequence not in self.pending:
+			self.desyncs += 1
+			return (None, 0)
+
+		lost = 0
+		(pendingSequence, pendingWrite) = self.pending.popitem(last=False)
+		while pendingSequence != sequence:
+			lost += 1
+			(pendingSequence, pendingWrite) = self.pending.popitem(last=False)
+
+		self.dropped += lost
+		return (pendingWrite, lost)
+
+	def onOutOfSync(self):
+		self.desyncs += 1
+
+	def checkTimeouts(self, now):
+		'''Drops and returns the number of packets whose acks are overdue'''
+		expired = [
+			sequence for sequence,pendingWrite in self.pending.items()
+			if pendingWrite.completedTime is not None and now - pendingWrite.completedTime > self.ackTimeout + pendingWrite.size*10/self.baudRate
+		]
+		for sequence in expired:
+			del self.pending[sequence]
+
+		self.dropped += len(expired)
+		return len(expired)
+
+	def toDeviceTime(self, hostTime):
+		if self.clockOffset is None:
+			return None
+
+		return hostTime + self.clockOffset
+
+	def reset(self):
+		self.pending.clear()
+
+	def summary(self):
+		if len(self.roundTrips) == 0:
+			return f'no acks, {self.skipped} skipped, {self.dropped} dropped, {self.desyncs} desync(s)'
+
+		roundTrips = sorted(self.roundTrips)
+		median = roundTrips[len(roundTrips)//2] * 1000
+		return f'{len(roundTrips)} acks, rtt median={median:.1f}ms max={roundTrips[-1]*1000:.1f}ms, {self.skipped} skipped, {self.dropped} dropped, {self.desyncs} desync(s)'
+
+class StreamReport:
+	'''The counters a device reports when a timestamped stream ends (see firmware/src/StreamBuffer.h)'''
+	fields = ['played', 'underruns', 'late', 'gaps', 'overflows', 'maxDepth']
+
+	def __init__(self, played, underruns, late, gaps, overflows, maxDepth):
+		self.played = played
+		self.underruns = underruns
+		self.late = late
+		self.gaps = gaps
+		self.overflows = overflows
+		self.maxDepth = maxDepth
+
+	@staticmethod
+	def parse(line):
+		try:
+			return StreamReport(*[int(value) for value in line.split()[1:]])
+		except (ValueError, TypeError):
+			return None
+
+	def isClean(self):
+		return self.underruns == 0 and self.late == 0 and self.gaps == 0 and self.overflows == 0
+
+	def __repr__(self):
+		values = ', '.join(f'{field}={getattr(self, field)}' for field in StreamReport.fields)
+		return f'<{self.__class__.__name__}({values})>'
+
+class SerialDevice(QtCore.QObject):
+	'''
+	Queues packets for the port and tracks when they've been handed off to the OS
+
+	Packets are written to the QSerialPort only while fewer than maxOutstandingBytes
+	are waiting on its bytesWritten signal. Urgent packets skip ahead of whatever hasn't
+	been written yet, except uploads and stream data (see inOrderCommands). send()
+	returns a PendingWrite that completes once its last byte has been written.
+
+	The device only runs the last command of each batch it reads, so PLAY_BITE is never
+	urgent: anything written after it could arrive in the same batch and replace it.
+
+	Files longer than a sound bite are played from the device's stream buffer instead,
+	in chunks of half its size. sendFile() fills the buffer with the first two, play()
+	starts it, and each chunk is replaced with the one after next once it has played.
+	'''
+	uploadComplete = QtCore.Signal(object)
+	playSent = QtCore.Signal(object)
+	acknowledged = QtCore.Signal(object)
+	writeFailed = QtCore.Signal(object)
+	linkProblem = QtCore.Signal(str)
+	streamReported = QtCore.Signal(object)
+
+	maxOutstandingBytes = 4096
+	streamInterval = 20
+	chunkSize = streamBufferCapacity // 2
+	# how long after a chunk should have played to send the next one over it
+	chunkRefillDelay = .1
+	# how long after a bite should have played the device may still be playing it, for the
+	# link's latency and timers that fire early
+	playbackMargin = .25
+
+	def __init__(self, pathOrSerialInfo, compressSoundBites=False, acknowledge=False):
+		super().__init__()
+
 		if not isinstance(pathOrSerialInfo, SerialInfo):
-			pathOrSerialInfo = getPortInfoByLocation(pathOrSerialInfo)
+			portInfo = getPortInfoByLocation(pathOrSerialInfo)
+		else:
+			portInfo = pathOrSerialInfo
 
-		self.port = QtSerialPort.QSerialPort(pathOrSerialInfo)
+		if portInfo is not None:
+			self.port = QtSerialPort.QSerialPort(portInfo)
+		else:
+			# not an enumerated port (e.g., a pty), open it by name
+			self.port = QtSerialPort.QSerialPort()
+			self.port.setPortName(str(pathOrSerialInfo))
 		self.port.setBaudRate(115200)
+		self.port.bytesWritten.connect(self.onBytesWritten)
+		self.port.readyRead.connect(self.onReadyRead)
+		self.readBuffer = bytearray()
+
+		# with acks on, every packet is prefixed with a sequence number for the device to echo
+		self.ackTracker = None
+		if acknowledge:
+			self.ackTracker = AckTracker(115200)
+			self.ackTimer = QtCore.QTimer(self)
+			self.ackTimer.setInterval(1000)
+			self.ackTimer.timeout.connect(self.checkAcks)
+			self.ackTimer.start()
+
 		self.lastFile = None
+		self.lastSoundBiteID = 0
+		self.lastUpload = None
+		self.compressSoundBites = compressSoundBites
+		self.soundBites = SoundBiteCache()
+		self.uploads = {} # soundBiteID -> PendingWrite of the upload that filled it
+		self.biteDurations = {} # soundBiteID -> seconds
+		self.playCount = 0
+		self.playingUntil = 0
+		self.lastPlay = None
+
+		self.heldPrefetches = []
+		self.prefetchTimer = QtCore.QTimer(self)
+		self.prefetchTimer.setSingleShot(True)
+		self.prefetchTimer.setTimerType(QtCore.Qt.PreciseTimer)
+		self.prefetchTimer.timeout.connect(lambda: self.sendDeferred(self.sendHeldPrefetches))
+
+		self.writeQueue = deque()
+		self.inFlight = deque()
+		self.queueEmptyCallbacks = []
+		self.bytesQueued = 0
+		self.bytesFlushed = 0
+
+		self.streamedFile = None
+		self.streamPrefill = None
+		self.streamTimer = QtCore.QTimer(self)
+		self.streamTimer.setInterval(self.streamInterval)
+		self.streamTimer.timeout.connect(lambda: self.sendDeferred(self.pumpStream))
 
 	def open(self):
+		# a fresh connection may be to a device that was reset
+		self.soundBites.clear()
+		self.uploads.clear()
+		self.resetWriteQueue()
+		if self.ackTracker is not None:
+			self.ackTracker.reset()
+
 		return self.port.open(QtCore.QIODevice.ReadWrite)
 
 	def close(self):
+		self.streamTimer.stop()
+		self.prefetchTimer.stop()
+		self.heldPrefetches = []
+		self.streamedFile = None
+		self.streamPrefill = None
 		self.port.close()
+		self.resetWriteQueue()
+
+	def formatSoundBite(self, vttFile, soundBiteID=0):
+		if self.compressSoundBites:
+			return formatPacket_SoundBiteRLE(vttFile, soundBiteID)
+		else:
+			return formatPacket_SoundBite(vttFile, soundBiteID)
 
 	def playFile(self, vttFile):
-		self.send(formatPacket_SoundBite(vttFile))
-		self.send(formatPacket_PlayBite())
+		self.sendFile(vttFile)
+		self.play()
 
 	def sendFile(self, vttFile):
+		if not isinstance(vttFile, VTTFile):
+			vttFile = loadVTTFile(vttFile)
+
 		self.lastFile = vttFile
-		logging.info(f'Send {vttFile}')
-		self.send(formatPacket_SoundBite(vttFile))
+		if vttFile.sampleCount > soundBiteMaxSamples:
+			self.lastSoundBiteID = None
+			self.lastUpload = self.prepareChunks(vttFile)
+		else:
+			self.lastSoundBiteID = self.upload(vttFile)
+			self.lastUpload = self.uploads[self.lastSoundBiteID]
+
+		return self.lastUpload
+
+	def prefetchFile(self, vttFile):
+		'''
+		Makes sure a file is resident on the device without making it the one play() uses
+
+		The device discards whatever arrives while it plays a bite, so the upload is held
+		back until the last bite has played, and None is returned instead. The prefetched
+		slot is only trusted once the device acknowledges the upload, or without acks, if
+		no bite was played while it was written.
+		'''
+		if not isinstance(vttFile, VTTFile):
+			vttFile = loadVTTFile(vttFile)
+
+		if vttFile.sampleCount > soundBiteMaxSamples:
+			# the stream buffer may still be playing, sendFile() fills it instead
+			return completedWrite(str(vttFile))
+
+		remaining = self.getPlaybackRemaining()
+		if remaining > 0:
+			logging.info(f'Holding back prefetch of {vttFile} for {remaining*1000:.0f}ms while a bite plays')
+			if vttFile not in self.heldPrefetches:
+				self.heldPrefetches.append(vttFile)
+			self.prefetchTimer.start(math.ceil(remaining * 1000))
+			return None
+
+		soundBiteID = self.upload(vttFile)
+		pendingWrite = self.uploads[soundBiteID]
+		if not pendingWrite.done:
+			self.soundBites.markUnconfirmed(soundBiteID, pendingWrite)
+			if self.ackTracker is None:
+				playCount = self.playCount
+				pendingWrite.addDoneCallback(lambda pendingWrite: self.onPrefetchWritten(soundBiteID, pendingWrite, playCount))
+
+		return pendingWrite
+
+	def sendHeldPrefetches(self):
+		(heldPrefetches, self.heldPrefetches) = (self.heldPrefetches, [])
+		for vttFile in heldPrefetches:
+			self.prefetchFile(vttFile)
+
+	def getPlaybackRemaining(self):
+		'''Seconds until the device is done with the last bite it was sent, including playbackMargin'''
+		if self.lastPlay is not None and not self.lastPlay.done:
+			# not even written yet, check again once it may have been
+			return self.playbackMargin
+
+		return max(0, self.playingUntil + self.playbackMargin - time.perf_counter())
+
+	def onPrefetchWritten(self, soundBiteID, pendingWrite, playCount):
+		if playCount == self.playCount and not pendingWrite.duringPlayback:
+			self.soundBites.confirm(pendingWrite)
+
+		elif self.soundBites.unconfirmed.get(soundBiteID) is pendingWrite:
+			logging.warning(f'{pendingWrite} may have arrived while a bite was playing, it will be sent again')
+			self.soundBites.invalidate(soundBiteID)
+			self.uploads.pop(soundBiteID, None)
 
-	def play(self):
-		logging.info(f'Play {self.lastFile}')
-		self.send(formatPacket_PlayBite())
+	def upload(self, vttFile):
+		# files without a path can't be told apart, so they're always uploaded
+		key = None if vttFile.filepath is None else str(vttFile.filepath)
+		soundBiteID = self.soundBites.lookup(key)
+		if soundBiteID is not None:
+			logging.info(f'{vttFile} already in slot {soundBiteID}')
+			self.uploads.setdefault(soundBiteID, completedWrite(str(vttFile)))
+			return soundBiteID
+
+		(soundBiteID, evicted) = self.soundBites.allocate(key, vttFile.sampleCount)
+		for evictedID in evicted:
+			self.uploads.pop(evictedID, None)
+			self.send(formatPacket_FreeBite(evictedID))
+
+		logging.info(f'Send {vttFile} to slot {soundBiteID}')
+		self.biteDurations[soundBiteID] = vttFile.getDuration() / 1000
+		pendingWrite = self.send(self.formatSoundBite(vttFile, soundBiteID), f'upload {vttFile}')
+		pendingWrite.addDoneCallback(lambda pendingWrite: self.onUploadComplete(vttFile, pendingWrite))
+		self.uploads[soundBiteID] = pendingWrite
+
+		return soundBiteID
+
+	def onUploadComplete(self, vttFile, pendingWrite):
+		logging.info(f'Upload of {vttFile} written after {(pendingWrite.completedTime - pendingWrite.queuedTime)*1000:.1f}ms')
+		self.uploadComplete.emit(vttFile)
+
+	def play(self, soundBiteID=None):
+		if soundBiteID is None:
+			soundBiteID = self.lastSoundBiteID
+
+		if soundBiteID is None:
+			return self.playChunks()
+
+		logging.info(f'Play {self.lastFile} from slot {soundBiteID}')
+		pendingWrite = self.send(formatPacket_PlayBite(soundBiteID), 'play')
+		pendingWrite.addDoneCallback(self.playSent.emit)
+		self.lastPlay = pendingWrite
+
+		return pendingWrite
+
+	def playWhenUploaded(self):
+		'''
+		Sends PLAY_BITE once the last upload and everything queued after it have been written
+
+		Returns True if the upload was already complete and the bite was played right away
+		'''
+		if (self.lastUpload is None or self.lastUpload.done) and len(self.writeQueue) == 0:
+			self.play()
+			return True
+
+		soundBiteID = self.lastSoundBiteID
+		logging.info(f'Deferring play until {self.lastUpload} and the write queue complete')
+		if self.lastUpload is None:
+			self.whenQueueEmpty(lambda: self.sendDeferred(lambda: self.play(soundBiteID)))
+		else:
+			self.lastUpload.addDoneCallback(lambda _: self.whenQueueEmpty(lambda: self.sendDeferred(lambda: self.play(soundBiteID))))
+
+		return False
+
+	def whenQueueEmpty(self, callback):
+		if len(self.writeQueue) == 0:
+			callback()
+		else:
+			self.queueEmptyCallbacks.append(callback)
 
 	def ping(self):
-		self.send(formatPacket_Ping())
+		return self.send(formatPacket_Ping(), 'ping')
+
+	def streamFile(self, vttFile, leadTime=.25):
+		'''
+		Plays a file by streaming timestamped samples instead of uploading a sound bite
+
+		The device plays each sample `leadTime` seconds after the first one arrived,
+		plus its offset in the file, so delays in writing them don't reach the arm as
+		long as they're shorter than the lead time. Samples are sent as they come within
+		`leadTime` of being due, which keeps the device's buffer at about twice that, and
+		files of any length can be played. The device's counters arrive on
+		streamReported once it has played the last sample.
+		'''
+		if not isinstance(vttFile, VTTFile):
+			vttFile = loadVTTFile(vttFile)
+
+		leadSamples = int(leadTime * 1000 / vttFile.samplePeriod)
+		if 2 * leadSamples >= streamBufferCapacity:
+			raise ValueError(f'A lead time of {leadTime}s needs more than the device\'s {streamBufferCapacity} buffered samples')
+
+		self.startStream(vttFile, leadTime, None)
+		self.streamStartTime = time.perf_counter()
+
+		logging.info(f'Stream {vttFile} with {leadTime*1000:.0f}ms lead')
+		pendingWrite = self.send(formatPacket_StreamStart(vttFile.samplePeriod, int(leadTime * 1000)), f'stream {vttFile}', urgent=True)
+		self.pumpStream()
+		if self.streamedFile is not None:
+			self.streamTimer.start()
+
+		return pendingWrite
+
+	def prepareChunks(self, vttFile):
+		'''Fills the device's stream buffer with the first two chunks of a long file, for play() to start'''
+		self.startStream(vttFile, None, self.chunkSize)
+
+		logging.info(f'Send first chunks of {vttFile} ({vttFile.sampleCount} samples)')
+		self.send(formatPacket_StreamStart(vttFile.samplePeriod, streamHold), f'stream {vttFile}')
+		self.streamPrefill = self.pumpStream()
+
+		return self.streamPrefill
 
-	def send(self, bytes):
+	def playChunks(self):
+		if self.streamPrefill is None:
+			logging.warning(f'No chunks of {self.lastFile} waiting to be played')
+			return completedWrite('play')
+
+		logging.info(f'Play {self.lastFile} from the stream buffer')
+		# jumping ahead of the prefill would start the device on an empty buffer
+		pendingWrite = self.send(formatPacket_StreamPlay(), 'play', urgent=self.streamPrefill.done)
+		self.streamPrefill = None
+		pendingWrite.addDoneCallback(self.playSent.emit)
+		pendingWrite.addDoneCallback(self.onChunksStarted)
+
+		return pendingWrite
+
+	def onChunksStarted(self, pendingWrite):
+		if self.streamedFile is not None:
+			self.streamStartTime = pendingWrite.completedTime
+			self.streamTimer.start()
+
+	def startStream(self, vttFile, leadTime, chunkSize):
+		self.streamTimer.stop()
+		self.streamedFile = vttFile
+		self.streamedCount = 0
+		self.streamLeadTime = leadTime
+		self.streamChunkSize = chunkSize
+		self.streamStartTime = None
+		self.streamPrefill = None
+
+	def getStreamDueCount(self):
+		vttFile = self.streamedFile
+		if self.streamChunkSize is None:
+			elapsed = time.perf_counter() - self.streamStartTime
+			return int((elapsed + self.streamLeadTime) * 1000 / vttFile.samplePeriod) + 1
+
+		# one chunk playing and one waiting, and a chunk is only overwritten once it has played
+		chunkCount = 2
+		if self.streamStartTime is not None:
+			chunkDuration = self.streamChunkSize * vttFile.samplePeriod / 1000
+			elapsed = time.perf_counter() - self.streamStartTime - self.chunkRefillDelay
+			chunkCount += max(0, int(elapsed / chunkDuration))
+
+		return chunkCount * self.streamChunkSize
+
+	def pumpStream(self):
+		if self.streamedFile is None:
+			return None
+
+		vttFile = self.streamedFile
+		dueCount = min(vttFile.sampleCount, self.getStreamDueCount())
+
+		pendingWrite = None
+		while self.streamedCount < dueCount:
+			chunkEnd = min(dueCount, self.streamedCount + maxSamplesPerStreamPacket)
+			samples = vttFile.samples[self.streamedCount*3:chunkEnd*3]
+			pendingWrite = self.send(formatPacket_StreamSamples(self.streamedCount, samples))
+			self.streamedCount = chunkEnd
+
+		if self.streamedCount >= vttFile.sampleCount:
+			pendingWrite = self.send(formatPacket_StreamEnd(vttFile.sampleCount))
+			self.streamTimer.stop()
+			self.streamedFile = None
+
+		return pendingWrite
+
+	def stopStream(self):
+		'''Stops sending the current stream. The device stops once it has played what it has.'''
+		if self.streamedFile is not None:
+			self.send(formatPacket_StreamEnd(self.streamedCount))
+
+		self.streamTimer.stop()
+		self.streamedFile = None
+		self.streamPrefill = None
+
+	def send(self, bytes, description='', urgent=False):
 		if not self.port.isOpen():
 			self.open()
 			if self.port.error() != QtSerialPort.QSerialPort.SerialPortError.NoError:
 				raise SerialError('Failed to open port', self.port.error())
 
-		logging.info(f'Send {len(bytes)} bytes {list(bytes[:32])}{" ..." if len(bytes) > 32 else ""}')
+		pendingWrite = PendingWrite(len(bytes), description)
+		if urgent:
+			# ahead of anything not yet written, but behind uploads and stream data
+			insertIdx = 0
+			for (idx, (queuedBytes, _)) in enumerate(self.writeQueue):
+				if queuedBytes[1] in inOrderCommands:
+					insertIdx = idx + 1
+
+			self.writeQueue.insert(insertIdx, (bytes, pendingWrite))
+		else:
+			self.writeQueue.append((bytes, pendingWrite))
+		self.pumpWriteQueue()
+
+		return pendingWrite
+
+	def sendDeferred(self, sendFunction):
+		# called from Qt signal handlers, where a SerialError would go nowhere
+		try:
+			sendFunction()
+		except SerialError as exc:
+			logging.error(f'Deferred write failed: {exc}')
+			self.writeFailed.emit(exc)
+
+	def pumpWriteQueue(self):
+		while len(self.writeQueue) > 0 and self.bytesQueued - self.bytesFlushed < self.maxOutstandingBytes:
+			(bytes, pendingWrite) = self.writeQueue.popleft()
+			self.trackPlayback(bytes, pendingWrite)
+			if self.ackTracker is not None:
+				# numbered as they're written, so urgent packets don't look out of order
+				bytes = formatPacket_Sequence(self.ackTracker.track(pendingWrite)) + bytes
+
+			logging.info(f'Send {len(bytes)} bytes {list(bytes[:32])}{" ..." if len(bytes) > 32 else ""}')
+
+			self.port.write(bytes)
+			if self.port.error() != QtSerialPort.QSerialPort.SerialPortError.NoError:
+				self.soundBites.clear()
+				self.uploads.clear()
+				raise SerialError('Failed to write to port', self.port.error())
+
+			self.bytesQueued += len(bytes)
+			pendingWrite.endOffset = self.bytesQueued
+			self.inFlight.append(pendingWrite)
+
+	def trackPlayback(self, bytes, pendingWrite):
+		now = time.perf_counter()
+		if bytes[1] == SerialCommand.PLAY_BITE:
+			duration = self.biteDurations.get(bytes[2], 0)
+			self.playCount += 1
+			self.playingUntil = now + duration
+			# the device starts once the packet is out of the port's buffers, not when it went in
+			pendingWrite.addDoneCallback(lambda pendingWrite: self.setPlayingUntil(pendingWrite.completedTime + duration))
+		elif bytes[1] in (SerialCommand.SOUNDBITE, SerialCommand.SOUNDBITE_RLE) and now < self.playingUntil + self.playbackMargin:
+			pendingWrite.duringPlayback = True
+
+	def setPlayingUntil(self, playingUntil):
+		self.playingUntil = max(self.playingUntil, playingUntil)
+
+	def onBytesWritten(self, count):
+		self.bytesFlushed += count
+		while len(self.inFlight) > 0 and self.inFlight[0].endOffset <= self.bytesFlushed:
+			self.inFlight.popleft().setDone()
+
+		self.sendDeferred(self.pumpWriteQueue)
+
+		if len(self.writeQueue) == 0:
+			(callbacks, self.queueEmptyCallbacks) = (self.queueEmptyCallbacks, [])
+			for callback in callbacks:
+				callback()
+
+	def onReadyRead(self):
+		self.readBuffer += bytes(self.port.readAll())
+		while b'\n' in self.readBuffer:
+			(line, _, self.readBuffer) = self.readBuffer.partition(b'\n')
+			self.onLineReceived(line.decode(errors='replace').strip(), time.perf_counter())
+
+	def onLineReceived(self, line, receivedTime):
+		if line.startswith('ack ') and self.ackTracker is not None:
+			try:
+				(sequence, deviceMillis) = [int(value) for value in line.split()[1:3]]
+			except ValueError:
+				logging.warning(f'Malformed ack: {line}')
+				return
+
+			(pendingWrite, lost) = self.ackTracker.onAck(sequence, deviceMillis, receivedTime)
+			if pendingWrite is not None:
+				self.soundBites.confirm(pendingWrite)
+				self.acknowledged.emit(pendingWrite)
+
+			if lost > 0:
+				self.reportLinkProblem(f'{lost} packet(s) before #{sequence} were not acknowledged')
+
+		elif line.startswith('skip ') and self.ackTracker is not None:
+			try:
+				sequence = int(line.split()[1])
+			except ValueError:
+				logging.warning(f'Malformed skip: {line}')
+				return
+
+			(pendingWrite, lost) = self.ackTracker.onSkip(sequence)
+			if pendingWrite is not None:
+				logging.warning(f'Device skipped {pendingWrite}')
+				self.onWriteSkipped(pendingWrite)
+
+			if lost > 0:
+				self.reportLinkProblem(f'{lost} packet(s) before #{sequence} were not acknowledged')
+
+		elif line.startswith('out of sync'):
+			if self.ackTracker is not None:
+				self.ackTracker.onOutOfSync()
+				self.reportLinkProblem(f'Device reported "{line}"')
+			else:
+				logging.warning(f'Device: {line}')
+
+		elif line.startswith('stream '):
+			report = StreamReport.parse(line)
+			if report is None:
+				logging.warning(f'Malformed stream report: {line}')
+				return
+
+			if report.isClean():
+				logging.info(f'Stream played cleanly: {report}')
+			else:
+				logging.warning(f'Stream had problems: {report}')
+
+			self.streamReported.emit(report)
+
+		elif len(line) > 0:
+			logging.info(f'Device: {line}')
+
+	def onWriteSkipped(self, pendingWrite):
+		# a skipped upload didn't fill its slot
+		for soundBiteID,upload in list(self.uploads.items()):
+			if upload is pendingWrite:
+				self.soundBites.invalidate(soundBiteID)
+				del self.uploads[soundBiteID]
+
+	def checkAcks(self):
+		expired = self.ackTracker.checkTimeouts(time.perf_counter())
+		if expired > 0:
+			self.reportLinkProblem(f'{expired} packet(s) not acknowledged within {self.ackTracker.ackTimeout}s')
+
+	def reportLinkProblem(self, message):
+		logging.error(f'Serial link problem: {message}')
+
+		# a lost upload would leave the cache pointing at a slot that wasn't filled
+		self.soundBites.clear()
+		self.uploads.clear()
+		self.linkProblem.emit(message)
+
+	def resetWriteQueue(self):
+		self.writeQueue.clear()
+		self.inFlight.clear()
+		self.queueEmptyCallbacks = []
+		self.bytesQueued = 0
+		self.bytesFlushed = 0
 
-		self.port.write(bytes)
-		if self.port.error() != QtSerialPort.QSerialPort.SerialPortError.NoError:
-			raise SerialError('Failed to write to port', self.port.error())
+	def getOutstandingByteCount(self):
+		return self.bytesQueued - self.bytesFlushed + sum(len(bytes) for (bytes, _) in self.writeQueue)
@@ -1,6 +1,9 @@
-import pickle
+import os
 import sys
+import time
+import queue
 import datetime
+import threading
 from pathlib import Path
 import csv
 import random
@@ -17,14 +20,9 @@ import argparseqt.gui
 
 from . import serial
 from .asset import locateAsset
+from .journal import SessionJournal, decodeClass
 from .ui import SerialSelector
-from vttHex.parseVTT import loadVTTFile
-
-unserializableClasses = [
-	QtCore.QObject,
-	QtCore.SignalInstance,
-	QtMultimedia.QSoundEffect
-]
+from vttHex.parseVTT import mapVTTFile, VTTFile
 
 gamepadButtonMap = {
 	Button.SOUTH: QtCore.Qt.Key_Space,
@@ -35,20 +33,6 @@ gamepadButtonMap = {
 	Button.RIGHT: QtCore.Qt.Key_D,
 }
 
-def isSerializable(value):
-	if isinstance(value, list):
-		for subValue in value:
-			if not isSerializable(subValue):
-				return False
-		else:
-			return True
-
-	for class_ in unserializableClasses:
-		if isinstance(value, class_):
-			return False
-
-	return True
-
 def nowStamp(safeChars=False):
 	now = datetime.datetime.now()
 	now = now.strftime('%Y-%m-%dT%H:%M:%S') + ('-%03d' % (now.microsecond / 1000))
@@ -58,6 +42,42 @@ def nowStamp(safeChars=False):
 
 	return now
 
+class TrialTimeline:
+	'''
+	perf_counter_ns() timestamps of the host and device events in one trial
+
+	Events that happen more than once in a trial (e.g., the two stimuli of a prosody
+	trial) keep their last timestamp.
+	'''
+	events = ['started', 'stimulusBraced', 'uploadComplete', 'playRequested', 'playSent', 'deviceAck', 'buttonsEnabled', 'choiceMade']
+	intervals = {
+		'rt_ms': ('buttonsEnabled', 'choiceMade'),
+		'upload_ms': ('stimulusBraced', 'uploadComplete'),
+		'play_wait_ms': ('playRequested', 'playSent'),
+		'ack_rtt_ms': ('playSent', 'deviceAck'),
+	}
+	fieldNames = [f'{event}_ns' for event in events] + list(intervals.keys())
+
+	def __init__(self):
+		self.times = {}
+
+	def mark(self, event):
+		self.times[event] = time.perf_counter_ns()
+
+	def elapsedMS(self, startEvent, endEvent):
+		if startEvent not in self.times or endEvent not in self.times:
+			return None
+
+		return (self.times[endEvent] - self.times[startEvent]) / 1e6
+
+	def asRecord(self):
+		record = {f'{event}_ns': self.times.get(event) for event in self.events}
+		for name,(startEvent, endEvent) in self.intervals.items():
+			elapsed = self.elapsedMS(startEvent, endEvent)
+			record[name] = None if elapsed is None else f'{elapsed:.3f}'
+
+		return record
+
 class VtEvalApp():
 	def __init__(self, appName):
 		self.app = QtWidgets.QApplication()
@@ -77,6 +97,8 @@ class VtEvalApp():
 		''')
 
 		self.currentStateWidget = None
+		self.currentDescriptor = None
+		self.timeline = TrialTimeline()
 		self.arguments = {}
 		self.widgetStack = []
 
@@ -85,6 +107,7 @@ class VtEvalApp():
 		self.window.setContentsMargins(100, 50, 100, 50)
 
 		self.lastInstructionsScreen = None
+		self.journal = None
 
 		self.progressBar = QtWidgets.QProgressBar()
 		self.window.layout().addWidget(self.progressBar)
@@ -129,6 +152,9 @@ class VtEvalApp():
 		self.popNextState()
 
 	def onAboutToQuit(self):
+		if self.device is not None and self.device.ackTracker is not None:
+			logging.info(f'Serial acks: {self.device.ackTracker.summary()}')
+
 		if self.dataLogger is not None:
 			self.dataLogger.close()
 
@@ -138,10 +164,16 @@ class VtEvalApp():
 		except:
 			pass
 
-		if self.dataLogger is not None:
-			self.dataLogger.logWidgetCompletion(finishedWidget)
+		self.timeline.mark('choiceMade')
 
-		self.saveState()
+		# only journal the item as completed once its data row has been written
+		planIndex = finishedWidget.planIndex
+		remainingCount = len(self.widgetStack)
+		checkpoint = lambda: self.saveState(planIndex, finishedWidget.name, remainingCount)
+		if self.dataLogger is not None:
+			self.dataLogger.logWidgetCompletion(finishedWidget, self.timeline, afterWrite=checkpoint)
+		else:
+			checkpoint()
 
 		if len(self.widgetStack) > 0:
 			self.popNextState()
@@ -156,16 +188,28 @@ class VtEvalApp():
 		self.progressBar.setValue(progressValue)
 		logging.info(f'Progress at {progressValue}/{self.progressBar.maximum()}')
 
-		if isinstance(self.currentStateWidget, InstructionsScreen):
-			self.lastInstructionsScreen = self.currentStateWidget
+		if self.currentDescriptor is not None and self.currentDescriptor.isInstructions():
+			self.lastInstructionsScreen = self.currentDescriptor
 
 		while self.window.layout().count() > 1:
 			widget = self.window.layout().takeAt(1).widget()
 			widget.setParent(None)
+			widget.deleteLater()
 
-		self.currentStateWidget = self.widgetStack.pop(0)
+		self.currentDescriptor = self.widgetStack.pop(0)
+		self.currentStateWidget = self.currentDescriptor.materialize()
 		self.window.layout().addWidget(self.currentStateWidget)
 		self.currentStateWidget.finished.connect(lambda: self.onStateWidgetFinished(self.currentStateWidget))
+		self.currentStateWidget.awaitingResponse.connect(self.onAwaitingResponse)
+
+		if hasattr(self.currentStateWidget, 'stimulusBraced'):
+			self.currentStateWidget.stimulusBraced.connect(self.prepareStimulus)
+
+		if hasattr(self.currentStateWidget, 'stimulusTriggered'):
+			self.currentStateWidget.stimulusTriggered.connect(self.playStimulus)
+
+		self.timeline = TrialTimeline()
+		self.timeline.mark('started')
 
 		logging.info(f'Current widget = {self.currentStateWidget}')
 
@@ -185,6 +229,11 @@ class VtEvalApp():
 		parser.add_argument('--condition', type=str)
 		parser.add_argument('--device', type=str)
 		parser.add_argument('--simulate', action='store_true')
+		parser.add_argument('--compress', action='store_true', help='upload stimuli run-length encoded (needs matching firmware)')
+		parser.add_argument('--ack', action='store_true', help='have the device acknowledge every packet and treat missing acks as errors')
+		parser.add_argument('--fsync-every', type=int, default=0, help='fsync the data file every N records (0 = off)')
+		parser.add_argument('--fsync-interval', type=float, default=0, help='fsync the data file every N seconds while records are pending (0 = off)')
+		parser.add_argument('--no-fsync-on-breaks', action='store_true', help="don't fsync the data file when a break screen is finished")
 
 		self.arguments = argparseqt.groupingTools.parseIntoGroups(parser)
 
@@ -201,11 +250,12 @@ class VtEvalApp():
 	def execute(self):
 		self.parseArgs()
 
-		self.device = serial.SerialDevice(self.arguments['device'])
+		self.device = self.createDevice(self.arguments['device'])
 
 		self.startDataLogger()
 		self.startLogger()
 
+		self.journal = SessionJournal(self.getSaveStatePath())
 		if self.openState():
 			logging.warning(f'Resuming from saved state {self.getSaveStatePath()}')
 
@@ -215,28 +265,26 @@ class VtEvalApp():
 				self.widgetStack.insert(0, self.lastInstructionsScreen)
 				restoredText = 'The last instructions you saw will be repeated on the next screen.'
 
-			self.widgetStack.insert(0, ButtonPromptWidget(name='restore', text=f'<center>Your session has been restored!<br/><br/>{restoredText}<br/><br/><p style="font-size: 10pt">State file: <span style="font-family: \'Courier New\', Courier, monospace;">{self.getSaveStatePath()}</span></p></center>'))
-
-			for widget in self.widgetStack:
-				if hasattr(widget, 'stimulusBraced'):
-					widget.stimulusBraced.connect(self.prepareStimulus)
-
-				if hasattr(widget, 'stimulusTriggered'):
-					widget.stimulusTriggered.connect(self.playStimulus)
+			self.widgetStack.insert(0, WidgetDescriptor(ButtonPromptWidget, name='restore', text=f'<center>Your session has been restored!<br/><br/>{restoredText}<br/><br/><p style="font-size: 10pt">State file: <span style="font-family: \'Courier New\', Courier, monospace;">{self.getSaveStatePath()}</span></p></center>'))
 
 		else:
 			logging.info(f'Starting fresh')
 			self.initialize(self.arguments)
-			self.widgetStack.append(KeyPromptWidget(name='finished', text='<center>You are finished!<br/><br/>Please let the facilitator know.</center>', dismissKey=QtCore.Qt.Key_F4))
+			self.widgetStack.append(WidgetDescriptor(KeyPromptWidget, name='finished', text='<center>You are finished!<br/><br/>Please let the facilitator know.</center>', dismissKey=int(QtCore.Qt.Key_F4)))
 
-		for idx,widget in enumerate(self.widgetStack):
-			logging.info(f'self.widgetStack[{idx}] = {widget}')
+			for idx,descriptor in enumerate(self.widgetStack):
+				descriptor.planIndex = idx
+			self.journal.start(self.widgetStack)
+
+		for idx,descriptor in enumerate(self.widgetStack):
+			logging.info(f'self.widgetStack[{idx}] = {descriptor}')
 
 		self.window.showFullScreen()
 		QtCore.QTimer.singleShot(0, self.onStarted)
 
 		if self.arguments['simulate']:
 			self.simulate()
+			self.dataLogger.close()
 		else:
 			self.gamepadDaemon.start()
 			self.app.exec_()
@@ -259,10 +307,23 @@ class VtEvalApp():
 		logging.info(f'Log started at = {logPath}')
 		logging.info(f'Data log path  = {self.dataLogger.path}')
 
+	def createDevice(self, pathOrSerialInfo):
+		device = serial.SerialDevice(
+			pathOrSerialInfo,
+			compressSoundBites=self.arguments.get('compress', False),
+			acknowledge=self.arguments.get('ack', False)
+		)
+		device.writeFailed.connect(lambda exc: self.handleSerialError())
+		device.linkProblem.connect(lambda message: self.handleSerialError())
+		device.playSent.connect(lambda pendingWrite: self.timeline.mark('playSent'))
+		device.acknowledged.connect(self.onDeviceAcknowledged)
+
+		return device
+
 	def connectNewDevice(self, device):
 		logging.info(f'Connect to {device}')
 
-		self.device = serial.SerialDevice(device)
+		self.device = self.createDevice(device)
 		if self.device.open():
 			self.serialErrorWidget.enableButton()
 			logging.info(f'Connection to {device} ok')
@@ -281,63 +342,88 @@ class VtEvalApp():
 		self.currentStateWidget.onStarted()
 
 	def prepareStimulus(self, stimulus):
+		self.timeline.mark('stimulusBraced')
 		try:
-			self.device.sendFile(stimulus.vtt)
+			upload = self.device.sendFile(stimulus.vtt)
+			upload.addDoneCallback(lambda _, timeline=self.timeline: timeline.mark('uploadComplete'))
 		except Exception as exc:
 			self.handleSerialError()
 
 	def playStimulus(self, stimulus):
+		self.timeline.mark('playRequested')
 		try:
-			self.device.play()
+			# if the upload is still being written, play as soon as it's out instead of behind it
+			if not self.device.playWhenUploaded():
+				logging.warning(f'Upload of {stimulus} not finished at play time')
 		except Exception as exc:
 			self.handleSerialError()
 
-	def openState(self):
-		stateFilePath = self.getSaveStatePath()
-		if stateFilePath.exists():
-			state = pickle.load(stateFilePath.open('rb'))
-			for key,value in state.items():
-				self.__dict__[key] = value
+	def onDeviceAcknowledged(self, pendingWrite):
+		if pendingWrite.description == 'play':
+			self.timeline.mark('deviceAck')
 
-			return True
+	def onAwaitingResponse(self):
+		self.timeline.mark('buttonsEnabled')
+		self.prefetchUpcomingStimuli()
 
-		return False
+	def prefetchUpcomingStimuli(self):
+		'''Uploads the next trial's stimuli while the participant responds to the current one'''
+		for descriptor in self.widgetStack:
+			stimuli = descriptor.getStimuli()
+			if len(stimuli) == 0:
+				continue
 
-	def saveState(self):
-		stateFilePath = self.getSaveStatePath()
-		if not stateFilePath.parent.exists():
-			stateFilePath.parent.mkdir(exist_ok=True)
+			try:
+				for stimulus in stimuli:
+					self.device.prefetchFile(stimulus.vtt)
+			except Exception as exc:
+				# the trial's own upload will run into this again and report it
+				logging.warning(f'Failed to prefetch stimuli for {descriptor}: {exc}')
 
-		if len(self.widgetStack) < 2:
-			stateFilePath.unlink()
-		else:
-			state = {
-				'widgetStack': self.widgetStack,
-				'lastInstructionsScreen': self.lastInstructionsScreen
-			}
+			return
 
-			try:
-				logging.info(f'Saving state to {stateFilePath}')
-				tmpStateFilePath = (stateFilePath.parent/'tmp')
-				tmpStateFile = tmpStateFilePath.open('wb')
+	def openState(self):
+		if not self.journal.exists():
+			return False
+
+		(plan, completed) = self.journal.load()
+		resumeIdx = max(completed) + 1 if len(completed) > 0 else 0
 
-				pickle.dump(state, tmpStateFile)
-				tmpStateFile.close()
+		self.widgetStack = []
+		for idx in range(resumeIdx, len(plan)):
+			(widgetClass, args) = decodeClass(plan[idx])
+			descriptor = WidgetDescriptor(widgetClass, **args)
+			descriptor.planIndex = idx
+			self.widgetStack.append(descriptor)
+
+		# shown again on resume, but not journaled a second time
+		for idx in range(resumeIdx-1, -1, -1):
+			(widgetClass, args) = decodeClass(plan[idx])
+			descriptor = WidgetDescriptor(widgetClass, **args)
+			if descriptor.isInstructions():
+				self.lastInstructionsScreen = descriptor
+				break
+
+		return True
+
+	def saveState(self, planIndex, name, remainingCount):
+		'''Called from the data logger's writer thread'''
+		if remainingCount < 2:
+			self.journal.delete()
+			return
 
-				tmpStateFilePath.replace(stateFilePath)
+		if planIndex is None:
+			return
 
-				logging.info(f'State saved!')
-			except Exception as exc:
-				logging.error(f'Failed to save state {exc}')
-				try:
-					tmpStateFilePath.unlink() # the file is junked, toss it
-				except:
-					pass
+		try:
+			self.journal.recordCompletion(planIndex, name)
+		except Exception as exc:
+			logging.error(f'Failed to save state {exc}')
 
 	def getSaveStatePath(self):
 		evalType = self.app.applicationName().split()[0].lower()
 		nameBits = [self.arguments['pid'], self.arguments['condition'], evalType]
-		return Path(f'states/' + '_'.join(nameBits) + '.savestate')
+		return Path(f'states/' + '_'.join(nameBits) + '.journal')
 
 class SerialErrorWidget(QtWidgets.QWidget):
 	finished = QtCore.Signal()
@@ -394,32 +480,58 @@ class SerialErrorWidget(QtWidgets.QWidget):
 
 class StateWidget(QtWidgets.QWidget):
 	finished = QtCore.Signal()
+	awaitingResponse = QtCore.Signal()
 
 	def __init__(self, name, parent=None):
 		super().__init__(parent=parent)
 		self.name = name
+		self.planIndex = None
 
 	def onStarted(self):
 		pass
 
-	def __getstate__(self):
-		props = self.__dict__.keys()
+	@classmethod
+	def getStimuliFor(cls, **kwargs):
+		'''Stimuli a widget built with these arguments will upload, in the order it uploads them'''
+		return []
 
-		data = {}
-		for key,value in self.__dict__.items():
-			if key == '__METAOBJECT__':
-				continue
+class InstructionsScreen:
+	pass
 
-			if isSerializable(value):
-				data[key] = self.__dict__[key]
+class WidgetDescriptor:
+	'''
+	A StateWidget that hasn't been built yet
 
-		return data
+	The widget stack holds these instead of widgets, so a session doesn't build a widget
+	tree for every trial up front. `materialize()` builds the widget when its turn comes.
+	'''
+	def __init__(self, widgetClass, name, **kwargs):
+		self.widgetClass = widgetClass
+		self.name = name
+		self.kwargs = kwargs
+		self.planIndex = None
 
-	def __setstate__(self, state):
-		self.__dict__.update(state)
+	@property
+	def describedClass(self):
+		return self.widgetClass
 
-class InstructionsScreen:
-	pass
+	def describe(self):
+		return dict(name=self.name, **self.kwargs)
+
+	def isInstructions(self):
+		return issubclass(self.widgetClass, InstructionsScreen)
+
+	def getStimuli(self):
+		return self.widgetClass.getStimuliFor(**self.kwargs)
+
+	def materialize(self):
+		widget = self.widgetClass(name=self.name, **self.kwargs)
+		widget.planIndex = self.planIndex
+
+		return widget
+
+	def __repr__(self):
+		return f'<{self.__class__.__name__}({self.widgetClass.__name__}, name={self.name}, planIndex={self.planIndex})>'
 
 class PromptWidget(StateWidget):
 	def __init__(self, name, text, parent=None):
@@ -446,9 +558,6 @@ class KeyPromptWidget(PromptWidget):
 		text = self.text.replace('\n', '\\n')
 		return f'<{self.__class__.__name__}(name={self.name}, text={text}, dismissKey={self.dismissKey})>'
 
-	def __setstate__(self, state):
-		self.__init__(state['name'], state['text'], state['dismissKey'])
-
 class ButtonPromptWidget(PromptWidget):
 	def __init__(self, name, text, buttonText='Continue', enabledDelaySeconds=5, parent=None):
 		super().__init__(name=name, text=text, parent=parent)
@@ -471,6 +580,7 @@ class ButtonPromptWidget(PromptWidget):
 	def onDelayFinished(self):
 		self.button.setDisabled(False)
 		self.button.setFocus()
+		self.awaitingResponse.emit()
 
 	def onButtonClicked(self):
 		self.setDisabled(True) # prevent double clicks
@@ -481,9 +591,6 @@ class ButtonPromptWidget(PromptWidget):
 		buttonText = self.buttonText.replace('\n', '\\n')
 		return f'<{self.__class__.__name__}(name={self.name}, text={text}, buttonText={buttonText}, enabledDelaySeconds={self.enabledDelaySeconds})>'
 
-	def __setstate__(self, state):
-		self.__init__(state['name'], state['text'], state['buttonText'], state['enabledDelaySeconds'])
-
 class TextInstructionsScreen(ButtonPromptWidget, InstructionsScreen):
 	pass
 
@@ -538,9 +645,6 @@ class ButtonPromptWidgetWithVideo(ButtonPromptWidget, InstructionsScreen):
 		elif keyEvent.key() == QtCore.Qt.Key_S:
 			self.button.setFocus()
 
-	def __setstate__(self, state):
-		self.__init__(state['name'], state['text'], state['buttonText'], state['enabledDelaySeconds'], state['videoURL'], state['videoStartDelaySeconds'])
-
 class CenteredContainer(QtWidgets.QWidget):
 	def __init__(self, widget=None, *args, **kwargs):
 		super().__init__(*args, **kwargs)
@@ -636,12 +740,23 @@ class ButtonPromptWidgetWithSoundBoard(ButtonPromptWidget, InstructionsScreen):
 			elif event.key() == QtCore.Qt.Key_S:
 				self.button.setFocus()
 
-	def __setstate__(self, state):
-		self.__init__(state['name'], state['text'], state['buttonText'], state['enabledDelaySeconds'], state['sounds'], state['buttonsPerRow'])
-
 class DataLogger:
-	def __init__(self, arguments, evalType):
+	'''
+	Writes a CSV row for every finished widget
+
+	Rows are handed to a writer thread so a slow disk doesn't stall the event loop. The
+	writer flushes each batch as soon as it's written, like the GUI thread used to after
+	every row, and additionally fsyncs the file per the `--fsync-*` arguments, after
+	break screens, and on close. Up to `bufferSize` rows can be waiting at once; beyond
+	that, logging blocks until the writer catches up rather than dropping rows.
+	'''
+	breakItems = ['break']
+
+	def __init__(self, arguments, evalType, bufferSize=256):
 		self.arguments = arguments
+		self.fsyncEveryRecords = int(arguments.get('fsync_every', 0))
+		self.fsyncIntervalSeconds = float(arguments.get('fsync_interval', 0))
+		self.fsyncOnBreaks = not arguments.get('no_fsync_on_breaks', False)
 
 		now = nowStamp().replace(':', '-')
 		nameBits = [now, arguments['pid'], arguments['condition'], evalType, arguments['facilitator']]
@@ -653,10 +768,17 @@ class DataLogger:
 		self.dataFile = self.path.open('w')
 		self.csvWriter = csv.DictWriter(
 			self.dataFile,
-			fieldnames=self.getFieldNames(),
+			fieldnames=self.getFieldNames() + TrialTimeline.fieldNames,
 			extrasaction='ignore'
 		)
 		self.csvWriter.writeheader()
+		self.dataFile.flush()
+
+		self.queue = queue.Queue(maxsize=bufferSize)
+		self.unsyncedRecords = 0
+		self.lastSyncTime = time.monotonic()
+		self.writerThread = threading.Thread(target=self.writeRecords, name='DataLogger', daemon=True)
+		self.writerThread.start()
 
 	def getFieldNames(self):
 		return ['timestamp', 'pid', 'condition', 'facilitator', 'event', 'item', 'selection', 'stimulus', 'stimfile']
@@ -674,29 +796,124 @@ class DataLogger:
 
 		return record
 
-	def logWidgetCompletion(self, finishedWidget):
+	def logWidgetCompletion(self, finishedWidget, timeline=None, afterWrite=None):
+		'''`afterWrite` is called from the writer thread once the row is flushed'''
 		record = self.buildRecord(finishedWidget)
-		logging.info(f'Logging record {record}')
+		if timeline is not None:
+			record.update(timeline.asRecord())
 
-		self.csvWriter.writerow(record)
-		self.dataFile.flush()
+		sync = self.fsyncOnBreaks and finishedWidget.name in DataLogger.breakItems
+		try:
+			self.queue.put_nowait((record, sync, afterWrite))
+		except queue.Full:
+			logging.warning(f'Data logger is {self.queue.qsize()} record(s) behind, waiting for it')
+			self.queue.put((record, sync, afterWrite))
+
+	def writeRecords(self):
+		running = True
+		while running:
+			try:
+				batch = [self.queue.get(timeout=self.getSyncTimeout())]
+			except queue.Empty:
+				self.sync()
+				continue
+
+			# everything that piled up while the last batch was being written
+			while True:
+				try:
+					batch.append(self.queue.get_nowait())
+				except queue.Empty:
+					break
+
+			sync = False
+			written = []
+			for entry in batch:
+				if entry is None:
+					running = False
+					sync = True
+					break
+
+				(record, syncAfter, afterWrite) = entry
+				try:
+					self.csvWriter.writerow(record)
+				except Exception as exc:
+					logging.error(f'Failed to log record {record}: {exc}')
+					continue
+
+				logging.info(f'Logged record {record}')
+				written.append(afterWrite)
+				self.unsyncedRecords += 1
+				sync = sync or syncAfter
+
+			try:
+				self.dataFile.flush()
+			except Exception as exc:
+				logging.error(f'Failed to write {self.path}: {exc}')
+				continue
+
+			if sync or self.isSyncDue():
+				self.sync()
+
+			for afterWrite in written:
+				if afterWrite is not None:
+					afterWrite()
 
-	def close(self):
 		self.dataFile.close()
 
+	def getSyncTimeout(self):
+		if self.unsyncedRecords == 0 or self.fsyncIntervalSeconds <= 0:
+			return None
+
+		return max(0, self.lastSyncTime + self.fsyncIntervalSeconds - time.monotonic())
+
+	def isSyncDue(self):
+		if self.fsyncEveryRecords > 0 and self.unsyncedRecords >= self.fsyncEveryRecords:
+			return True
+
+		if self.fsyncIntervalSeconds > 0 and time.monotonic() - self.lastSyncTime >= self.fsyncIntervalSeconds:
+			return True
+
+		return False
+
+	def sync(self):
+		if self.unsyncedRecords > 0:
+			try:
+				os.fsync(self.dataFile.fileno())
+				self.unsyncedRecords = 0
+			except OSError as exc:
+				logging.error(f'Failed to sync {self.path}: {exc}')
+
+		self.lastSyncTime = time.monotonic()
+
+	def close(self):
+		'''Writes and syncs every pending record, then closes the file'''
+		if self.writerThread.is_alive():
+			self.queue.put(None)
+			self.writerThread.join()
+
 class FileStimulus:
 	def __init__(self, file, id):
 		self.file = file
 		self.id = id
 
+	def describe(self):
+		return {'file': self.file, 'id': self.id}
+
 	def __repr__(self):
 		return f'<{self.__class__.__name__} id={self.id} file={self.file}>'
 
 class Stimulus(FileStimulus):
 	def __init__(self, file, id):
+		if isinstance(file, VTTFile):
+			self.vtt = file
+			file = file.filepath
+		else:
+			self.vtt = mapVTTFile(file)
+
 		super().__init__(file, id)
 
-		self.vtt = loadVTTFile(file)
+	def describe(self):
+		return {'file': self.vtt, 'id': self.id}
 
 def navigateGridLayout(containerWidget, keyEvent):
 	focusedWidget = QtWidgets.QApplication.instance().focusWidget()
@@ -1,4 +1,3 @@
-import time
 from pathlib import Path
 
 from PySide2 import QtCore, QtWidgets, QtGui, QtMultimedia
@@ -7,21 +6,23 @@ from . import ui
 from . import tools
 from . import mbopp_data
 from . import serial
+from . import streaming
 
 class VttHexApp(QtWidgets.QApplication):
 	def __init__(self):
 		super().__init__()
 		self.buildWindow()
-		self.signalPlayerTimer = QtCore.QTimer()
-		self.signalPlayerTimer.setInterval(5)
-		self.signalPlayerTimer.timeout.connect(self.updateSignalPlayer)
+		# without sound bites, samples reach the device 100 ms ahead and play from its jitter buffer
+		self.streamer = streaming.SignalStreamer(period=.005, leadTime=.1)
+		self.streamer.snapshot.connect(self.showSignal)
+		self.streamer.finished.connect(self.onStreamFinished)
+		self.aboutToQuit.connect(self.streamer.stop)
 
 		self.serialTimer = QtCore.QTimer()
 		self.serialTimer.setInterval(15)
 		self.serialTimer.timeout.connect(self.checkForSerialMessages)
 
 		self.signalPlayer = tools.SignalPlayer()
-		self.lastTimestamp = None
 		self.enabledPhone = None
 		self.serial = None
 
@@ -87,6 +88,8 @@ class VttHexApp(QtWidgets.QApplication):
 		self.paramChangeTimer.start()
 
 	def uploadSoundBite(self):
+		self.streamer.stop()
+
 		filename = self.window.mboppControls.getFilename()
 		wavPath = f'MBOPP/audio/{filename}.wav'
 		self.nowPlaying = QtMultimedia.QSound(tools.findAsset(wavPath))
@@ -95,7 +98,7 @@ class VttHexApp(QtWidgets.QApplication):
 
 		if self.useBites:
 			print('Upload:', filename)
-			samples = list(self.signalPlayer.asSequence(period=.005))
+			samples = self.signalPlayer.asByteMatrix(period=.005)
 			self.serial.sendFile(5, samples)
 
 	def onPlayClicked(self):
@@ -106,47 +109,31 @@ class VttHexApp(QtWidgets.QApplication):
 			self.serial.sendPlayBite()
 
 	def startSignalPlayer(self):
-		self.lastTimestamp = None
-		self.signalPlayer.reset()
-		self.signalPlayerTimer.start()
-		self.startTime = time.time()
+		# with sound bites the device plays on its own, and the stream only drives the UI
+		self.streamer.start(self.signalPlayer, None if self.useBites else self.serial)
+
+	def onStreamFinished(self, stats):
+		print('Stream:', stats.summary())
 
-	def stopSignalPlayer(self):
-		self.signalPlayerTimer.stop()
+		# a run replaced by another Play click finishes after the new one has started
+		if stats is not self.streamer.stats:
+			return
 
 		self.window.phoneGrid.clear()
 		self.window.intensitySliders.setLinearValue(0)
-		self.serial.sendStop()
+		if self.useBites:
+			self.serial.sendStop()
 
 	def checkForSerialMessages(self):
 		lines = self.serial.readLines()
 		for l in lines:
 			print('RECV:', l)
 
-	def updateSignalPlayer(self):
-		now = time.time()
-		if self.lastTimestamp is None:
-			self.lastTimestamp = now
-			return
-
-		delta = now - self.lastTimestamp
-		signal = self.signalPlayer.update(delta)
-		(phone, pitch, intensity) = signal
-
-		if self.signalPlayer.isDone():
-			self.stopSignalPlayer()
-		else:
-			self.showSignal(phone, pitch, intensity)
-			if not self.useBites:
-				self.serial.sendCombinedSignal(phone, pitch[0], intensity)
-
-		self.lastTimestamp = now
-
-	def showSignal(self, phone, pitch, intensity):
-		if phone is not None:
-			self.window.phoneGrid.setSinglePhone(phone)
-		self.window.pitchSliders.setLinearValue(int(pitch[0]))
-		self.window.intensitySliders.setLinearValue(int(intensity*100))
+	def showSignal(self, snapshot):
+		if snapshot.phone is not None:
+			self.window.phoneGrid.setSinglePhone(snapshot.phone)
+		self.window.pitchSliders.setLinearValue(int(snapshot.pitch[0]))
+		self.window.intensitySliders.setLinearValue(int(snapshot.intensity*100))
 
 	def onTilePressed(self, cellID):
 		self.lastCellID = cellID
@@ -1,41 +1,121 @@
+import os
 import sys
-
-from pathlib import Path
-import wave
 import csv
+import math
+import wave
+from pathlib import Path
+from collections import deque
+from multiprocessing import Pool
 
 import numpy as np
-import scipy
+import scipy.signal
 from mosqito.functions.shared.load import load
 from mosqito.functions.loudness_zwicker.comp_loudness import comp_loudness
 
 #from vttHex.tools import SignalPlayer, formatSignalAsBytes
 
-def calcLoudness(wavPath, resampleTo=None):
-	signal, fs = load(False, wavPath, calib = 2 * 2**0.5)
-	loudness = comp_loudness(False, signal, fs, field_type='free')
+'''
+Time-varying Zwicker loudness of WAV files, written to `<name>.loudness.csv`
+
+Signals are split into blocks that are computed on a process pool and stitched back
+together, so a few long recordings keep every core busy rather than one each. Every
+block is computed with `overlapDuration` of the signal on either side, and only the
+frames of its own span are kept. By then the model's filters and temporal masking have
+settled, so the stitched curve matches the one computed in one piece.
+
+	python -m vttHex.calcLoudness wav/*.wav
+	python -m vttHex.calcLoudness --check long.wav
+'''
+
+# comp_loudness reports one value every 2 ms
+frameDuration = .002
+blockDuration = 10.0
+overlapDuration = 1.0
+
+class Block:
+	'''A span of frames to keep, and the padded span of samples to compute them from'''
+	def __init__(self, firstFrame, lastFrame, paddedFirstFrame, start, end):
+		self.firstFrame = firstFrame
+		self.lastFrame = lastFrame
+		self.paddedFirstFrame = paddedFirstFrame
+		self.start = start
+		self.end = end
+
+	def __repr__(self):
+		return f'<{self.__class__.__name__}(frames {self.firstFrame}-{self.lastFrame}, samples {self.start}-{self.end})>'
+
+def frameToSample(frameIdx, fs):
+	# frames needn't be a whole number of samples long, e.g. 88.2 at 44.1 kHz
+	return round(frameIdx * fs * frameDuration)
+
+def splitBlocks(sampleCount, fs):
+	frameCount = math.ceil(sampleCount / (fs * frameDuration))
+	blockFrames = max(1, round(blockDuration / frameDuration))
+	overlapFrames = round(overlapDuration / frameDuration)
+
+	blocks = []
+	for firstFrame in range(0, frameCount, blockFrames):
+		lastFrame = min(frameCount, firstFrame + blockFrames)
+		paddedFirstFrame = max(0, firstFrame - overlapFrames)
+		paddedLastFrame = min(frameCount, lastFrame + overlapFrames)
+
+		blocks.append(Block(
+			firstFrame, lastFrame, paddedFirstFrame,
+			frameToSample(paddedFirstFrame, fs), min(sampleCount, frameToSample(paddedLastFrame, fs)),
+		))
+
+	return blocks
+
+def calcBlockLoudness(blockSignal):
+	(signal, fs) = blockSignal
+	return comp_loudness(False, signal, fs, field_type='free')['values']
+
+def stitchBlocks(blocks, blockLoudnesses):
+	kept = []
+	for block,loudness in zip(blocks, blockLoudnesses):
+		offset = block.firstFrame - block.paddedFirstFrame
+		kept.append(np.asarray(loudness)[offset:offset + block.lastFrame - block.firstFrame])
+
+	if len(kept) == 0:
+		return np.empty(0)
+
+	return np.concatenate(kept)
+
+def getBlockSignals(signal, fs):
+	blocks = splitBlocks(len(signal), fs)
+	return (blocks, [(signal[block.start:block.end], fs) for block in blocks])
+
+def loadSignal(wavPath):
+	return load(False, str(wavPath), calib = 2 * 2**0.5)
+
+def calcSignalLoudness(signal, fs, pool=None):
+	(blocks, blockSignals) = getBlockSignals(signal, fs)
+	mapFunction = map if pool is None else pool.map
+
+	return stitchBlocks(blocks, mapFunction(calcBlockLoudness, blockSignals))
+
+def calcLoudness(wavPath, resampleTo=None, pool=None):
+	'''
+	Loudness (sone) of a WAV file, one value per `frameDuration`
+
+	With `resampleTo`, the curve is resampled to that many values instead. The blocks
+	are computed on `pool` if one is given.
+	'''
+	signal, fs = loadSignal(wavPath)
+	N = calcSignalLoudness(signal, fs, pool)
 
-	N = loudness['values']
 	if resampleTo is not None:
-		N = scipy.signal.resample(N, sampleCount)
+		N = scipy.signal.resample(N, resampleTo)
 
 	return N
 
-def makeLoudnessCSV(path):
-	sampleRate = 0
-	with wave.open(path, "rb") as wavFile:
-		sampleRate = wavFile.getframerate()
-		frameCount = wavFile.getnframes()
-		duration = frameCount/sampleRate
+def getDuration(path):
+	with wave.open(str(path), "rb") as wavFile:
+		return wavFile.getnframes() / wavFile.getframerate()
 
+def writeLoudnessCSV(path, loudness):
 	path = Path(path)
-	try:
-		loudness = calcLoudness(str(path))
-	except Exception as exc:
-		print(f'Loudness calc failed for {path.name}', exc)
-		return
-
-	frameTime = duration / len(loudness)
+	frameTime = getDuration(path) / len(loudness)
 
 	outputPath = path.parent/(path.stem+'.loudness.csv')
 	with open(outputPath, 'w') as outputFile:
@@ -47,8 +127,76 @@ def makeLoudnessCSV(path):
 
 	print('Wrote', outputPath.name)
 
+def makeLoudnessCSV(path, pool=None):
+	try:
+		loudness = calcLoudness(path, pool=pool)
+	except Exception as exc:
+		print(f'Loudness calc failed for {Path(path).name}', exc)
+		return
+
+	writeLoudnessCSV(path, loudness)
+
+def makeLoudnessCSVs(paths, processes=None):
+	'''
+	makeLoudnessCSV for many files, with the blocks of all of them sharing one pool
+
+	Only as many files are read ahead of the pool as it has processes, so a large
+	corpus isn't held in memory at once.
+	'''
+	maxPending = processes or os.cpu_count() or 1
+	pending = deque()
+
+	def finish(path, blocks, asyncResult):
+		try:
+			writeLoudnessCSV(path, stitchBlocks(blocks, asyncResult.get()))
+		except Exception as exc:
+			print(f'Loudness calc failed for {Path(path).name}', exc)
+
+	with Pool(processes) as pool:
+		for path in paths:
+			try:
+				(blocks, blockSignals) = getBlockSignals(*loadSignal(path))
+			except Exception as exc:
+				print(f'Loudness calc failed for {Path(path).name}', exc)
+				continue
+
+			pending.append((path, blocks, pool.map_async(calcBlockLoudness, blockSignals, chunksize=1)))
+			while len(pending) > maxPending:
+				finish(*pending.popleft())
+
+		while len(pending) > 0:
+			finish(*pending.popleft())
+
+def checkBlocks(wavPath, pool=None):
+	'''
+	Compares the stitched loudness of a WAV file with comp_loudness of it in one piece
+
+	Only means something for files longer than `blockDuration`. Returns the largest
+	difference (sone) and the frame it's at, and the two frame counts.
+	'''
+	signal, fs = loadSignal(wavPath)
+	stitched = calcSignalLoudness(signal, fs, pool)
+	whole = np.asarray(calcBlockLoudness((signal, fs)))
+
+	count = min(len(stitched), len(whole))
+	differences = np.abs(stitched[:count] - whole[:count])
+	worstFrame = int(np.argmax(differences)) if count > 0 else 0
+
+	return (differences[worstFrame] if count > 0 else 0.0, worstFrame, len(stitched), len(whole))
+
 if __name__ == '__main__':
-	from multiprocessing import Pool
+	import argparse
+
+	parser = argparse.ArgumentParser()
+	parser.add_argument('--check', action='store_true', help='compare the block-wise loudness of each file with the one-piece calculation instead')
+	parser.add_argument('files', nargs='+')
+
+	args = parser.parse_args()
 
-	with Pool() as pool:
-		pool.map(makeLoudnessCSV, sys.argv[1:])
+	if args.check:
+		with Pool() as pool:
+			for path in args.files:
+				(difference, frame, stitchedCount, wholeCount) = checkBlocks(path, pool)
+				print(f'{Path(path).name}: {stitchedCount} frames in blocks, {wholeCount} in one piece, max difference {difference:.6f} sone at {frame*frameDuration:.3f}s')
+	else:
+		makeLoudnessCSVs(args.files)
@@ -0,0 +1,873 @@
+import os
+import tty
+import csv
+import time
+import socket
+import select
+import threading
+
+from . import serial as vttSerial
+from . import tools
+
+'''
+Software stand-in for the VTT firmware
+
+Implements the CommandStream protocol (firmware/src/CommandStream.cpp) and exposes it
+over a pty or a TCP port, so SerialComms, TcpComms and vtEval's SerialDevice can connect
+to it as they would to a board:
+
+	python -m vttHex.deviceSimulator --pty
+	python -m vttHex.deviceSimulator --tcp 1234 --trace trace.csv
+
+Every command and actuator change is recorded in a trace with the host's
+perf_counter() and the simulated device's millis().
+
+Timestamped streams (CMD_STREAM_*) go through the same jitter buffer as on the board,
+and its counters are reported the same way. --lead-time overrides the lead time hosts
+ask for, to find out how much a link needs, and --baud paces received bytes like a
+serial line:
+
+	python -m vttHex.deviceSimulator --tcp --lead-time 50
+	python -m vttHex.deviceSimulator --pty --baud 115200
+'''
+
+MAX_SAMPLES = 14000
+NUM_SOUNDBITES = 16
+SOUNDBITE_POOL_SIZE = 32000
+STREAM_BUFFER_SIZE = 2048
+STREAM_TIMEOUT = 1000
+NO_PHONE = 255
+
+commandNames = {
+	value: name[4:] for name,value in vars(vttSerial).items()
+	if name.startswith('CMD_') and isinstance(value, int)
+}
+
+# commands after which the firmware discards whatever else is waiting in the stream
+flushingCommands = [
+	vttSerial.CMD_ACTUATOR_ENABLE,
+	vttSerial.CMD_ACTUATOR_DISABLE,
+	vttSerial.CMD_PULSE_ACTUATOR,
+	vttSerial.CMD_SET_ACTUATOR_INT,
+	vttSerial.CMD_STOP,
+	vttSerial.CMD_PLAY_BITE,
+]
+
+streamCommands = [
+	vttSerial.CMD_STREAM_START,
+	vttSerial.CMD_STREAM_SAMPLES,
+	vttSerial.CMD_STREAM_END,
+	vttSerial.CMD_STREAM_PLAY,
+]
+
+class TraceEvent:
+	fields = ['hostTime', 'deviceTime', 'event', 'cellID', 'intensity', 'pitch']
+
+	def __init__(self, hostTime, deviceTime, event, cellID=None, intensity=None, pitch=None):
+		self.hostTime = hostTime
+		self.deviceTime = deviceTime
+		self.event = event
+		self.cellID = cellID
+		self.intensity = intensity
+		self.pitch = pitch
+
+	def asDict(self):
+		return {field: getattr(self, field) for field in TraceEvent.fields}
+
+	def __repr__(self):
+		return f'<{self.__class__.__name__}({self.deviceTime:.1f}ms {self.event} cell={self.cellID})>'
+
+class SoundBite:
+	def __init__(self):
+		self.period = 0
+		self.sampleCount = 0
+		self.storedCount = 0
+		self.samples = []
+
+	def init(self, period, sampleCount):
+		# SoundBite::init truncates these to uint8_t and uint16_t
+		self.period = period & 0xFF
+		self.sampleCount = sampleCount & 0xFFFF
+		self.samples = []
+
+class SoundBiteCache:
+	'''Mirrors SoundBiteCache: NUM_SOUNDBITES slots sharing a pool of SOUNDBITE_POOL_SIZE samples'''
+	def __init__(self):
+		self.soundBites = [SoundBite() for _ in range(NUM_SOUNDBITES)]
+
+	def get(self, soundBiteID):
+		if soundBiteID >= NUM_SOUNDBITES:
+			return None
+
+		return self.soundBites[soundBiteID]
+
+	def allocate(self, soundBiteID, period, sampleCount):
+		soundBite = self.get(soundBiteID)
+		if soundBite is None:
+			return None
+
+		soundBite.storedCount = 0
+		usedSamples = sum(bite.storedCount for bite in self.soundBites)
+
+		soundBite.init(period, sampleCount)
+		soundBite.storedCount = min(sampleCount, MAX_SAMPLES, SOUNDBITE_POOL_SIZE - usedSamples)
+
+		return soundBite
+
+class StreamReport:
+	fields = ['played', 'underruns', 'late', 'gaps', 'overflows', 'maxDepth']
+
+	def __init__(self):
+		for field in StreamReport.fields:
+			setattr(self, field, 0)
+
+	def asDict(self):
+		return {field: getattr(self, field) for field in StreamReport.fields}
+
+	def __str__(self):
+		return 'stream ' + ' '.join(str(getattr(self, field)) for field in StreamReport.fields)
+
+	def __repr__(self):
+		return f'<{self.__class__.__name__}({self.asDict()})>'
+
+class StreamBuffer:
+	'''
+	Mirrors StreamBuffer, the jitter buffer for timestamped streams
+
+	Sample n plays at (arrival of the first sample) + leadTime + n * period. Missing
+	samples are traced as underruns and samples that arrive after they were due as late,
+	so they can be lined up with the received commands.
+
+	A stream started with a lead time of STREAM_HOLD only buffers until CMD_STREAM_PLAY,
+	which is how SerialDevice plays files too long for a sound bite. The override
+	doesn't apply to those.
+	'''
+	def __init__(self, device, leadTime=None):
+		self.device = device
+		self.leadTimeOverride = leadTime
+		self.samples = [None] * STREAM_BUFFER_SIZE
+		self.active = False
+		self.reports = []
+
+	def start(self, period, leadTime):
+		if self.active:
+			self.finish()
+
+		if self.leadTimeOverride is not None and leadTime != vttSerial.STREAM_HOLD:
+			leadTime = self.leadTimeOverride
+
+		self.period = max(period, 1)
+		self.leadTime = leadTime
+		self.active = True
+		self.received = False
+		self.held = leadTime == vttSerial.STREAM_HOLD
+		self.started = False
+		self.lastArrival = self.device.millis()
+
+		self.writeIdx = 0
+		self.playIdx = 0
+		self.endIdx = None
+
+		self.lastReceived = (NO_PHONE, 0, 0)
+		self.lastPlayed = self.lastReceived
+		self.report = StreamReport()
+
+		self.device.addTrace('streamStart', self.period, self.leadTime)
+
+	def addSample(self, sampleIdx, sample):
+		if not self.active:
+			return
+
+		now = self.device.millis()
+		self.lastArrival = now
+
+		if not self.received:
+			self.received = True
+			self.writeIdx = sampleIdx
+			self.playIdx = sampleIdx
+
+			if not self.held:
+				self.startPlayout(now + self.leadTime)
+
+		if sampleIdx < self.writeIdx:
+			return
+
+		if sampleIdx - self.writeIdx > STREAM_BUFFER_SIZE:
+			self.report.gaps += sampleIdx - self.writeIdx - STREAM_BUFFER_SIZE
+			self.writeIdx = sampleIdx - STREAM_BUFFER_SIZE
+
+		while self.writeIdx < sampleIdx:
+			self.report.gaps += 1
+			if self.writeIdx < self.playIdx:
+				self.writeIdx += 1
+			else:
+				self.store(self.writeIdx, self.lastReceived)
+
+		self.store(sampleIdx, sample)
+		self.lastReceived = sample
+
+	def startPlayout(self, startTime):
+		self.started = True
+		self.playoutStart = startTime - self.playIdx * self.period
+
+	def store(self, sampleIdx, sample):
+		self.writeIdx = sampleIdx + 1
+
+		if sampleIdx < self.playIdx:
+			self.report.late += 1
+			self.device.addTrace('late', sampleIdx)
+			return
+
+		if sampleIdx - self.playIdx >= STREAM_BUFFER_SIZE:
+			self.report.overflows += 1
+			self.playIdx = sampleIdx - STREAM_BUFFER_SIZE + 1
+
+		self.samples[sampleIdx % STREAM_BUFFER_SIZE] = sample
+		self.report.maxDepth = max(self.report.maxDepth, self.writeIdx - self.playIdx)
+
+	def play(self):
+		if self.active and self.held:
+			self.held = False
+			self.lastArrival = self.device.millis()
+			self.startPlayout(self.lastArrival)
+			self.device.addTrace('streamPlay', self.playIdx, self.writeIdx - self.playIdx)
+
+	def end(self, sampleCount):
+		if self.active:
+			self.endIdx = sampleCount
+
+	def stop(self):
+		if self.active:
+			self.finish()
+
+	def isActive(self):
+		return self.active
+
+	def getNextDueTime(self):
+		if not self.active or not self.started:
+			return None
+
+		return self.playoutStart + self.playIdx * self.period
+
+	def update(self, now):
+		if not self.active or self.held:
+			return
+
+		endIdx = self.endIdx if self.endIdx is not None else float('inf')
+
+		if self.started and now >= self.playoutStart:
+			dueIdx = int((now - self.playoutStart) / self.period)
+
+			sample = None
+			while self.playIdx <= dueIdx and self.playIdx < endIdx:
+				if self.playIdx < self.writeIdx:
+					sample = self.samples[self.playIdx % STREAM_BUFFER_SIZE]
+					self.report.played += 1
+				else:
+					self.report.underruns += 1
+					self.device.addTrace('underrun', self.playIdx)
+				self.playIdx += 1
+
+			if sample is not None and sample != self.lastPlayed:
+				(phone, pitch, intensity) = sample
+				if phone < NO_PHONE and intensity > 0:
+					self.device.grid.enable(phone, intensity, pitch)
+
+				self.lastPlayed = sample
+
+		timedOut = self.playIdx >= self.writeIdx and now - self.lastArrival > STREAM_TIMEOUT
+		if self.playIdx >= endIdx or timedOut:
+			self.finish()
+
+	def finish(self):
+		self.active = False
+		self.device.grid.disableAll()
+
+		self.reports.append(self.report)
+		self.device.addTrace('streamEnd', self.report.played, self.report.underruns)
+		self.device.write(f'{self.report}\r\n'.encode())
+
+class SimulatedGrid:
+	'''Tracks HexGrid's cell state and records changes to the trace'''
+	def __init__(self, device):
+		self.device = device
+		self.currentCell = NO_PHONE
+
+	def enable(self, cellID, intensity, pitch):
+		if self.currentCell != NO_PHONE and self.currentCell != cellID:
+			self.disable(self.currentCell)
+
+		self.currentCell = cellID
+		self.device.addTrace('enable', cellID, intensity, pitch)
+
+	def disable(self, cellID):
+		self.currentCell = NO_PHONE
+		self.device.addTrace('disable', cellID)
+
+	def disableAll(self):
+		# like HexGrid::disableAll, this leaves currentCell alone
+		self.device.addTrace('disableAll')
+
+	def setActuatorIntensity(self, actuatorID, intensity):
+		self.device.addTrace('actuator', actuatorID, intensity)
+
+	def calibrate(self):
+		self.device.addTrace('calibrate')
+
+class SimulatedDevice:
+	'''
+	Mirrors CommandStream::update
+
+	Received bytes are buffered as they arrive, the device loop drains them the way
+	flushToLatestCommand does, and only the last complete command is executed. With
+	realtime=False, bites and pulses are traced at their scheduled device times without
+	blocking, which lets sessions run at full speed.
+
+	With a baud rate, received bytes only become readable as fast as a serial line at
+	that rate would carry them. A pty or a TCP socket would otherwise deliver a whole
+	batch of packets at once.
+	'''
+	# how often a read that's waiting on the line keeps the stream buffer playing
+	readPollInterval = .001
+
+	def __init__(self, realtime=True, leadTime=None, baudRate=None):
+		self.realtime = realtime
+		self.transport = None
+
+		self.inputBuffer = bytearray()
+		self.inputReady = threading.Condition()
+
+		# 10 bits per byte with the start and stop bits
+		self.byteTime = None if baudRate is None else 10 / baudRate
+		self.lineBuffer = bytearray()
+		self.lineTime = 0
+
+		self.grid = SimulatedGrid(self)
+		self.soundBites = SoundBiteCache()
+		self.streamBuffer = StreamBuffer(self, leadTime)
+		self.commandBuffer = bytearray()
+		self.bufferIdx = 0
+		# the sequence number of the last command read, until it's acked or skipped
+		self.pendingSequence = None
+
+		self.trace = []
+		self.traceLock = threading.Lock()
+
+		self.startTime = time.perf_counter()
+		self.virtualOffset = 0.0
+		self.lastPing = 0
+		self.running = False
+
+	def millis(self):
+		return (time.perf_counter() - self.startTime) * 1000 + self.virtualOffset
+
+	def addTrace(self, event, cellID=None, intensity=None, pitch=None, deviceTime=None):
+		if deviceTime is None:
+			deviceTime = self.millis()
+
+		with self.traceLock:
+			self.trace.append(TraceEvent(time.perf_counter(), deviceTime, event, cellID, intensity, pitch))
+
+	def getTrace(self):
+		with self.traceLock:
+			return list(self.trace)
+
+	def clearTrace(self):
+		with self.traceLock:
+			self.trace = []
+
+	def saveTrace(self, path):
+		with open(path, 'w', newline='') as traceFile:
+			writer = csv.DictWriter(traceFile, fieldnames=TraceEvent.fields)
+			writer.writeheader()
+			for event in self.getTrace():
+				writer.writerow(event.asDict())
+
+	# Stream ----------------------------------------------------------------
+
+	def receive(self, data):
+		with self.inputReady:
+			if self.byteTime is None:
+				self.inputBuffer += data
+			else:
+				if len(self.lineBuffer) == 0:
+					self.lineTime = max(self.lineTime, time.perf_counter())
+				self.lineBuffer += data
+
+			self.inputReady.notify_all()
+
+	def releaseInput(self):
+		# moves the bytes that have made it across the line by now into the input buffer
+		if len(self.lineBuffer) == 0:
+			return
+
+		count = min(len(self.lineBuffer), int((time.perf_counter() - self.lineTime) / self.byteTime))
+		if count > 0:
+			self.inputBuffer += self.lineBuffer[:count]
+			del self.lineBuffer[:count]
+			self.lineTime += count * self.byteTime
+
+	def getInputTimeout(self, timeout):
+		if len(self.lineBuffer) > 0:
+			return min(timeout, self.byteTime)
+
+		return timeout
+
+	def available(self):
+		with self.inputReady:
+			self.releaseInput()
+			return len(self.inputBuffer)
+
+	def readBlocking(self):
+		return self.readBytesBlocking(1)[0]
+
+	def readBytesBlocking(self, count):
+		with self.inputReady:
+			while True:
+				self.releaseInput()
+				if len(self.inputBuffer) >= count or not self.running:
+					break
+
+				# like the firmware, keep the stream playing while the rest of a packet is on its way
+				self.streamBuffer.update(self.millis())
+				self.inputReady.wait(self.getInputTimeout(self.readPollInterval))
+
+			if len(self.inputBuffer) < count:
+				raise EOFError()
+
+			data = bytes(self.inputBuffer[:count])
+			del self.inputBuffer[:count]
+			return data
+
+	def flush(self):
+		# packet by packet, so the sequenced ones can be reported as skipped
+		while self.available() > 0:
+			cmd = self.readCommandStart()
+			if cmd is None or cmd not in vttSerial.CMD_PAYLOAD_SIZES:
+				# there's no telling where the next packet starts
+				self.pendingSequence = None
+				with self.inputReady:
+					self.inputBuffer.clear()
+				return
+
+			self.skipPayload(cmd)
+			self.skipSequence()
+
+	def skipPayload(self, cmd):
+		payload = self.readBytesBlocking(vttSerial.CMD_PAYLOAD_SIZES[cmd])
+		if cmd == vttSerial.CMD_SOUNDBITE:
+			dataSize = 3 * int.from_bytes(payload[5:9], byteorder='little')
+		elif cmd == vttSerial.CMD_SOUNDBITE_RLE:
+			dataSize = int.from_bytes(payload[9:13], byteorder='little')
+		elif cmd == vttSerial.CMD_STREAM_SAMPLES:
+			dataSize = 3 * payload[4]
+		else:
+			dataSize = 0
+
+		self.readBytesBlocking(dataSize)
+		self.addTrace(f'flushed:{commandNames.get(cmd, hex(cmd))}')
+
+	def write(self, data):
+		if self.transport is not None:
+			self.transport.write(data)
+
+	# CommandStream ---------------------------------------------------------
+
+	def nextByteFromBuffer(self):
+		value = self.commandBuffer[self.bufferIdx]
+		self.bufferIdx += 1
+
+		return value
+
+	def flushToLatestCommand(self):
+		if self.available() == 0:
+			return False
+
+		self.bufferIdx = 0
+		self.commandBuffer = bytearray([NO_PHONE])
+
+		while self.available() > 0:
+			# only the last command of a batch runs, the one read before this is superseded
+			self.skipSequence()
+
+			cmd = self.readCommandStart()
+			if cmd is None:
+				return False
+
+			payloadSize = vttSerial.CMD_PAYLOAD_SIZES.get(cmd, 0)
+			self.commandBuffer = bytearray([cmd]) + self.readBytesBlocking(payloadSize)
+			self.addTrace(f'received:{commandNames.get(cmd, hex(cmd))}')
+
+			if cmd == vttSerial.CMD_SOUNDBITE:
+				self.readSoundBite()
+			elif cmd == vttSerial.CMD_SOUNDBITE_RLE:
+				self.readSoundBiteRuns()
+			elif cmd in streamCommands:
+				self.readStreamCommand(cmd)
+
+			# these have already done their work
+			if cmd in (vttSerial.CMD_SOUNDBITE, vttSerial.CMD_SOUNDBITE_RLE) or cmd in streamCommands:
+				self.ackSequence()
+
+		return True
+
+	def readCommandStart(self):
+		'''Reads up to a packet's command byte, and its sequence number if it has one. None if out of sync.'''
+		header = self.readBlocking()
+		if header != vttSerial.CMD_HEADER:
+			self.write(f'out of sync {header}\r\n'.encode())
+			self.addTrace('outOfSync', header)
+			return None
+
+		cmd = self.readBlocking()
+
+		# a sequence number asks for the command after it to be acknowledged
+		if cmd == vttSerial.CMD_SEQUENCE:
+			sequence = int.from_bytes(self.readBytesBlocking(2), byteorder='little')
+
+			header = self.readBlocking()
+			if header != vttSerial.CMD_HEADER:
+				self.write(f'out of sync {header}\r\n'.encode())
+				self.addTrace('outOfSync', header)
+				return None
+			cmd = self.readBlocking()
+			self.pendingSequence = sequence
+
+		return cmd
+
+	def ackSequence(self):
+		if self.pendingSequence is not None:
+			self.sendAck(self.pendingSequence)
+			self.pendingSequence = None
+
+	def skipSequence(self):
+		if self.pendingSequence is not None:
+			self.write(f'skip {self.pendingSequence}\r\n'.encode())
+			self.pendingSequence = None
+
+	def readUInt32FromBuffer(self):
+		return int.from_bytes(bytes(self.nextByteFromBuffer() for _ in range(4)), byteorder='little')
+
+	def sendAck(self, sequence):
+		self.write(f'ack {sequence} {int(self.millis())}\r\n'.encode())
+
+	def allocateSoundBite(self, soundBiteID, period, sampleCount):
+		soundBite = self.soundBites.allocate(soundBiteID, period, sampleCount)
+		if soundBite is None:
+			self.write(f'Bad sound bite ID: {soundBiteID}\r\n'.encode())
+			self.addTrace('badSoundBite', soundBiteID)
+
+		return soundBite
+
+	def readSoundBite(self):
+		self.bufferIdx = 1
+		soundBiteID = self.nextByteFromBuffer()
+		period = self.readUInt32FromBuffer()
+		sampleCount = self.readUInt32FromBuffer()
+
+		soundBite = self.allocateSoundBite(soundBiteID, period, sampleCount)
+		sampleBytes = self.readBytesBlocking(3 * sampleCount)
+		if soundBite is not None:
+			soundBite.samples = [tuple(sampleBytes[i*3:i*3+3]) for i in range(soundBite.storedCount)]
+
+	def readSoundBiteRuns(self):
+		self.bufferIdx = 1
+		soundBiteID = self.nextByteFromBuffer()
+		period = self.readUInt32FromBuffer()
+		sampleCount = self.readUInt32FromBuffer()
+		encodedSize = self.readUInt32FromBuffer()
+
+		soundBite = self.allocateSoundBite(soundBiteID, period, sampleCount)
+		samples = tools.decodeSampleRuns(self.readBytesBlocking(encodedSize))
+		if soundBite is not None:
+			soundBite.samples = samples[:soundBite.storedCount]
+
+	def readStreamCommand(self, cmd):
+		self.bufferIdx = 1
+
+		if cmd == vttSerial.CMD_STREAM_START:
+			period = self.nextByteFromBuffer()
+			leadTime = self.nextByteFromBuffer() + (self.nextByteFromBuffer() << 8)
+			self.streamBuffer.start(period, leadTime)
+
+		elif cmd == vttSerial.CMD_STREAM_SAMPLES:
+			firstIdx = self.readUInt32FromBuffer()
+			count = self.nextByteFromBuffer()
+			for i in range(count):
+				self.streamBuffer.addSample(firstIdx + i, tuple(self.readBytesBlocking(3)))
+				self.streamBuffer.update(self.millis())
+
+		elif cmd == vttSerial.CMD_STREAM_END:
+			self.streamBuffer.end(self.readUInt32FromBuffer())
+
+		elif cmd == vttSerial.CMD_STREAM_PLAY:
+			self.streamBuffer.play()
+
+	def update(self):
+		now = self.millis()
+
+		if not self.flushToLatestCommand():
+			return
+
+		# acknowledged as it runs, the commands it superseded were reported as skipped
+		self.ackSequence()
+
+		self.bufferIdx = 0
+		cmd = self.nextByteFromBuffer()
+
+		if cmd == NO_PHONE or cmd == vttSerial.CMD_HEADER:
+			pass
+		elif cmd == vttSerial.CMD_CALIBRATE:
+			self.grid.calibrate()
+		elif cmd == vttSerial.CMD_ACTUATOR_ENABLE:
+			self.grid.enable(self.nextByteFromBuffer(), 255, 0)
+		elif cmd == vttSerial.CMD_ACTUATOR_DISABLE:
+			self.grid.disable(self.nextByteFromBuffer())
+		elif cmd == vttSerial.CMD_PULSE_ACTUATOR:
+			actuatorID = self.nextByteFromBuffer()
+			self.grid.setActuatorIntensity(actuatorID, 255)
+			self.wait(now, 500)
+			self.grid.setActuatorIntensity(actuatorID, 0)
+		elif cmd == vttSerial.CMD_SET_ACTUATOR_INT:
+			actuatorID = self.nextByteFromBuffer()
+			self.grid.setActuatorIntensity(actuatorID, self.nextByteFromBuffer())
+		elif cmd == vttSerial.CMD_PITCH:
+			self.nextByteFromBuffer()
+		elif cmd == vttSerial.CMD_COMBINED_SIGNAL:
+			(phone, pitch, intensity) = [self.nextByteFromBuffer() for _ in range(3)]
+			if phone != NO_PHONE:
+				self.grid.enable(phone, intensity, pitch)
+		elif cmd == vttSerial.CMD_STOP:
+			self.streamBuffer.stop()
+			self.grid.disableAll()
+		elif cmd == vttSerial.CMD_SOUNDBITE or cmd == vttSerial.CMD_SOUNDBITE_RLE:
+			self.lastPing = now
+		elif cmd in streamCommands:
+			# already handed to the stream buffer as they were read
+			self.lastPing = now
+		elif cmd == vttSerial.CMD_PLAY_BITE:
+			self.streamBuffer.stop()
+			self.playBite(self.nextByteFromBuffer())
+			self.lastPing = self.millis()
+		elif cmd == vttSerial.CMD_PING:
+			self.lastPing = now
+		else:
+			self.addTrace('unknownCommand', cmd)
+
+		if cmd in flushingCommands:
+			self.flush()
+
+	def wait(self, startTime, duration):
+		# blocks like the firmware's busy loops, or just advances the clock when not realtime
+		remaining = startTime + duration - self.millis()
+		if remaining <= 0:
+			return
+
+		if self.realtime:
+			time.sleep(remaining / 1000)
+		else:
+			self.virtualOffset += remaining
+
+	def playBite(self, soundBiteID):
+		bite = self.soundBites.get(soundBiteID)
+		if bite is None:
+			return
+
+		startTime = self.millis()
+		self.addTrace('playBite', soundBiteID, deviceTime=startTime)
+
+		sampleCount = bite.storedCount
+		lastSample = (NO_PHONE, 0, 0)
+		for sampleIdx in range(sampleCount):
+			sample = bite.samples[sampleIdx]
+			if sample == lastSample:
+				continue
+
+			self.wait(startTime, sampleIdx * bite.period)
+
+			(phone, pitch, intensity) = sample
+			if phone < NO_PHONE and intensity > 0:
+				self.grid.enable(phone, intensity, pitch)
+
+			lastSample = sample
+
+		self.wait(startTime, sampleCount * bite.period)
+		self.grid.disableAll()
+
+	# Loop ------------------------------------------------------------------
+
+	def run(self):
+		while self.running:
+			# wake up for the stream's next sample, like the firmware's loop() would be there for it
+			timeout = .1
+			nextDueTime = self.streamBuffer.getNextDueTime()
+			if nextDueTime is not None:
+				timeout = min(timeout, max(0, nextDueTime - self.millis()) / 1000)
+
+			with self.inputReady:
+				self.releaseInput()
+				if len(self.inputBuffer) == 0 and self.running:
+					self.inputReady.wait(self.getInputTimeout(timeout))
+
+			try:
+				self.update()
+			except EOFError:
+				break
+
+			self.streamBuffer.update(self.millis())
+
+	def start(self, transport=None):
+		if transport is not None:
+			self.transport = transport
+			transport.device = self
+			transport.start()
+
+		self.running = True
+		self.thread = threading.Thread(target=self.run, daemon=True)
+		self.thread.start()
+
+	def stop(self):
+		self.running = False
+		with self.inputReady:
+			self.inputReady.notify_all()
+
+		self.thread.join()
+		if self.transport is not None:
+			self.transport.stop()
+
+class PtyTransport:
+	def __init__(self):
+		self.device = None
+		(self.masterFD, self.slaveFD) = os.openpty()
+		tty.setraw(self.slaveFD)
+		self.path = os.ttyname(self.slaveFD)
+		self.running = False
+
+	def start(self):
+		self.running = True
+		self.thread = threading.Thread(target=self.run, daemon=True)
+		self.thread.start()
+
+	def run(self):
+		while self.running:
+			(readable, _, _) = select.select([self.masterFD], [], [], .1)
+			if readable:
+				try:
+					self.device.receive(os.read(self.masterFD, 1<<16))
+				except OSError:
+					break
+
+	def write(self, data):
+		os.write(self.masterFD, data)
+
+	def stop(self):
+		self.running = False
+		self.thread.join()
+		os.close(self.masterFD)
+		os.close(self.slaveFD)
+
+	def __repr__(self):
+		return f'<{self.__class__.__name__}({self.path})>'
+
+class TcpTransport:
+	'''Accepts one client at a time, like the firmware's WiFiServer on port 1234'''
+	def __init__(self, port=1234, host='127.0.0.1'):
+		self.device = None
+		self.serverSocket = socket.create_server((host, port))
+		self.serverSocket.settimeout(.1)
+		(self.host, self.port) = self.serverSocket.getsockname()
+		self.connection = None
+		self.running = False
+
+	def start(self):
+		self.running = True
+		self.thread = threading.Thread(target=self.run, daemon=True)
+		self.thread.start()
+
+	def run(self):
+		while self.running:
+			try:
+				(self.connection, _) = self.serverSocket.accept()
+			except socket.timeout:
+				continue
+
+			while self.running:
+				(readable, _, _) = select.select([self.connection], [], [], .1)
+				if readable:
+					data = self.connection.recv(1<<16)
+					if len(data) == 0:
+						break
+
+					self.device.receive(data)
+
+			self.connection.close()
+			self.connection = None
+
+	def write(self, data):
+		if self.connection is not None:
+			self.connection.sendall(data)
+
+	def stop(self):
+		self.running = False
+		self.thread.join()
+		self.serverSocket.close()
+
+	def __repr__(self):
+		return f'<{self.__class__.__name__}({self.host}:{self.port})>'
+
+def summarizeTrace(trace):
+	'''Intervals between consecutive received commands of each type, in ms'''
+	lastTimes = {}
+	intervals = {}
+	for event in trace:
+		if not event.event.startswith('received:'):
+			continue
+
+		if event.event in lastTimes:
+			intervals.setdefault(event.event, []).append((event.hostTime - lastTimes[event.event]) * 1000)
+
+		lastTimes[event.event] = event.hostTime
+
+	return intervals
+
+if __name__ == '__main__':
+	import argparse
+	import statistics
+
+	parser = argparse.ArgumentParser(description='Simulated VTT device')
+	parser.add_argument('--pty', action='store_true', help='expose the device on a pseudo-terminal')
+	parser.add_argument('--tcp', type=int, nargs='?', const=1234, help='expose the device on a TCP port')
+	parser.add_argument('--fast', action='store_true', help="don't play bites in real time")
+	parser.add_argument('--trace', help='write the event trace to this CSV file on exit')
+	parser.add_argument('--lead-time', type=int, help='play streams with this lead time (ms) instead of the one hosts ask for')
+	parser.add_argument('--baud', type=int, help='deliver received bytes no faster than a serial line at this rate')
+
+	args = parser.parse_args()
+
+	if args.tcp is not None:
+		transport = TcpTransport(args.tcp)
+	else:
+		transport = PtyTransport()
+
+	device = SimulatedDevice(realtime=not args.fast, leadTime=args.lead_time, baudRate=args.baud)
+	device.start(transport)
+	print(f'Simulated device listening on {transport}')
+
+	try:
+		while True:
+			time.sleep(1)
+	except KeyboardInterrupt:
+		pass
+
+	device.stop()
+
+	for event,intervals in summarizeTrace(device.getTrace()).items():
+		if len(intervals) > 1:
+			print(f'{event:>32}: n={len(intervals)+1} mean={statistics.mean(intervals):.2f}ms stdev={statistics.stdev(intervals):.2f}ms')
+
+	for report in device.streamBuffer.reports:
+		print(f'{"stream":>32}: {report.asDict()}')
+
+	if args.trace is not None:
+		device.saveTrace(args.trace)
+		print('Wrote', args.trace)
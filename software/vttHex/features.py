@@ -0,0 +1,215 @@
+import sys
+import struct
+import logging
+import pathlib
+
+import numpy as np
+
+'''
+Per-stimulus analysis features in one binary file (.vtf)
+
+The analysis stages leave three text files per stimulus next to its WAV: FCN-f0's
+`<name>.f0.csv`, calcLoudness' `<name>.loudness.csv` and MFA's `grids/<name>.TextGrid`.
+They're parsed once and packed into `<name>.vtf`, which makeVttBinary and
+SignalPlayer read with a single mmap instead. Every series keeps its own timebase.
+A .vtf that's older than any of the analysis files is ignored until it's repacked.
+
+Format
+	Header
+		3s        VTF
+		B         File format version
+		I         Chunk count
+	Index, for each chunk
+		4s        Chunk ID
+		B         Type (0 = float64 array, 1 = UTF-8 text, one line per label)
+		I         Rows
+		I         Columns
+		Q         Offset of the chunk's data from the start of the file (8-byte aligned)
+		Q         Size in bytes
+	Chunks
+		phnt      Phone start times, plus the end of the last phone (s)
+		phnl      Phone labels
+		word      Word labels
+		f0        time (s), f0 (Hz), confidence
+		loud      time (s), loudness (sone), only if there was a loudness CSV
+
+	python -m vttHex.features wav/*.wav
+'''
+
+headerFormat = '<3sBI'
+chunkFormat = '<4sBIIQQ'
+formatVersion = 0
+
+CHUNK_FLOATS = 0
+CHUNK_TEXT = 1
+
+class StimulusFeatures:
+	def __init__(self, phoneTimes, phoneLabels, words, pitch, loudness=None):
+		self.phoneTimes = phoneTimes
+		self.phoneLabels = phoneLabels
+		self.words = words
+		self.pitch = pitch
+		self.loudness = loudness
+
+	def getChunks(self):
+		chunks = {
+			b'phnt': np.asarray(self.phoneTimes, dtype='<f8').reshape(-1, 1),
+			b'phnl': list(self.phoneLabels),
+			b'word': list(self.words),
+			b'f0  ': np.asarray(self.pitch, dtype='<f8').reshape(-1, 3),
+		}
+		if self.loudness is not None:
+			chunks[b'loud'] = np.asarray(self.loudness, dtype='<f8').reshape(-1, 2)
+
+		return chunks
+
+	def save(self, path):
+		path = pathlib.Path(path)
+		chunks = self.getChunks()
+
+		index = b''
+		data = b''
+		offset = struct.calcsize(headerFormat) + len(chunks) * struct.calcsize(chunkFormat)
+		for chunkID,chunk in chunks.items():
+			padding = -offset % 8
+			data += bytes(padding)
+			offset += padding
+
+			if isinstance(chunk, np.ndarray):
+				chunkBytes = chunk.tobytes()
+				index += struct.pack(chunkFormat, chunkID, CHUNK_FLOATS, chunk.shape[0], chunk.shape[1], offset, len(chunkBytes))
+			else:
+				chunkBytes = '\n'.join(chunk).encode()
+				index += struct.pack(chunkFormat, chunkID, CHUNK_TEXT, len(chunk), 1, offset, len(chunkBytes))
+
+			data += chunkBytes
+			offset += len(chunkBytes)
+
+		tmpPath = path.parent/(path.name + '.tmp')
+		with open(tmpPath, 'wb') as outputFile:
+			outputFile.write(struct.pack(headerFormat, b'VTF', formatVersion, len(chunks)))
+			outputFile.write(index)
+			outputFile.write(data)
+		tmpPath.replace(path)
+
+	def __repr__(self):
+		return f'<{self.__class__.__name__}({len(self.phoneLabels)} phones, {len(self.pitch)} f0 frames, {0 if self.loudness is None else len(self.loudness)} loudness frames)>'
+
+def loadFeatures(path):
+	'''Maps a .vtf file, its arrays are read-only views of the mapping'''
+	mapped = np.memmap(path, dtype=np.uint8, mode='r')
+
+	(magic, version, chunkCount) = struct.unpack_from(headerFormat, mapped, 0)
+	if magic != b'VTF':
+		raise ValueError(f'{path} is not a feature file')
+
+	chunks = {}
+	indexOffset = struct.calcsize(headerFormat)
+	for chunkIdx in range(chunkCount):
+		(chunkID, chunkType, rows, columns, offset, size) = struct.unpack_from(chunkFormat, mapped, indexOffset + chunkIdx*struct.calcsize(chunkFormat))
+		chunkData = mapped[offset:offset+size]
+
+		if chunkType == CHUNK_FLOATS:
+			chunks[chunkID] = chunkData.view('<f8').reshape(rows, columns)
+		elif rows == 0:
+			chunks[chunkID] = []
+		else:
+			chunks[chunkID] = bytes(chunkData).decode().split('\n')
+
+	return StimulusFeatures(
+		chunks[b'phnt'][:,0],
+		chunks[b'phnl'],
+		chunks[b'word'],
+		chunks[b'f0  '],
+		chunks.get(b'loud'),
+	)
+
+def readPitchCSV(path):
+	'''
+	Reads FCN-f0 output into (time, f0, confidence) rows
+
+	The files have no header and whitespace separated columns
+	'''
+	return np.loadtxt(path, dtype=float, ndmin=2)[:,0:3]
+
+def readLoudnessCSV(path):
+	'''Reads a `time,loudness` CSV (see calcLoudness) into (time, loudness) rows'''
+	return np.loadtxt(path, dtype=float, delimiter=',', skiprows=1, ndmin=2)[:,0:2]
+
+def readTextGrid(path):
+	from praatio import tgio
+
+	textgrid = tgio.openTextgrid(str(path))
+
+	# each phone starts at its interval, and the last one ends in silence
+	phonegrid = textgrid.tierDict['phones'].entryList
+	phoneTimes = [start for (start, stop, label) in phonegrid] + [phonegrid[-1][1]]
+	phoneLabels = [label for (start, stop, label) in phonegrid]
+	words = [label for (start, stop, label) in textgrid.tierDict['words'].entryList]
+
+	return (phoneTimes, phoneLabels, words)
+
+def getAnalysisPaths(folder, name):
+	folder = pathlib.Path(folder)
+	return (
+		folder/'grids'/(name + '.TextGrid'),
+		folder/(name + '.f0.csv'),
+		folder/(name + '.loudness.csv'),
+	)
+
+def getFeaturePath(folder, name):
+	return pathlib.Path(folder)/(name + '.vtf')
+
+def readAnalysisFiles(folder, name):
+	'''Parses the text outputs of the analysis stages, without a loudness CSV if there isn't one'''
+	(textGridFile, pitchFile, loudnessFile) = getAnalysisPaths(folder, name)
+
+	(phoneTimes, phoneLabels, words) = readTextGrid(textGridFile)
+	loudness = readLoudnessCSV(loudnessFile) if loudnessFile.exists() else None
+
+	return StimulusFeatures(np.array(phoneTimes, dtype=float), phoneLabels, words, readPitchCSV(pitchFile), loudness)
+
+def getStaleFeatureSources(folder, name):
+	'''The analysis files that changed after the stimulus' .vtf file was packed'''
+	packedTime = getFeaturePath(folder, name).stat().st_mtime_ns
+	return [f for f in getAnalysisPaths(folder, name) if f.exists() and f.stat().st_mtime_ns > packedTime]
+
+def hasCurrentFeatureFile(folder, name):
+	return getFeaturePath(folder, name).exists() and len(getStaleFeatureSources(folder, name)) == 0
+
+def openFeatures(folder, name):
+	'''The stimulus' .vtf file if it's up to date, otherwise its analysis files'''
+	featurePath = getFeaturePath(folder, name)
+	if featurePath.exists():
+		staleSources = getStaleFeatureSources(folder, name)
+		if len(staleSources) == 0:
+			return loadFeatures(featurePath)
+
+		logging.warning(f'{featurePath} is older than {", ".join(f.name for f in staleSources)}, reading those instead (repack with `python -m vttHex.features`)')
+
+	return readAnalysisFiles(folder, name)
+
+def makeFeatureFile(wavFile):
+	wavFile = pathlib.Path(wavFile)
+	folder = wavFile.parent
+	name = wavFile.stem
+
+	filesOk = True
+	for f in getAnalysisPaths(folder, name):
+		if not f.exists():
+			print('Missing constituent file:', f)
+			filesOk = False
+
+	if not filesOk:
+		return None
+
+	featurePath = getFeaturePath(folder, name)
+	readAnalysisFiles(folder, name).save(featurePath)
+
+	return featurePath
+
+if __name__ == '__main__':
+	from multiprocessing import Pool
+
+	with Pool() as pool:
+		pool.map(makeFeatureFile, sys.argv[1:])
@@ -1,6 +1,5 @@
 import sys, os
 import pathlib
-from praatio import tgio
 import csv
 import wave
 import struct
@@ -8,7 +7,8 @@ import math
 import audioop
 from tqdm import tqdm
 
-from vttHex.tools import SignalPlayer, formatSignalAsBytes
+from vttHex import features
+from vttHex.tools import SignalPlayer
 
 
 '''
@@ -32,13 +32,14 @@ Format
 '''
 
 # run with python3 makeVttBinary ./*.wav
-# expects .wav, .f0.csv, in same folder, .TextGrid in `grids/` subfolder
+# expects .wav and .vtf in same folder (see vttHex.features), or
+# .wav, .f0.csv, .loudness.csv in same folder, .TextGrid in `grids/` subfolder
 
 #def asSequence(phoneSeries, pitchSeries, intensitySeries, period):
 #	while not (phoneSeries.isDone() or pitchSeries.isDone() or intensitySeries.isDone()):
 #		yield update(period)
 
-def makeVttBinary(inFile):
+def makeVttBinary(inFile, outputFolder='.'):
 	inFile = pathlib.Path(inFile)
 	folder = inFile.parent
 
@@ -47,12 +48,13 @@ def makeVttBinary(inFile):
 
 	# check for constituent files
 	wavFile = inFile
-	pitchFile = pathlib.Path(folder/(name+'.f0.csv'))
-	loudnessFile = pathlib.Path(folder/(name+'.loudness.csv'))
-	textGridFile = pathlib.Path(folder/'grids'/(name+'.TextGrid'))
+	if features.hasCurrentFeatureFile(folder, name):
+		constituentFiles = [wavFile, features.getFeaturePath(folder, name)]
+	else:
+		constituentFiles = [wavFile, *features.getAnalysisPaths(folder, name)]
 
 	filesOk = True
-	for f in [wavFile, pitchFile, loudnessFile, textGridFile]:
+	for f in constituentFiles:
 		if not f.exists():
 			print('Missing constituent file:', f)
 			filesOk = False
@@ -60,27 +62,24 @@ def makeVttBinary(inFile):
 	if not filesOk:
 		return
 
+	stimulusFeatures = features.openFeatures(folder, name)
+
 	# Load text data
-	tg = tgio.openTextgrid(str(textGridFile))
-	transcriptions = { 'written': '', 'phonetic': ''}
-	for tierName in ['words', 'phones']:
-		intervals = tg.tierDict[tierName].entryList
-		textParts = [interval.label for interval in intervals]
-		transcriptions[tierName] = ' '.join(textParts)
+	transcriptions = {
+		'words': ' '.join(stimulusFeatures.words),
+		'phones': ' '.join(stimulusFeatures.phoneLabels),
+	}
 
 	# Load time-series data
 	period = 1 # milliseconds
 
 	signalPlayer = SignalPlayer()
-	signalPlayer.open(name, folder)
-	samples = signalPlayer.asSequence(period/1000)
-	samplesAsBytes = [formatSignalAsBytes(a,b,c) for a,b,c in samples]
-	flattendSamples = [y for x in samplesAsBytes for y in x]
+	signalPlayer.openFeatures(stimulusFeatures)
+	samples = signalPlayer.asByteMatrix(period/1000)
 
 	# Pack data
 	wordCharCount = len(transcriptions['words'])
 	phoneCharCount = len(transcriptions['phones'])
-	sampleByteCount = len(flattendSamples)
 
 	structFormat = '3s'                         # magic bytes
 	structFormat += 'B'                         # file format version
@@ -91,7 +90,6 @@ def makeVttBinary(inFile):
 	structFormat += 'I'                         # sample period
 	structFormat += str(wordCharCount) + 's'    # written text
 	structFormat += str(phoneCharCount) + 's'   # phonetic text
-	structFormat += str(sampleByteCount) + 'B'  # samples
 
 	data = [
 		b'VTT',                                 # magic bytes
@@ -99,22 +97,54 @@ def makeVttBinary(inFile):
 		0x0,                                    # flags (no WAV)
 		len(transcriptions['words']),           # size of written text
 		len(transcriptions['phones']),          # size of phonetic text
-		int(sampleByteCount/3),                 # sample count
+		len(samples),                           # sample count
 		period,                                 # sample period
 		transcriptions['words'].encode(),       # written text
 		transcriptions['phones'].encode(),      # phonetic text
-		*flattendSamples                        # samples
 	]
 
-	packedData = struct.pack(structFormat, *data)
+	packedData = struct.pack(structFormat, *data) + samples.tobytes()
 
 	# Write file
-	with open(name + '.vtt', 'wb') as outputFile:
+	with open(pathlib.Path(outputFolder)/(name + '.vtt'), 'wb') as outputFile:
 		outputFile.write(packedData)
 
+def makeVttBank(outFile, vttFiles):
+	'''
+	Packs existing .vtt files into a single indexed bank (see parseVTT.VTTBank)
+	'''
+	vttFiles = sorted(pathlib.Path(f) for f in vttFiles)
+	names = [f.stem.encode() for f in vttFiles]
+
+	indexSize = sum(struct.calcsize('H') + len(name) + struct.calcsize('II') for name in names)
+	offset = struct.calcsize('3sBI') + indexSize
+
+	index = b''
+	records = []
+	for name,vttFile in zip(names, vttFiles):
+		record = vttFile.read_bytes()
+		index += struct.pack('H', len(name)) + name + struct.pack('II', offset, len(record))
+		records.append(record)
+		offset += len(record)
+
+	with open(outFile, 'wb') as outputFile:
+		outputFile.write(struct.pack('3sBI', b'VTB', 0x0, len(records)))
+		outputFile.write(index)
+		for record in records:
+			outputFile.write(record)
 
 if __name__ == '__main__':
+	import argparse
 	from multiprocessing import Pool
 
-	with Pool() as pool:
-		pool.map(makeVttBinary, sys.argv[1:])
+	parser = argparse.ArgumentParser()
+	parser.add_argument('--bank', help='pack the given .vtt files into this bank file instead')
+	parser.add_argument('files', nargs='+')
+
+	args = parser.parse_args()
+
+	if args.bank is not None:
+		makeVttBank(args.bank, args.files)
+	else:
+		with Pool() as pool:
+			pool.map(makeVttBinary, args.files)
@@ -1,5 +1,12 @@
+import os
 import struct
+import logging
 import pathlib
+import mmap
+import collections
+import fnmatch
+
+import numpy as np
 
 from . import tools
 from . import serial
@@ -14,6 +21,15 @@ fixedHeaderFormat += 'I' # sample period
 
 fixedHeaderFields = ('magicBytes', 'version', 'flags', 'writtenTextSize', 'phoneticTextSize', 'sampleCount', 'samplePeriod')
 sampleFields = ('phone', 'pitch', 'intensity')
+sampleDType = np.dtype([(field, np.uint8) for field in sampleFields])
+
+bankHeaderFormat = '3s' # magic bytes
+bankHeaderFormat += 'B' # bank format version
+bankHeaderFormat += 'I' # entry count
+
+bankHeaderFields = ('magicBytes', 'version', 'entryCount')
+bankIndexEntryFields = ('offset', 'size')
+bankSuffix = '.vttbank'
 
 class VTTFile:
 	def __init__(self, fileVersion, flags, samplePeriod, writtenText, phoneticText, rawSamples, filepath=None):
@@ -22,17 +38,18 @@ class VTTFile:
 		self.samplePeriod = samplePeriod
 		self.writtenText = writtenText
 		self.phoneticText = phoneticText
-		self.sampleCount = int(len(rawSamples)/3)
-		self.samples = rawSamples
 		self.filepath = filepath
 
+		# flat (phone, pitch, intensity, ...) bytes and a structured view of the same buffer
+		self.samples = np.frombuffer(rawSamples, dtype=np.uint8)
+		self.sampleRecords = self.samples.view(sampleDType)
+		self.sampleCount = len(self.sampleRecords)
+
 		self.sampleDicts = None
 
 	def getSamplesAsDicts(self):
 		if self.sampleDicts is None:
-			self.sampleDicts = []
-			for idx in range(0, len(self.samples), 3):
-				self.sampleDicts.append(dict(zip(sampleFields, self.samples[idx:idx+3])))
+			self.sampleDicts = [dict(zip(sampleFields, record)) for record in self.sampleRecords.tolist()]
 
 		return self.sampleDicts
 
@@ -60,21 +77,104 @@ class VTTFile:
 		return self.sampleCount * self.samplePeriod
 
 	def getPhoneticSamples(self):
-		return [x['phone'] for x in self.getSamplesAsDicts()]
+		return self.sampleRecords['phone']
 
 	def getPitchSamples(self):
-		return [x['pitch'] for x in self.getSamplesAsDicts()]
+		return self.sampleRecords['pitch']
 
 	def getIntensitySamples(self):
-		return [x['intensity'] for x in self.getSamplesAsDicts()]
+		return self.sampleRecords['intensity']
 
 	def __repr__(self):
 		return f'<{self.__class__.__name__}({self.filepath})'
 
+class MappedVTTFile(VTTFile):
+	'''
+	A VTTFile read from a memory-mapped file
+
+	Only the fixed header is read when it's created, with a plain read. The file is
+	mapped the first time the text or sample payloads are accessed, and they're decoded
+	from the map. Changes to the file are only picked up when it's mapped again, or by
+	reload().
+	'''
+	def __init__(self, sourcePath, offset=0, filepath=None):
+		self.sourcePath = pathlib.Path(sourcePath)
+		self.offset = offset
+		self.filepath = self.sourcePath if filepath is None else filepath
+
+		self.readHeader()
+		self.sampleDicts = None
+
+	def readHeader(self):
+		with self.sourcePath.open('rb') as fileHandle:
+			self.fileState = getFileState(fileHandle)
+			fileHandle.seek(self.offset)
+			header = readStruct(fileHandle, fixedHeaderFormat, fixedHeaderFields)
+
+		if header['magicBytes'] != b'VTT':
+			raise ValueError(f'{self.filepath} is not a VTT file')
+
+		self.fileVersion = header['version']
+		self.flags = header['flags']
+		self.samplePeriod = header['samplePeriod']
+		self.sampleCount = header['sampleCount']
+
+		self.writtenTextOffset = self.offset + struct.calcsize(fixedHeaderFormat)
+		self.writtenTextSize = header['writtenTextSize']
+		self.phoneticTextOffset = self.writtenTextOffset + self.writtenTextSize
+		self.phoneticTextSize = header['phoneticTextSize']
+		self.sampleOffset = self.phoneticTextOffset + self.phoneticTextSize
+
+	def reload(self):
+		'''Reads the header again if the file has changed since it was mapped'''
+		(_, fileState) = mapFile(self.sourcePath)
+		if fileState != self.fileState:
+			self.readHeader()
+			self.sampleDicts = None
+
+	@property
+	def buffer(self):
+		(buffer, fileState) = getMappedFile(self.sourcePath)
+		if fileState != self.fileState:
+			# mapped before this header was read, or evicted and mapped again since
+			self.reload()
+			(buffer, fileState) = getMappedFile(self.sourcePath)
+
+		return buffer
+
+	@property
+	def writtenText(self):
+		buffer = self.buffer
+		return buffer[self.writtenTextOffset:self.phoneticTextOffset].decode('ascii')
+
+	@property
+	def phoneticText(self):
+		buffer = self.buffer
+		return buffer[self.phoneticTextOffset:self.sampleOffset].decode('ascii')
+
+	@property
+	def samples(self):
+		buffer = self.buffer
+		return np.frombuffer(buffer, dtype=np.uint8, count=3*self.sampleCount, offset=self.sampleOffset)
+
+	@property
+	def sampleRecords(self):
+		return self.samples.view(sampleDType)
+
+	def __getstate__(self):
+		return {
+			'sourcePath': self.sourcePath,
+			'offset': self.offset,
+			'filepath': self.filepath,
+		}
+
+	def __setstate__(self, state):
+		self.__init__(state['sourcePath'], state['offset'], state['filepath'])
+
 class StructBuffer:
-	def __init__(self, bytes):
+	def __init__(self, bytes, pointer=0):
 		self.buffer = bytes
-		self.pointer = 0
+		self.pointer = pointer
 
 	def read(self, format, fieldNames=None):
 		data = struct.unpack_from(format, self.buffer, self.pointer)
@@ -85,6 +185,12 @@ class StructBuffer:
 
 		return data
 
+	def readBytes(self, count):
+		data = memoryview(self.buffer)[self.pointer:self.pointer+count]
+		self.pointer += count
+
+		return data
+
 def loadVTTBytes(bytes):
 	buffer = StructBuffer(bytes)
 
@@ -92,7 +198,7 @@ def loadVTTBytes(bytes):
 	writtenText = buffer.read(f'{header["writtenTextSize"]}s')[0].decode('ascii')
 	phoneticText = buffer.read(f'{header["phoneticTextSize"]}s')[0].decode('ascii')
 
-	sampleBytes = buffer.read(f'{3*header["sampleCount"]}B')
+	sampleBytes = buffer.readBytes(3*header['sampleCount'])
 
 	return VTTFile(
 		header['version'],
@@ -111,6 +217,200 @@ def loadVTTFile(filename):
 
 	return vtt
 
+# each map holds a file descriptor, so only the most recently used ones are kept open
+maxMappedFiles = 64
+mappedFiles = collections.OrderedDict()
+
+def getFileState(fileHandle):
+	stat = os.fstat(fileHandle.fileno())
+	return (stat.st_mtime_ns, stat.st_size)
+
+def readStruct(fileHandle, format, fieldNames=None):
+	size = struct.calcsize(format)
+	data = fileHandle.read(size)
+	if len(data) < size:
+		raise ValueError(f'{fileHandle.name} is truncated')
+
+	data = struct.unpack(format, data)
+	if fieldNames is not None:
+		data = dict(zip(fieldNames, data))
+
+	return data
+
+def mapFile(filename):
+	'''
+	A read-only map of a file and the (mtime, size) it had when it was mapped
+
+	Maps are shared and reused until the file changes on disk. Past `maxMappedFiles`, the
+	least recently used one is closed, or left to be freed with the last array that
+	views it.
+	'''
+	filepath = pathlib.Path(filename)
+	with filepath.open('rb') as fileHandle:
+		fileState = getFileState(fileHandle)
+		if filepath in mappedFiles and mappedFiles[filepath][1] == fileState:
+			mappedFiles.move_to_end(filepath)
+			return mappedFiles[filepath]
+
+		unmapFile(filepath)
+		mappedFiles[filepath] = (mmap.mmap(fileHandle.fileno(), 0, access=mmap.ACCESS_READ), fileState)
+
+	while len(mappedFiles) > maxMappedFiles:
+		unmapFile(next(iter(mappedFiles)))
+
+	return mappedFiles[filepath]
+
+def getMappedFile(filename):
+	'''Like mapFile, but a file that's already mapped isn't checked for changes'''
+	filepath = pathlib.Path(filename)
+	if filepath in mappedFiles:
+		mappedFiles.move_to_end(filepath)
+		return mappedFiles[filepath]
+
+	return mapFile(filepath)
+
+def unmapFile(filename):
+	(buffer, fileState) = mappedFiles.pop(pathlib.Path(filename), (None, None))
+	if buffer is not None:
+		try:
+			buffer.close()
+		except BufferError:
+			# samples are still viewing it
+			pass
+
+def mapVTTFile(filename):
+	return MappedVTTFile(filename)
+
+class VTTBank:
+	'''
+	A packed collection of VTT records, indexed by stimulus name (the original file stem)
+
+	Format
+		Header
+			0:2       VTB
+			3         Bank format version
+			4:7       # entries
+		Index, one per entry
+			H         # bytes for name
+			x         name
+			I         offset of the VTT record from the start of the bank
+			I         # bytes in the VTT record
+		Data
+			VTT records back to back
+	'''
+	def __init__(self, filename):
+		self.filepath = pathlib.Path(filename)
+		self.folder = self.filepath.with_suffix('')
+		self.vttFiles = {}
+
+		self.readIndex()
+
+	def readIndex(self):
+		self.index = {}
+		with self.filepath.open('rb') as fileHandle:
+			self.fileState = getFileState(fileHandle)
+			header = readStruct(fileHandle, bankHeaderFormat, bankHeaderFields)
+			if header['magicBytes'] != b'VTB':
+				raise ValueError(f'{self.filepath} is not a VTT bank')
+
+			for _ in range(header['entryCount']):
+				nameSize = readStruct(fileHandle, 'H')[0]
+				name = readStruct(fileHandle, f'{nameSize}s')[0].decode('ascii')
+				self.index[name] = readStruct(fileHandle, 'II', bankIndexEntryFields)
+
+	def names(self):
+		return list(self.index.keys())
+
+	def get(self, name):
+		if name not in self.vttFiles:
+			logicalPath = self.folder/(name + '.vtt')
+			self.vttFiles[name] = MappedVTTFile(self.filepath, self.index[name]['offset'], logicalPath)
+
+		return self.vttFiles[name]
+
+	def glob(self, pattern):
+		return [self.get(name) for name in self.index if fnmatch.fnmatchcase(name + '.vtt', pattern)]
+
+	def reload(self):
+		'''Reads the index again if the bank was repacked since it was opened'''
+		with self.filepath.open('rb') as fileHandle:
+			if getFileState(fileHandle) == self.fileState:
+				return
+
+		self.readIndex()
+		self.vttFiles = {name: vttFile for name,vttFile in self.vttFiles.items() if name in self.index}
+		for name,vttFile in self.vttFiles.items():
+			vttFile.offset = self.index[name]['offset']
+			vttFile.reload()
+
+	def close(self):
+		unmapFile(self.filepath)
+
+	def __contains__(self, name):
+		return name in self.index
+
+	def __len__(self):
+		return len(self.index)
+
+	def __repr__(self):
+		return f'<{self.__class__.__name__}({self.filepath})'
+
+class VTTFolder:
+	'''Loose .vtt files in a folder, with the same interface as VTTBank'''
+	def __init__(self, folder):
+		self.folder = pathlib.Path(folder)
+
+	def names(self):
+		return [f.stem for f in self.folder.glob('*.vtt')]
+
+	def get(self, name):
+		return mapVTTFile(self.folder/(name + '.vtt'))
+
+	def glob(self, pattern):
+		return [mapVTTFile(f) for f in self.folder.glob(pattern) if f.suffix == '.vtt']
+
+	def close(self):
+		for filepath in list(mappedFiles):
+			if filepath.parent == self.folder:
+				unmapFile(filepath)
+
+	def __contains__(self, name):
+		return (self.folder/(name + '.vtt')).exists()
+
+	def __len__(self):
+		return len(self.names())
+
+	def __repr__(self):
+		return f'<{self.__class__.__name__}({self.folder})'
+
+def getStaleBankSources(folder):
+	'''The .vtt files in a stimulus folder that changed after its bank was packed'''
+	folder = pathlib.Path(folder)
+	packedTime = folder.with_suffix(bankSuffix).stat().st_mtime_ns
+	return [f for f in folder.glob('*.vtt') if f.stat().st_mtime_ns > packedTime]
+
+def openVTTBank(path):
+	'''
+	Opens a VTT bank file, or the bank packed next to a stimulus folder
+
+	E.g., `assets/vtt` opens `assets/vtt.vttbank` if it exists, otherwise the loose
+	.vtt files in `assets/vtt/`. A bank that's older than any of the loose files is
+	ignored until it's repacked.
+	'''
+	path = pathlib.Path(path)
+	if path.suffix == bankSuffix:
+		return VTTBank(path)
+
+	bankPath = path.with_suffix(bankSuffix)
+	if bankPath.exists():
+		staleSources = getStaleBankSources(path)
+		if len(staleSources) == 0:
+			return VTTBank(bankPath)
+
+		logging.warning(f'{bankPath} is older than {len(staleSources)} file(s) in {path} (e.g., {staleSources[0].name}), reading those instead (repack with `python -m vttHex.makeVttBinary --bank {bankPath} {path}/*.vtt`)')
+
+	return VTTFolder(path)
+
 if __name__ == '__main__':
 	import sys
 	import argparse
@@ -140,10 +440,9 @@ if __name__ == '__main__':
 
 		if args.device is not None:
 			duration = vttFile.getDuration() / 1000
-			samples = [vttFile.samples[i:i+3] for i in range(0, len(vttFile.samples), 3)]
 			print('Sending', filename, 'to', args.device, '...')
 
-			device.sendFile(vttFile.samplePeriod, samples)
+			device.sendFile(vttFile.samplePeriod, vttFile.samples)
 			time.sleep(duration/2)
 			print('Play', filename)
 			device.sendPlayBite()
@@ -2,6 +2,8 @@ import time
 import serial
 import socket
 
+import numpy as np
+
 from . import tools
 
 CMD_HEADER           = 0x00
@@ -14,31 +16,85 @@ CMD_COMBINED_SIGNAL  = 0x06
 CMD_STOP             = 0x07
 CMD_SOUNDBITE        = 0x08
 CMD_PLAY_BITE        = 0x09
+CMD_SET_ACTUATOR_INT = 0x0A
+CMD_PULSE_ACTUATOR   = 0x0B
+CMD_PING             = 0x0C
+CMD_SOUNDBITE_RLE    = 0x0D
+CMD_SEQUENCE         = 0x0E
+CMD_STREAM_START     = 0x0F
+CMD_STREAM_SAMPLES   = 0x10
+CMD_STREAM_END       = 0x11
+CMD_STREAM_PLAY      = 0x12
+
+# fixed payload sizes, mirrors CMD_PAYLOAD_SIZES in firmware/src/CommandStream.cpp
+# (SOUNDBITE is followed by 3 bytes per sample, SOUNDBITE_RLE by its encoded byte count)
+CMD_PAYLOAD_SIZES = {
+	CMD_HEADER:           0,
+	CMD_CALIBRATE:        0,
+	CMD_ACTUATOR_ENABLE:  1,
+	CMD_ACTUATOR_DISABLE: 1,
+	CMD_PITCH:            1,
+	CMD_INTENSITY:        1,
+	CMD_COMBINED_SIGNAL:  3,
+	CMD_STOP:             0,
+	CMD_SOUNDBITE:        9,
+	CMD_PLAY_BITE:        1,
+	CMD_SET_ACTUATOR_INT: 2,
+	CMD_PULSE_ACTUATOR:   1,
+	CMD_PING:             0,
+	CMD_SOUNDBITE_RLE:    13,
+	CMD_SEQUENCE:         2,
+	CMD_STREAM_START:     3,
+	CMD_STREAM_SAMPLES:   5,
+	CMD_STREAM_END:       4,
+	CMD_STREAM_PLAY:      0,
+}
+
+# CMD_STREAM_SAMPLES has a one-byte sample count
+maxSamplesPerStreamPacket = 255
+# as a stream's lead time, buffers samples until CMD_STREAM_PLAY
+STREAM_HOLD = 0xFFFF
 
 minIntensity = 144
 
 class StreamComms():
-	def __init__(self, stream=None):
+	def __init__(self, stream=None, compressSoundBites=False):
 		self.lastCombination = (0,0,0)
 		self.stream = stream
+		self.compressSoundBites = compressSoundBites
 
 	def sendFile(self, period, samples):
+		'''
+		Uploads a sound bite in a single write
+
+		`samples` is either a uint8 array of already-formatted (phone, pitch, intensity)
+		bytes, like SignalPlayer.asByteMatrix or VTTFile.samples, or a sequence of raw
+		signals as produced by SignalPlayer.asSequence
+
+		With compressSoundBites set, the bite is sent as CMD_SOUNDBITE_RLE instead
+		(see tools.encodeSampleRuns)
+		'''
+		if isinstance(samples, np.ndarray) and samples.dtype == np.uint8:
+			samples = samples.reshape(-1, 3)
+		else:
+			samples = tools.formatSignalsAsBytes(samples)
+
 		lenAsBytes = len(samples).to_bytes(length=4, byteorder='little')
 		periodAsBytes = period.to_bytes(length=4, byteorder='little')
-		msg = bytearray([ CMD_HEADER, CMD_SOUNDBITE, 0, *periodAsBytes, *lenAsBytes ])
-		self._send(msg)
 
-		for idx,sample in enumerate(samples):
-			cell = sample[0]
-			if isinstance(sample[1], list):
-				pitch = sample[1][0]
-			else:
-				pitch = sample[1]
+		if self.compressSoundBites:
+			payload = np.frombuffer(tools.encodeSampleRuns(samples), dtype=np.uint8)
+			payloadSizeAsBytes = len(payload).to_bytes(length=4, byteorder='little')
+			header = [ CMD_HEADER, CMD_SOUNDBITE_RLE, 0, *periodAsBytes, *lenAsBytes, *payloadSizeAsBytes ]
+		else:
+			payload = samples.ravel()
+			header = [ CMD_HEADER, CMD_SOUNDBITE, 0, *periodAsBytes, *lenAsBytes ]
 
-			intensity = sample[2]
+		msg = bytearray(len(header) + payload.size)
+		msg[:len(header)] = bytes(header)
+		np.frombuffer(msg, dtype=np.uint8)[len(header):] = payload
 
-			sampleAsBytes = tools.formatSignalAsBytes(cell, pitch, intensity)
-			self._send(sampleAsBytes)
+		self._send(msg)
 
 	def sendPlayBite(self):
 		msg = bytearray([ CMD_HEADER, CMD_PLAY_BITE, 0 ])
@@ -73,6 +129,61 @@ class StreamComms():
 		])
 		self._send(msg)
 
+	def sendStreamStart(self, period, leadTime):
+		'''
+		Starts a timestamped stream (see firmware/src/StreamBuffer.h)
+
+		The device plays sample n at `leadTime` ms after the first sample arrives, plus
+		n * `period` ms. Samples that arrive within the lead time play at a constant
+		latency regardless of when they were sent.
+		'''
+		msg = bytearray([
+			CMD_HEADER,
+			CMD_STREAM_START,
+			period,
+			*leadTime.to_bytes(length=2, byteorder='little'),
+		])
+		self._send(msg)
+
+	def sendStreamSamples(self, firstSampleIdx, samples):
+		'''
+		Sends samples of the current stream, starting at index `firstSampleIdx`
+
+		`samples` is in either of the forms sendFile takes. More than
+		maxSamplesPerStreamPacket samples are split across packets.
+		'''
+		if isinstance(samples, np.ndarray) and samples.dtype == np.uint8:
+			samples = samples.reshape(-1, 3)
+		else:
+			samples = tools.formatSignalsAsBytes(samples)
+
+		for offset in range(0, len(samples), maxSamplesPerStreamPacket):
+			chunk = samples[offset:offset+maxSamplesPerStreamPacket]
+			header = [
+				CMD_HEADER, CMD_STREAM_SAMPLES,
+				*(firstSampleIdx + offset).to_bytes(length=4, byteorder='little'),
+				len(chunk),
+			]
+
+			msg = bytearray(len(header) + chunk.size)
+			msg[:len(header)] = bytes(header)
+			np.frombuffer(msg, dtype=np.uint8)[len(header):] = chunk.ravel()
+
+			self._send(msg)
+
+	def sendStreamPlay(self):
+		'''Starts a stream that was started with a lead time of STREAM_HOLD'''
+		msg = bytearray([ CMD_HEADER, CMD_STREAM_PLAY ])
+		self._send(msg)
+
+	def sendStreamEnd(self, sampleCount):
+		msg = bytearray([
+			CMD_HEADER,
+			CMD_STREAM_END,
+			*sampleCount.to_bytes(length=4, byteorder='little'),
+		])
+		self._send(msg)
+
 	def sendStop(self):
 		self.lastCombination = (0,0,0)
 		msg = bytearray([
@@ -0,0 +1,183 @@
+import sys
+import time
+import threading
+import statistics
+
+from PySide2 import QtCore
+
+'''
+Live CMD_COMBINED_SIGNAL streaming on a dedicated thread
+
+Ticks are scheduled against absolute deadlines on the monotonic clock (start + n*period),
+so late ticks don't push the following ones back. Each tick sends the signal value at the
+actual elapsed time rather than the scheduled one. When the thread falls more than a
+period behind, the deadlines it can no longer meet are counted as missed and skipped, not
+sent in a burst. The GUI only receives throttled state snapshots through a queued signal,
+so repaints and event backlog on the GUI thread don't hold up the stream.
+
+The GUI thread still competes for the GIL, so the interpreter's switch interval is
+lowered while a stream plays. With the default 5 ms, a busy GUI thread delays ticks by
+up to a whole period.
+
+With a lead time, the signal is instead sent as timestamped samples (CMD_STREAM_*), each
+about one lead time before it's due. The device plays them at a fixed latency from its
+jitter buffer, so tick lateness only matters once it exceeds the lead time.
+'''
+
+class StreamStats:
+	'''How late each tick of a playback was, relative to its deadline'''
+	def __init__(self, period):
+		self.period = period
+		self.latenesses = []
+		self.missedDeadlines = 0
+		self.sentCount = 0
+
+	def addTick(self, lateness):
+		self.latenesses.append(lateness)
+
+	def summary(self):
+		if len(self.latenesses) == 0:
+			return {'ticks': 0, 'missed': self.missedDeadlines, 'sent': self.sentCount}
+
+		latenessMS = sorted(lateness * 1000 for lateness in self.latenesses)
+		return {
+			'ticks': len(latenessMS),
+			'missed': self.missedDeadlines,
+			'sent': self.sentCount,
+			'mean_late_ms': round(statistics.mean(latenessMS), 3),
+			'p99_late_ms': round(latenessMS[int(.99 * (len(latenessMS)-1))], 3),
+			'max_late_ms': round(latenessMS[-1], 3),
+			'jitter_ms': round(statistics.pstdev(latenessMS), 3),
+		}
+
+	def __repr__(self):
+		return f'<{self.__class__.__name__}({self.summary()})>'
+
+class StreamSnapshot:
+	def __init__(self, elapsed, phone, pitch, intensity):
+		self.elapsed = elapsed
+		self.phone = phone
+		self.pitch = pitch
+		self.intensity = intensity
+
+class SignalStreamer(QtCore.QObject):
+	'''
+	Plays a SignalPlayer in real time
+
+	With a `comms` object (see vttHex.serial), each tick's value is sent as a combined
+	signal and a stop is sent at the end, or as timestamped samples if `leadTime` (in
+	seconds) is set. Without one, the streamer only drives the snapshots, e.g., to show a
+	sound bite that plays on the device.
+
+	`finished` carries the StreamStats of the run that ended. When start() replaces a
+	running stream, the old run's `finished` is only delivered after the new one has
+	started, so receivers can compare it with `stats` to ignore it.
+	'''
+	snapshot = QtCore.Signal(object)
+	finished = QtCore.Signal(object)
+
+	# sleep until this close to a deadline, then spin for the rest
+	spinSeconds = .0005
+	switchIntervalSeconds = .0005
+	# timestamped samples are sent in batches of at least this many
+	streamBatchSize = 8
+
+	def __init__(self, period=.005, snapshotInterval=1/30, leadTime=None, parent=None):
+		super().__init__(parent=parent)
+
+		self.period = period
+		self.snapshotInterval = snapshotInterval
+		self.leadTime = leadTime
+
+		self.thread = None
+		self.stopRequested = threading.Event()
+		self.stats = None
+
+	def start(self, signalPlayer, comms=None):
+		self.stop()
+
+		self.stopRequested.clear()
+		self.previousSwitchInterval = sys.getswitchinterval()
+		sys.setswitchinterval(self.switchIntervalSeconds)
+
+		self.stats = StreamStats(self.period)
+		self.thread = threading.Thread(target=self.run, args=(signalPlayer, comms), name='SignalStreamer', daemon=True)
+		self.thread.start()
+
+	def stop(self):
+		if self.thread is not None:
+			self.stopRequested.set()
+			self.thread.join()
+			self.thread = None
+
+	def isRunning(self):
+		return self.thread is not None and self.thread.is_alive()
+
+	def waitUntil(self, deadline):
+		remaining = deadline - time.perf_counter()
+		if remaining > self.spinSeconds:
+			if self.stopRequested.wait(remaining - self.spinSeconds):
+				return False
+
+		while time.perf_counter() < deadline:
+			pass
+
+		return not self.stopRequested.is_set()
+
+	def run(self, signalPlayer, comms):
+		try:
+			duration = signalPlayer.getDuration()
+
+			timestamped = comms is not None and self.leadTime is not None
+			if timestamped:
+				samples = signalPlayer.asByteMatrix(self.period)
+				leadSamples = int(self.leadTime / self.period)
+				comms.sendStreamStart(round(self.period * 1000), round(self.leadTime * 1000))
+
+			startTime = time.perf_counter()
+			tickIdx = 0
+			nextSnapshotTime = 0
+
+			while self.waitUntil(startTime + tickIdx * self.period):
+				now = time.perf_counter()
+				elapsed = now - startTime
+				self.stats.addTick(now - (startTime + tickIdx * self.period))
+
+				if elapsed >= duration:
+					break
+
+				(phone, pitch, intensity) = signalPlayer.valueAt(elapsed)
+				if timestamped:
+					dueCount = min(len(samples), tickIdx + leadSamples + 1)
+					if dueCount - self.stats.sentCount >= self.streamBatchSize or dueCount == len(samples):
+						self.sendStreamSamples(comms, samples, dueCount)
+
+				elif comms is not None:
+					comms.sendCombinedSignal(phone, pitch[0], intensity)
+					self.stats.sentCount += 1
+
+				if elapsed >= nextSnapshotTime:
+					self.snapshot.emit(StreamSnapshot(elapsed, phone, pitch, intensity))
+					nextSnapshotTime = elapsed + self.snapshotInterval
+
+				# skip deadlines that have already passed instead of sending them back to back
+				tickIdx += 1
+				dueIdx = int((time.perf_counter() - startTime) / self.period)
+				if dueIdx > tickIdx:
+					self.stats.missedDeadlines += dueIdx - tickIdx
+					tickIdx = dueIdx
+
+			if timestamped and not self.stopRequested.is_set():
+				self.sendStreamSamples(comms, samples, len(samples))
+				comms.sendStreamEnd(len(samples))
+			elif comms is not None:
+				comms.sendStop()
+		finally:
+			# also after an error, or the whole interpreter stays at the short switch interval
+			sys.setswitchinterval(self.previousSwitchInterval)
+			self.finished.emit(self.stats)
+
+	def sendStreamSamples(self, comms, samples, dueCount):
+		if dueCount > self.stats.sentCount:
+			comms.sendStreamSamples(self.stats.sentCount, samples[self.stats.sentCount:dueCount])
+			self.stats.sentCount = dueCount
@@ -3,6 +3,10 @@ import pkg_resources
 import math
 import pathlib
 
+import numpy as np
+
+from vttHex import features
+
 phoneLayout = ['B', 'D', 'G', 'HH', 'DH', None, 'P', 'T', 'K', 'TH', 'F', None, 'M', 'N', 'SH', 'S', 'V', 'W', 'Y', 'NG', 'CH', 'ZH', 'Z', 'L', 'R', 'ER', 'JH', 'AH', 'AO', 'AA', 'AW', 'UW', 'UH', 'OW', 'OY', 'AX', 'IY', 'EY', 'IH', 'EH', 'AE', 'AY', ]
 vowels = ['AA','AE','AH','AO','AW','AY','EH','ER','EY','IY','OW','OY']
 
@@ -29,86 +33,72 @@ def findAsset(*resourceParts):
 def findAssetPath(*resourceParts):
 	return pathlib.Path(findAsset(*resourceParts))
 
-class TimeData:
-	def __init__(self, t, data):
-		self.time = t
-		self.data = data
-
 class TimeSeries:
-	def __init__(self, data=None):
-		if data is None:
-			self.records = []
-		else:
-			self.records = data
+	'''
+	A signal that holds each value from its timestamp until the next one
+
+	Backed by a sorted array of timestamps and an array with the matching value in each row
+	'''
+	def __init__(self, times, values):
+		self.times = np.asarray(times, dtype=float)
+		self.values = np.asarray(values)
 
 		self.idx = 0
 		self.accumulatedTime = 0
 
-	def addData(self, timestamp, data):
-		self.records.append(TimeData(timestamp, data))
-
 	def update(self, delta):
-		self.accumulatedTime += delta
+		return self.seek(self.accumulatedTime + delta)
+
+	def seek(self, t):
+		'''Moves the playhead to time `t` (forwards or backwards) and returns the value there'''
+		self.accumulatedTime = t
+		self.idx = self.indexAt(t)
+
+		return self.values[self.idx]
+
+	def indexAt(self, t):
+		# the last value that starts at or before t, or the first value for times before it
+		return max(0, int(np.searchsorted(self.times, t, side='right')) - 1)
 
-		done = False
-		actions = []
+	def indicesAt(self, times):
+		return np.maximum(0, np.searchsorted(self.times, times, side='right') - 1)
 
-		while self.idx < len(self.records)-1 and self.accumulatedTime >= self.records[self.idx+1].time:
-			self.idx += 1
+	def valueAt(self, t):
+		return self.values[self.indexAt(t)]
 
-		return self.records[self.idx]
+	def valuesAt(self, times):
+		'''Values at each of an array of times, in one pass'''
+		return self.values[self.indicesAt(times)]
+
+	def getEndTime(self):
+		return self.times[-1] if len(self.times) > 0 else 0.0
 
 	def isDone(self):
-		return self.idx >= len(self.records)-1
+		return self.idx >= len(self.times)-1
 
 	def reset(self):
-		self.idx = 0
-		self.accumulatedTime = 0
+		self.seek(0)
 
 class SignalPlayer():
 	def open(self, filename, folder=None):
-		from praatio import tgio
-
+		'''Opens a stimulus' features, from its .vtf file if it has one (see vttHex.features)'''
 		if folder is None:
-			textGridFile = findAssetPath(f'MBOPP/audio/grids/{filename}.TextGrid')
-			pitchFile = findAssetPath(f'MBOPP/audio/{filename}.f0.csv')
-			loudnessFile = findAssetPath(f'MBOPP/audio/{filename}.loudness.csv')
-			wavFile = findAssetPath(f'MBOPP/audio/{filename}.wav')
-			if not wavFile.exists():
-				wavFile = findAssetPath(f'MBOPP/audio/{filename}.WAV')
-		else:
-			textGridFile = folder/'grids'/(filename + '.TextGrid')
-			pitchFile = folder/(filename + '.f0.csv')
-			loudnessFile = folder/(filename + '.loudness.csv')
-			wavFile = folder/(filename + '.wav')
-			if not wavFile.exists():
-				wavFile = folder/(filename + '.WAV')
-
-		textgrid = tgio.openTextgrid(textGridFile)
-
-		phonegrid = textgrid.tierDict['phones'].entryList
-		self.phoneSeries = TimeSeries()
-		for phoneRecord in phonegrid:
-			(start, stop, label) = phoneRecord
-			self.phoneSeries.addData(start, label)
-		self.phoneSeries.addData(stop, None)
-
-		self.pitchSeries = TimeSeries()
-		with open(pitchFile) as csvFile:
-			for line in csvFile.readlines():
-				(timestamp, pitch, confidence) = [float(x) for x in line.split('   ')]
-				self.pitchSeries.addData(timestamp, (pitch, confidence))
-
-		self.intensitySeries = TimeSeries()
-		if loudnessFile.exists():
-			with open(loudnessFile) as csvFile:
-				for idx,line in enumerate(csvFile.readlines()):
-					if idx == 0:
-						continue
-					(timestamp, loudness) = [float(x) for x in line.split(',')]
-					self.intensitySeries.addData(timestamp, loudness)
+			folder = findAssetPath('MBOPP/audio')
+
+		self.openFeatures(features.openFeatures(folder, filename))
+
+	def openFeatures(self, stimulusFeatures):
+		phones = np.array(list(stimulusFeatures.phoneLabels) + [None], dtype=object)
+		self.phoneSeries = TimeSeries(stimulusFeatures.phoneTimes, phones)
+
+		pitch = stimulusFeatures.pitch
+		self.pitchSeries = TimeSeries(pitch[:,0], pitch[:,1:3])
+
+		loudness = stimulusFeatures.loudness
+		if loudness is not None:
+			self.intensitySeries = TimeSeries(loudness[:,0], loudness[:,1])
 		else:
-			self.intensitySeries.addData(0, 255)
+			self.intensitySeries = TimeSeries([0], [255])
 
 	def reset(self):
 		self.phoneSeries.reset()
@@ -116,12 +106,30 @@ class SignalPlayer():
 		self.intensitySeries.reset()
 
 	def update(self, delta):
-		phone = self.phoneSeries.update(delta).data
-		pitch = self.pitchSeries.update(delta).data
-		intensity = self.intensitySeries.update(delta).data
+		phone = self.phoneSeries.update(delta)
+		pitch = self.pitchSeries.update(delta)
+		intensity = self.intensitySeries.update(delta)
 
 		return [phone, pitch, intensity]
 
+	def getAllSeries(self):
+		return [self.phoneSeries, self.pitchSeries, self.intensitySeries]
+
+	def seek(self, t):
+		'''Moves every series to time `t`, e.g., to scrub or loop part of a stimulus'''
+		return [series.seek(t) for series in self.getAllSeries()]
+
+	def valueAt(self, t):
+		return [series.valueAt(t) for series in self.getAllSeries()]
+
+	def valuesAt(self, times):
+		'''(phones, pitches, intensities) arrays with the values at each of `times`'''
+		return [series.valuesAt(times) for series in self.getAllSeries()]
+
+	def getDuration(self):
+		# asSequence stops once any of the series has reached its last record
+		return min(series.getEndTime() if len(series.times) > 1 else 0.0 for series in self.getAllSeries())
+
 	def isDone(self):
 		return self.phoneSeries.isDone() and self.pitchSeries.isDone() and self.intensitySeries.isDone()
 
@@ -130,19 +138,155 @@ class SignalPlayer():
 		while not (self.phoneSeries.isDone() or self.pitchSeries.isDone() or self.intensitySeries.isDone()):
 			yield self.update(period)
 
-def formatSignalAsBytes(phoneOrCellID, pitch, intensity):
+	def asByteMatrix(self, period):
+		'''
+		Resamples the whole signal in one pass.
+
+		Produces the same samples as formatting each step of asSequence(period)
+		with formatSignalAsBytes, as an (N, 3) uint8 array of phone, pitch, intensity
+		'''
+		endTime = self.getDuration()
+
+		# accumulate the same way TimeSeries.update does so the timestamps match exactly
+		stepCount = max(0, int(endTime/period)) + 2
+		sampleTimes = np.cumsum(np.full(stepCount, period, dtype=float))
+		sampleTimes = np.concatenate(([0.0], sampleTimes))
+		sampleCount = int(np.searchsorted(sampleTimes, endTime, side='left')) + 1
+		sampleTimes = sampleTimes[:sampleCount]
+
+		indices = [series.indicesAt(sampleTimes) for series in self.getAllSeries()]
+
+		phones = np.array([phoneToCellID(phone) for phone in self.phoneSeries.values], dtype=np.uint8)
+		pitches = self.pitchSeries.values
+		if pitches.ndim > 1:
+			pitches = pitches[:,0]
+
+		samples = np.empty((sampleCount, 3), dtype=np.uint8)
+		samples[:,0] = phones[indices[0]]
+		samples[:,1] = formatPitchesAsBytes(pitches.astype(float))[indices[1]]
+		samples[:,2] = formatIntensitiesAsBytes(self.intensitySeries.values.astype(float))[indices[2]]
+
+		return samples
+
+def phoneToCellID(phoneOrCellID):
 	if isinstance(phoneOrCellID, str):
 		phoneOrCellID = phoneOrCellID[:2]
 		if phoneOrCellID in phoneIndexLookup:
-			cellID = phoneIndexLookup[phoneOrCellID[:2]]
+			return phoneIndexLookup[phoneOrCellID[:2]]
 		else:
-			cellID = 255
+			return 255
 	elif phoneOrCellID is None:
-		cellID = 255
+		return 255
 	else:
-		cellID = phoneOrCellID
+		return phoneOrCellID
+
+def formatPitchesAsBytes(pitches):
+	# vectorized equivalent of the pitch conversion in formatSignalAsBytes
+	pitches = np.clip(pitches, pitchMinHz, pitchMaxHz)
+	pitches = 1127 * np.log(1+(pitches/700))
+	pitches = (pitches-pitchMinMel)/(pitchMaxMel-pitchMinMel)
+	pitches = (pitches*255).astype(int)
+
+	return np.clip(pitches, 0, 255).astype(np.uint8)
+
+def formatIntensitiesAsBytes(intensities):
+	# vectorized equivalent of the intensity conversion in formatSignalAsBytes
+	intensities = (255.*np.minimum(50., intensities)/50.).astype(int)
+
+	return intensities.astype(np.uint8)
+
+def formatSignalsAsBytes(samples):
+	'''
+	Vectorized formatSignalAsBytes over a sequence of (phone, pitch, intensity) samples
+
+	Returns an (N, 3) uint8 array
+	'''
+	samples = list(samples)
+	if len(samples) == 0:
+		return np.empty((0, 3), dtype=np.uint8)
+
+	(phones, pitches, intensities) = zip(*samples)
+
+	cellIDs = {phone: phoneToCellID(phone) for phone in set(phones)}
+	pitches = [pitch[0] if np.ndim(pitch) > 0 else pitch for pitch in pitches]
+
+	formatted = np.empty((len(samples), 3), dtype=np.uint8)
+	formatted[:,0] = [cellIDs[phone] for phone in phones]
+	formatted[:,1] = formatPitchesAsBytes(np.array(pitches, dtype=float))
+	formatted[:,2] = formatIntensitiesAsBytes(np.array(intensities, dtype=float))
+
+	return formatted
+
+'''
+Run-length sound bite encoding (CMD_SOUNDBITE_RLE)
+
+Each run of identical samples is written as a control byte followed by the fields that
+differ from the previous run, in (phone, pitch, intensity) order. The "previous" sample
+before the first run is (255, 0, 0), matching lastSample in the firmware's playBite.
+	Control byte
+		bits 7:5  changed-field mask (phone = 0b100, pitch = 0b010, intensity = 0b001)
+		bits 4:0  run length - 1
+Runs longer than 32 samples continue with extra control bytes that have an empty mask.
+'''
+maxRunLength = 32
+initialRunSample = (255, 0, 0)
+
+def encodeSampleRuns(samples):
+	samples = np.asarray(samples, dtype=np.uint8).reshape(-1, 3)
+	if len(samples) == 0:
+		return b''
+
+	changes = np.flatnonzero(np.any(samples[1:] != samples[:-1], axis=1)) + 1
+	starts = np.concatenate(([0], changes))
+	lengths = np.diff(np.append(starts, len(samples)))
+
+	values = samples[starts]
+	previous = np.vstack(([initialRunSample], values[:-1]))
+	changed = values != previous
+	changedCounts = changed.sum(axis=1)
+	chunkCounts = (lengths + maxRunLength - 1) // maxRunLength
+
+	# each run is [control, changed fields..., continuation controls...]
+	runSizes = 1 + changedCounts + (chunkCounts - 1)
+	offsets = np.concatenate(([0], np.cumsum(runSizes)[:-1]))
+	encoded = np.empty(runSizes.sum(), dtype=np.uint8)
+
+	masks = changed[:,0]*4 + changed[:,1]*2 + changed[:,2]
+	encoded[offsets] = (masks << 5) | (np.minimum(lengths, maxRunLength) - 1)
+
+	fieldPositions = offsets[:,None] + np.cumsum(changed, axis=1)
+	encoded[fieldPositions[changed]] = values[changed]
+
+	continuedRuns = np.flatnonzero(chunkCounts > 1)
+	if len(continuedRuns) > 0:
+		runIdx = np.repeat(continuedRuns, chunkCounts[continuedRuns] - 1)
+		chunkIdx = np.concatenate([np.arange(1, count) for count in chunkCounts[continuedRuns]])
+		positions = offsets[runIdx] + changedCounts[runIdx] + chunkIdx
+		encoded[positions] = np.minimum(lengths[runIdx] - chunkIdx*maxRunLength, maxRunLength) - 1
+
+	return encoded.tobytes()
+
+def decodeSampleRuns(encoded):
+	samples = []
+	sample = list(initialRunSample)
+	idx = 0
+	while idx < len(encoded):
+		control = encoded[idx]
+		idx += 1
+
+		for field in range(3):
+			if control & (0x80 >> field):
+				sample[field] = encoded[idx]
+				idx += 1
+
+		samples += [tuple(sample)] * ((control & 0x1F) + 1)
+
+	return samples
+
+def formatSignalAsBytes(phoneOrCellID, pitch, intensity):
+	cellID = phoneToCellID(phoneOrCellID)
 
-	if isinstance(pitch, tuple):
+	if np.ndim(pitch) > 0:
 		pitch = pitch[0]
 
 	# clamp pitch to 30-260 Hz